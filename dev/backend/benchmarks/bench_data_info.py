@@ -0,0 +1,160 @@
+"""get_data_info（/get_data_info）の処理時間を以前の実装と比べるベンチマーク
+
+カラムごとにpandasの集計を十数回呼び出していた以前の実装と、
+量的変数のカラムをまとめて集計する現在の実装の処理時間を、横に長いデータで比べる。
+
+使い方（dev/backendで実行する）:
+    python -m benchmarks.bench_data_info
+    python -m benchmarks.bench_data_info --shapes 20000x500 100000x200 --repeat 3
+"""
+
+import argparse
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+from pandas import DataFrame
+
+from data_utils import convert_to_serializable, entropy, format_value, get_data_info
+
+
+def previous_data_info(df: DataFrame) -> Dict[str, List]:
+    """以前のget_data_info（カラムごとに統計量を1つずつ計算する）"""
+
+    qualitative_list = []
+    quantitative_list = []
+
+    for col in df.columns:
+        common_info = {
+            "データ型": str(df[col].dtype),
+            "ユニークな値の数": convert_to_serializable(df[col].nunique()),
+            "欠損値の数": convert_to_serializable(df[col].isnull().sum()),
+            "欠損値の割合": format_value(
+                convert_to_serializable(df[col].isnull().sum() / len(df))
+            ),
+        }
+
+        if df[col].dtype == "int64" or df[col].dtype == "float64":
+            quantitative_info = {
+                "平均値": format_value(convert_to_serializable(df[col].mean())),
+                "中央値": format_value(convert_to_serializable(df[col].median())),
+                "標準偏差": format_value(convert_to_serializable(df[col].std())),
+                "最小値": format_value(convert_to_serializable(df[col].min())),
+                "最大値": format_value(convert_to_serializable(df[col].max())),
+                "第1四分位数": format_value(
+                    convert_to_serializable(df[col].quantile(0.25))
+                ),
+                "第3四分位数": format_value(
+                    convert_to_serializable(df[col].quantile(0.75))
+                ),
+                "歪度": format_value(convert_to_serializable(df[col].skew())),
+                "尖度": format_value(convert_to_serializable(df[col].kurtosis())),
+                "変動係数": format_value(
+                    convert_to_serializable(
+                        df[col].std() / df[col].mean()
+                        if df[col].mean() != 0
+                        else np.nan
+                    )
+                ),
+            }
+            quantitative_list.append(
+                {"column_name": col, "common": common_info, "data": quantitative_info}
+            )
+        else:
+            qualitative_info = {
+                "最頻値": convert_to_serializable(
+                    df[col].mode().iloc[0] if not df[col].mode().empty else np.nan
+                ),
+                "最頻値の出現回数": convert_to_serializable(
+                    df[col].value_counts().iloc[0]
+                    if not df[col].value_counts().empty
+                    else np.nan
+                ),
+                "最頻値の割合": format_value(
+                    convert_to_serializable(
+                        df[col].value_counts().iloc[0] / len(df)
+                        if not df[col].value_counts().empty
+                        else np.nan
+                    )
+                ),
+                "カテゴリ数": convert_to_serializable(df[col].nunique()),
+                "エントロピー": format_value(convert_to_serializable(entropy(df[col]))),
+            }
+            qualitative_list.append(
+                {"column_name": col, "common": common_info, "data": qualitative_info}
+            )
+
+    return {"qualitative": qualitative_list, "quantitative": quantitative_list}
+
+
+def make_data(n_rows: int, n_columns: int, text_ratio: float, seed: int) -> DataFrame:
+    """量的変数（整数・小数、5%が欠損値）と質的変数が混ざったデータを作成する関数
+
+    Args:
+        n_rows (int): 行数
+        n_columns (int): カラム数
+        text_ratio (float): 質的変数のカラムの割合
+        seed (int): 乱数のシード
+
+    Returns:
+        DataFrame: データフレーム
+    """
+
+    rng = np.random.default_rng(seed)
+    n_text = int(n_columns * text_ratio)
+    n_int = (n_columns - n_text) // 2
+    n_float = n_columns - n_text - n_int
+
+    columns = {}
+    for i in range(n_int):
+        columns[f"int{i}"] = rng.integers(0, 1000, n_rows)
+    for i in range(n_float):
+        values = rng.normal(size=n_rows).round(3)
+        values[rng.random(n_rows) < 0.05] = np.nan
+        columns[f"float{i}"] = values
+    labels = np.array([f"label{i}" for i in range(20)], dtype=object)
+    for i in range(n_text):
+        columns[f"text{i}"] = labels[rng.integers(0, len(labels), n_rows)]
+    return DataFrame(columns)
+
+
+def measure(func: Callable[[DataFrame], Dict[str, List]], df: DataFrame, repeat: int):
+    """最も速かった回の処理時間（秒）を求める関数"""
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(df)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--shapes",
+        nargs="+",
+        default=["1000x500", "20000x500", "100000x200"],
+        help="行数xカラム数（複数指定可）",
+    )
+    parser.add_argument(
+        "--text-ratio", type=float, default=0.0, help="質的変数のカラムの割合"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="計測する回数")
+    parser.add_argument("--seed", type=int, default=0, help="乱数のシード")
+    args = parser.parse_args()
+
+    print(f"{'shape':>12} {'previous':>10} {'current':>10} {'speedup':>8}")
+    for shape in args.shapes:
+        n_rows, n_columns = (int(value) for value in shape.split("x"))
+        df = make_data(n_rows, n_columns, args.text_ratio, args.seed)
+        previous = measure(previous_data_info, df, args.repeat)
+        current = measure(get_data_info, df, args.repeat)
+        print(
+            f"{shape:>12} {previous:>9.3f}s {current:>9.3f}s"
+            f" {previous / current:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""特徴量の重要度の学習（/feature_value_analysis）の処理時間を以前の実装と比べるベンチマーク
+
+すべての行で既定のランダムフォレスト（1コア、100本、深さ無制限）を学習していた以前の実装と、
+行数・コア数・木の本数・時間の上限を設定して学習する現在の実装（train_model）で、
+処理時間・評価用データのスコア・重要度の順位を比べる。
+
+現在の実装の設定はfeature_importanceの環境変数（ANALYSIS_MAX_ROWS, ANALYSIS_N_JOBS,
+ANALYSIS_TIME_BUDGETなど）で変更できる。以前の実装は100万行で数分かかる。
+
+使い方（dev/backendで実行する）:
+    python -m benchmarks.bench_feature_importance
+    python -m benchmarks.bench_feature_importance --rows 200000 --tasks regression
+    ANALYSIS_TIME_BUDGET=0 python -m benchmarks.bench_feature_importance --rows 300000
+"""
+
+import argparse
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from pandas import DataFrame, Series
+from scipy.stats import spearmanr
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.model_selection import train_test_split
+
+from feature_importance import train_model
+
+
+def previous_training(
+    X: DataFrame, y: Series, classification: bool, test_size: float, random_state: int
+) -> Tuple[float, np.ndarray, Dict[str, Any]]:
+    """以前のevaluate_classification_model/evaluate_regression_modelの学習部分
+
+    Returns:
+        Tuple[float, np.ndarray, Dict[str, Any]]: 評価用データのスコア、各カラムの重要度、学習の情報
+    """
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=test_size, random_state=random_state
+    )
+    model_class = RandomForestClassifier if classification else RandomForestRegressor
+    model = model_class(random_state=random_state)
+    model.fit(X_train, y_train)
+    training = {"rows": len(X), "n_estimators": len(model.estimators_)}
+    return model.score(X_test, y_test), model.feature_importances_, training
+
+
+def current_training(
+    X: DataFrame, y: Series, classification: bool, test_size: float, random_state: int
+) -> Tuple[float, np.ndarray, Dict[str, Any]]:
+    """現在の学習（設定した上限の範囲で学習する）
+
+    Returns:
+        Tuple[float, np.ndarray, Dict[str, Any]]: 評価用データのスコア、各カラムの重要度、学習の情報
+    """
+
+    model, importances, X_test, y_test, training = train_model(
+        X, y, classification, test_size, random_state
+    )
+    return model.score(X_test, y_test), importances, training
+
+
+def make_data(n_rows: int, classification: bool, seed: int) -> Tuple[DataFrame, Series]:
+    """重要度の順位が決まっている説明変数と目的変数を作成する関数
+
+    x0からx4の順に目的変数への影響が小さくなり、catは値が2の場合のみ影響する。
+    x5からx7とnoiseは目的変数に関係しない。
+
+    Args:
+        n_rows (int): 行数
+        classification (bool): 分類（Yes/No）の場合True、回帰の場合False
+        seed (int): 乱数のシード
+
+    Returns:
+        Tuple[DataFrame, Series]: 説明変数（float32）と目的変数
+    """
+
+    rng = np.random.default_rng(seed)
+    X = DataFrame(
+        {f"x{i}": rng.normal(size=n_rows).astype(np.float32) for i in range(8)}
+    )
+    X["cat"] = rng.integers(0, 5, n_rows).astype(np.float32)
+    X["noise"] = rng.random(n_rows, dtype=np.float32)
+
+    signal = (
+        1.5 * X["x0"]
+        - 1.0 * X["x1"]
+        + 0.7 * X["x2"]
+        + 0.4 * X["x3"]
+        + 0.2 * X["x4"]
+        + 0.3 * (X["cat"] == 2)
+    )
+    if classification:
+        positive = rng.random(n_rows) < 1 / (1 + np.exp(-signal))
+        y = Series(np.where(positive, "Yes", "No"))
+    else:
+        y = signal + rng.normal(scale=0.5, size=n_rows)
+    return X, y
+
+
+def ranking(columns: List[str], importances: np.ndarray) -> List[str]:
+    """重要度の大きい順にカラム名を並べる関数"""
+
+    return [columns[i] for i in np.argsort(-importances, kind="stable")]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000, help="行数")
+    parser.add_argument(
+        "--tasks",
+        nargs="+",
+        choices=["classification", "regression"],
+        default=["classification", "regression"],
+        help="比べる問題の種類（複数指定可）",
+    )
+    parser.add_argument("--top", type=int, default=5, help="順位を比べる上位のカラム数")
+    parser.add_argument("--seed", type=int, default=0, help="乱数のシード")
+    args = parser.parse_args()
+
+    for task in args.tasks:
+        classification = task == "classification"
+        X, y = make_data(args.rows, classification, args.seed)
+        columns = list(X.columns)
+
+        importances_by_name: Dict[str, np.ndarray] = {}
+        timings: Dict[str, float] = {}
+        for name, train in [
+            ("previous", previous_training),
+            ("current", current_training),
+        ]:
+            started = time.perf_counter()
+            score, importances, training = train(X, y, classification, 0.2, 42)
+            timings[name] = time.perf_counter() - started
+            importances_by_name[name] = importances
+            print(
+                f"{task:>14} {name:>8} {timings[name]:>8.1f}s score={score:.4f}"
+                f" top{args.top}={ranking(columns, importances)[: args.top]}"
+                f" {training}",
+                flush=True,
+            )
+
+        previous, current = (
+            importances_by_name["previous"],
+            importances_by_name["current"],
+        )
+        correlation = spearmanr(previous, current)[0]
+        same_top = (
+            ranking(columns, previous)[: args.top]
+            == ranking(columns, current)[: args.top]
+        )
+        print(
+            f"{task:>14} speedup={timings['previous'] / timings['current']:.1f}x"
+            f" spearman={correlation:.3f} same_top{args.top}={same_top}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import os
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame, Series
+
+# ユニークな値の数が行数のこの割合以下のobject型のカラムはcategory型に変換する（環境変数で変更可能）
+CATEGORY_MAX_RATIO = float(os.getenv("CATEGORY_MAX_RATIO", "0.5"))
+
+# category型に変換するか先に調べる行数（この行数で既にユニークな値が多い場合は全体を調べない）
+CATEGORY_SAMPLE_SIZE = 10000
+
+# 量的変数として扱う型名（欠損値を含む整数のカラムはInt64になる）
+NUMERIC_DTYPES = ("int64", "float64", "Int64")
+
+# 文字列として扱う型名
+STRING_DTYPES = ("object", "category", "string")
+
+
+def to_strings(series: Series) -> Series:
+    """カラムを文字列（欠損値はNaNのまま）のobject型に変換する関数
+
+    object型のカラムはCSVから読み込んだ時点で文字列と欠損値のみなので変換しない。
+    それ以外のカラムは値を文字列に変換し、欠損値の行はNaNに戻す。
+
+    Args:
+        series (Series): カラム
+
+    Returns:
+        Series: object型のカラム
+    """
+
+    if pd.api.types.is_object_dtype(series.dtype):
+        return series
+    return series.astype(str).where(series.notna())
+
+
+def to_category(series: Series, max_ratio: float) -> Series:
+    """ユニークな値が少ない場合にカラムをcategory型に変換する関数
+
+    先頭のCATEGORY_SAMPLE_SIZE行でユニークな値が多い場合（IDや自由記述など）は変換しない。
+    それ以外はハッシュ化を1回だけ行い、その結果（コードとユニークな値）からcategory型を作成する。
+    カテゴリは最初に現れた順に並べる（グラフの値の並び順をobject型の場合と揃えるため）。
+
+    Args:
+        series (Series): 文字列のカラム
+        max_ratio (float): category型に変換するユニークな値の数の割合の上限
+
+    Returns:
+        Series: category型のカラム（ユニークな値が多い場合は元のカラム）
+    """
+
+    sample = series.iloc[:CATEGORY_SAMPLE_SIZE]
+    if sample.nunique() > len(sample) * max_ratio:
+        return series
+
+    codes, uniques = pd.factorize(series)
+    if len(uniques) > len(series) * max_ratio:
+        return series
+
+    return pd.Series(
+        pd.Categorical.from_codes(codes, categories=uniques),
+        index=series.index,
+        name=series.name,
+    )
+
+
+def convert_column(series: Series, dtype: str, max_ratio: float) -> Series:
+    """保存されている型名に合わせて1つのカラムを変換する関数
+
+    Args:
+        series (Series): CSVから読み込んだカラム
+        dtype (str): 保存されている型名（get_dtypesの結果）
+        max_ratio (float): object型のカラムをcategory型に変換する割合の上限
+
+    Returns:
+        Series: 変換後のカラム
+    """
+
+    if dtype in STRING_DTYPES:
+        values = to_strings(series)
+        if dtype == "category" or (dtype == "object" and max_ratio > 0):
+            return to_category(values, 1.0 if dtype == "category" else max_ratio)
+        if dtype == "string":
+            return values.astype("string")
+        return values
+
+    if dtype in ("int64", "Int64"):
+        if series.dtype == "int64":
+            return series
+        # 欠損値を含む整数のカラムは欠損値を扱えるInt64型にする
+        return series.astype("Int64" if series.isna().any() else "int64")
+
+    if dtype == "boolean":
+        return series.astype("boolean")
+
+    return series
+
+
+def apply_dtypes(
+    df: DataFrame, dtypes: Dict[str, str], max_ratio: float = CATEGORY_MAX_RATIO
+) -> DataFrame:
+    """各カラムの型を一度にまとめて適応する関数
+
+    カラムごとに代入するとその都度データフレームの内部構造が作り直されるため、
+    変換したカラムからデータフレームを1回で作成する。
+
+    Args:
+        df (DataFrame): CSVから読み込んだデータフレーム
+        dtypes (Dict[str, str]): 各カラムの型情報（dfに無いカラムは無視する）
+        max_ratio (float): object型のカラムをcategory型に変換する割合の上限
+            （0の場合は変換しない）
+
+    Returns:
+        DataFrame: 型適応後のデータフレーム
+    """
+
+    converted = {
+        col: convert_column(df[col], dtypes[col], max_ratio)
+        if col in dtypes
+        else df[col]
+        for col in df.columns
+    }
+    return DataFrame(converted, index=df.index)
+
+
+def downcast_dtypes(df: DataFrame, max_ratio: float = CATEGORY_MAX_RATIO) -> DataFrame:
+    """ユニークな値が少ないobject型のカラムをcategory型に変換する関数
+
+    Args:
+        df (DataFrame): データフレーム
+        max_ratio (float): category型に変換するユニークな値の数の割合の上限
+
+    Returns:
+        DataFrame: 変換後のデータフレーム（変換するカラムが無い場合は元のデータフレーム）
+    """
+
+    dtypes = {
+        col: "object" for col, dtype in df.dtypes.items() if dtype == np.dtype(object)
+    }
+    if not dtypes or max_ratio <= 0:
+        return df
+    return apply_dtypes(df, dtypes, max_ratio)
+
+
+def to_numpy_backed(series: Series) -> Series:
+    """category型・Int64型のカラムを従来の型（object型・float64型）に戻す関数
+
+    計算式の評価など、値ごとの演算を行う場合に使う
+
+    Args:
+        series (Series): カラム
+
+    Returns:
+        Series: 変換後のカラム
+    """
+
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.astype(object)
+    if series.dtype == "Int64":
+        return series.astype("float64")
+    return series
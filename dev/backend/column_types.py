@@ -0,0 +1,76 @@
+from typing import Dict, List
+
+import pandas as pd
+from pandas import DataFrame, Series
+
+# object型のカラムで最初に型を調べる行数
+SAMPLE_SIZE = 1000
+
+# 数値とみなすinfer_dtypeの結果（Pythonのboolはintのサブクラスなので数値とみなす）
+NUMERIC_INFERRED_TYPES = {
+    "integer",
+    "floating",
+    "mixed-integer-float",
+    "boolean",
+    "empty",
+}
+
+
+def is_quantitative(series: Series) -> bool:
+    """カラムが量的変数かどうかを型情報から判定する関数
+
+    数値型・bool型のカラムは型情報だけで判定する。object型のカラムは先頭の
+    SAMPLE_SIZE行で判定し、数値に見える場合のみカラム全体を確認する。
+
+    Args:
+        series (Series): 判定するカラム
+
+    Returns:
+        bool: 量的変数の場合はTrue
+    """
+
+    dtype = series.dtype
+
+    if isinstance(dtype, pd.CategoricalDtype):
+        return pd.api.types.is_numeric_dtype(dtype.categories.dtype)
+
+    if pd.api.types.is_bool_dtype(dtype):
+        return True
+
+    if pd.api.types.is_numeric_dtype(dtype):
+        # 複素数は量的変数として扱わない
+        return not pd.api.types.is_complex_dtype(dtype)
+
+    if not pd.api.types.is_object_dtype(dtype):
+        # 日付型や文字列型など
+        return False
+
+    # object型：まずは一部の行で判定し、数値に見える場合のみ全体を確認
+    values = series.to_numpy()
+    if len(values) > SAMPLE_SIZE:
+        sample_type = pd.api.types.infer_dtype(values[:SAMPLE_SIZE], skipna=False)
+        if sample_type not in NUMERIC_INFERRED_TYPES:
+            return False
+
+    return pd.api.types.infer_dtype(values, skipna=False) in NUMERIC_INFERRED_TYPES
+
+
+def infer_column_types(df: DataFrame) -> Dict[str, List[str]]:
+    """量的変数と質的変数のカラムを1回の走査で分類する関数
+
+    Args:
+        df (DataFrame): データフレーム
+
+    Returns:
+        Dict[str, List[str]]: quantitativeとqualitativeがkeyでvalueがそれぞれのカラム名のリスト
+    """
+
+    quantitative = []
+    qualitative = []
+    for i, col in enumerate(df.columns):
+        if is_quantitative(df.iloc[:, i]):
+            quantitative.append(col)
+        else:
+            qualitative.append(col)
+
+    return {"quantitative": quantitative, "qualitative": qualitative}
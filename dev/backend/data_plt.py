@@ -1,22 +1,27 @@
 # import
-import base64
-
 # import chardet
 import codecs
 import glob
-import io
 import json
 import os
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
 import matplotlib
-import matplotlib.pyplot as plt
 import pandas as pd
 import seaborn as sns
+from column_types import infer_column_types
+from downsampling import (
+    CHART_FIT_SAMPLE,
+    CHART_MAX_POINTS,
+    bin_counts,
+    sample_rows,
+    stratified_sample,
+)
 from pandas import DataFrame
+from rendering import create_figure, figure_to_image
 
 # メイリオフォントの設定
-plt.rcParams["font.family"] = "Noto Sans CJK JP"
+matplotlib.rcParams["font.family"] = "Noto Sans CJK JP"
 
 matplotlib.use("Agg")
 
@@ -94,16 +99,7 @@ def read_quantitative(df: DataFrame) -> List[str]:
 
     """
 
-    quantitative_variables = []
-    columns = df.columns.values
-    # apply関数で自作関数を適用
-    is_numeric_col = df.apply(is_numeric)
-    for i in range(len(is_numeric_col)):
-        is_num = is_numeric_col.iloc[i]
-        if is_num:  # データが数値の時
-            quantitative_variables.append(columns[i])
-
-    return quantitative_variables
+    return infer_column_types(df)["quantitative"]
 
 
 def read_qualitative(df: DataFrame) -> List[str]:
@@ -122,19 +118,7 @@ def read_qualitative(df: DataFrame) -> List[str]:
 
     """
 
-    # passes = read_folder()
-    qualitative_variables = []
-    # encoding = check_encoding(passes[0])
-    # df = get_df()
-    columns = df.columns.values
-    # apply関数で自作関数を適用
-    is_numeric_col = df.apply(is_numeric)
-    for i in range(len(is_numeric_col)):
-        is_num = is_numeric_col.iloc[i]
-        if not is_num:
-            qualitative_variables.append(columns[i])
-
-    return qualitative_variables
+    return infer_column_types(df)["qualitative"]
 
 
 # uploads内のフォルダを読み込み
@@ -164,36 +148,54 @@ def check_encoding(filepath):
     return None
 
 
-# df内の各カラムのデータが数字かどうか
-def is_numeric(column):
-    return all(isinstance(x, (int, float)) for x in column)
+def to_bool(value: Any) -> bool:
+    """クエリ文字列（"0", "false"など）も含めて真偽値に変換する関数
+
+    Args:
+        value (Any): 変換する値
+
+    Returns:
+        bool: 変換した真偽値
+    """
+
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
 
 
-def plot_scatter(jsons: Dict[str, Any], df: DataFrame) -> str:
+def plot_scatter(
+    jsons: Dict[str, Any], df: DataFrame, fmt: str = "png"
+) -> Tuple[bytes, Dict[str, Any]]:
     """
     説明
     ----------
-    散布図をプロットし文字列にエンコーディングする関数
+    散布図をプロットし画像データに変換する関数
+
+    行数がCHART_MAX_POINTSを超える場合、targetが無ければ六角形ビンの密度図、
+    targetがあればtargetの値ごとの層化抽出で描画する。
+    回帰直線はCHART_FIT_SAMPLE行以下の抽出データで計算する。
 
     Request
     ----------
     Dict[str, Any]
+    fmt : str
+        画像形式（png, webp, svg）
 
     Response
     ----------
-    plot_url : str
-        画像データをBase64エンコードされたバイト列をUTF-8でエンコーディングした文字列
+    image : bytes
+        画像データ
+    render_info : Dict[str, Any]
+        描画方法（mode）と描画に使った行数（points）、描画した点やビンの数（rendered_points）
 
     """
 
-    plt.clf()
-    plt.figure(figsize=(10, 9))
     variable1 = ""
     variable2 = ""
     target_variable = None
     fit_reg = 0
     order = 1
-    list_columns = {
+    list_columns: Dict[str, Any] = {
         "variable1": variable1,
         "variable2": variable2,
         "target": target_variable,
@@ -207,53 +209,122 @@ def plot_scatter(jsons: Dict[str, Any], df: DataFrame) -> str:
     # df = get_df()
     print(list_columns)
 
-    if list_columns["target"] == "None":
-        sns_plot = sns.regplot(
-            x=list_columns["variable1"],
-            y=list_columns["variable2"],
-            data=df,
-            fit_reg=list_columns["fit_reg"],
-        )
-    else:
-        sns_plot = sns.lmplot(
-            x=list_columns["variable1"],
-            y=list_columns["variable2"],
-            hue=list_columns["target"],
-            data=df,
-            fit_reg=list_columns["fit_reg"],
-            order=int(list_columns["order"]),
-        )
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    plot_url = base64.b64encode(buf.getvalue()).decode()
-
-    return plot_url
-
-
-def plot_hist(jsons: Dict[str, Any], df: DataFrame) -> str:
+    # リクエストのパラメータは描画方法を選ぶ前に型を決めておく
+    x: str = list_columns["variable1"]
+    y: str = list_columns["variable2"]
+    target: Optional[str] = (
+        None if list_columns["target"] in (None, "None") else list_columns["target"]
+    )
+    fit_reg = to_bool(list_columns["fit_reg"])
+    order = int(list_columns["order"])
+    aggregate = len(df) > CHART_MAX_POINTS
+    render_info: Dict[str, Any] = {
+        "mode": "full",
+        "points": len(df),
+        "rendered_points": len(df),
+    }
+
+    with create_figure(figsize=(10, 9)) as fig:
+        ax = fig.subplots()
+
+        if target is None and aggregate:
+            # 点が多すぎる場合は六角形ビンで密度を描画
+            data = df[[x, y]].dropna()
+            hexbin = ax.hexbin(data[x], data[y], gridsize=60, mincnt=1, cmap="Blues")
+            counts = hexbin.get_array()
+            fig.colorbar(hexbin, ax=ax, label="count")
+            ax.set_xlabel(x)
+            ax.set_ylabel(y)
+            render_info = {
+                "mode": "hexbin",
+                "points": len(data),
+                "rendered_points": 0 if counts is None else len(counts),
+            }
+            if fit_reg:
+                fit_data = sample_rows(data, CHART_FIT_SAMPLE)
+                sns.regplot(x=x, y=y, data=fit_data, scatter=False, color="C1", ax=ax)
+                render_info["fit_points"] = len(fit_data)
+        elif target is None:
+            sns.regplot(x=x, y=y, data=df, fit_reg=fit_reg, ax=ax)
+        else:
+            # lmplotはpyplotの図を作成するため、ターゲットの値ごとにregplotで描画する
+            levels = df[target].dropna().unique()
+            if pd.api.types.is_numeric_dtype(df[target]):
+                levels = sorted(levels)
+
+            data = df
+            if aggregate:
+                # 点が多すぎる場合はターゲットの値ごとの割合を保って抽出
+                data = stratified_sample(df, target, CHART_MAX_POINTS)
+                render_info = {
+                    "mode": "sample",
+                    "points": int(df[target].notna().sum()),
+                    "rendered_points": len(data),
+                }
+                if fit_reg:
+                    render_info["fit_points"] = 0
+
+            colors = sns.color_palette(n_colors=len(levels))
+            for level, color in zip(levels, colors):
+                level_data = data[data[target] == level]
+                sns.regplot(
+                    x=x,
+                    y=y,
+                    data=level_data,
+                    fit_reg=fit_reg and not aggregate,
+                    order=order,
+                    color=color,
+                    label=str(level),
+                    ax=ax,
+                )
+                if fit_reg and aggregate:
+                    fit_data = sample_rows(level_data, CHART_FIT_SAMPLE)
+                    sns.regplot(
+                        x=x,
+                        y=y,
+                        data=fit_data,
+                        scatter=False,
+                        order=order,
+                        color=color,
+                        ax=ax,
+                    )
+                    render_info["fit_points"] += len(fit_data)
+            ax.legend(title=target)
+
+        image = figure_to_image(fig, fmt)
+
+    return image, render_info
+
+
+def plot_hist(
+    jsons: Dict[str, Any], df: DataFrame, fmt: str = "png"
+) -> Tuple[bytes, Dict[str, Any]]:
     """
     説明
     ----------
-    ヒストグラムをプロットし文字列にエンコーディングする関数
+    ヒストグラムをプロットし画像データに変換する関数
+
+    行数がCHART_MAX_POINTSを超える場合は先にビンごとの件数を集計し、
+    集計結果を重みとして描画する（見た目は全行で描画した場合と同じ）。
 
     Request
     ----------
     Dict[str, Any]
     DataFrame
+    fmt : str
+        画像形式（png, webp, svg）
 
     Response
     ----------
-    plot_url : str
-        画像データをBase64エンコードされたバイト列をUTF-8でエンコーディングした文字列
+    image : bytes
+        画像データ
+    render_info : Dict[str, Any]
+        描画方法（mode）と描画に使った行数（points）、描画した点やビンの数（rendered_points）
 
     """
-    plt.clf()
-    plt.figure(figsize=(10, 9))
     variable = ""
     target_variable = None
-    list_columns = {"variable": variable, "target": target_variable}
+    list_columns: Dict[str, Any] = {"variable": variable, "target": target_variable}
 
     for k, v in jsons.items():  # キー／値の組を列挙
         if k in list_columns:
@@ -261,63 +332,95 @@ def plot_hist(jsons: Dict[str, Any], df: DataFrame) -> str:
 
     # df = get_df()
 
-    if list_columns["target"] == "None":
-        hist_plot = sns.histplot(x=list_columns["variable"], data=df)
-    else:
-        order = df[list_columns["target"]].value_counts(ascending=True).index
-        hist_plot = sns.histplot(
-            x=list_columns["variable"],
-            hue=list_columns["target"],
-            data=df,
-            hue_order=order,
-            multiple="layer",
-            palette="Set2",
-        )
-
-    # バッファに保存
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    plot_url = base64.b64encode(buf.getvalue()).decode()
-
-    return plot_url
-
-
-def plot_box(jsons: Dict[str, Any], df: DataFrame) -> str:
+    variable = list_columns["variable"]
+    target: Optional[str] = (
+        None if list_columns["target"] == "None" else list_columns["target"]
+    )
+    render_info: Dict[str, Any] = {
+        "mode": "full",
+        "points": len(df),
+        "rendered_points": len(df),
+    }
+
+    data = df
+    hist_options: Dict[str, Any] = {}
+    if len(df) > CHART_MAX_POINTS and not pd.api.types.is_datetime64_any_dtype(
+        df[variable]
+    ):
+        # ビンごとの件数を集計してから描画
+        data, edges = bin_counts(df, variable, target)
+        hist_options["weights"] = "count"
+        if edges is not None:
+            hist_options["bins"] = edges.tolist()
+        columns = [variable] if target is None else [variable, target]
+        render_info = {
+            "mode": "binned",
+            "points": int(data.loc[data[columns].notna().all(axis=1), "count"].sum()),
+            "rendered_points": len(data),
+        }
+
+    with create_figure(figsize=(10, 9)) as fig:
+        ax = fig.subplots()
+
+        if target is None:
+            sns.histplot(x=variable, data=data, ax=ax, **hist_options)
+        else:
+            order = df[target].value_counts(ascending=True).index
+            sns.histplot(
+                x=variable,
+                hue=target,
+                data=data,
+                hue_order=order,
+                multiple="layer",
+                palette="Set2",
+                ax=ax,
+                **hist_options,
+            )
+
+        # バッファに保存
+        image = figure_to_image(fig, fmt)
+
+    return image, render_info
+
+
+def plot_box(
+    jsons: Dict[str, Any], df: DataFrame, fmt: str = "png"
+) -> Tuple[bytes, Dict[str, Any]]:
     """
     説明
     ----------
-    箱ひげ図をプロットし文字列にエンコーディングする関数
+    箱ひげ図をプロットし画像データに変換する関数
 
     Request
     ----------
     Dict[str, Any]
     DataFrame
+    fmt : str
+        画像形式（png, webp, svg）
 
     Response
     ----------
-    plot_url : str
-        画像データをBase64エンコードされたバイト列をUTF-8でエンコーディングした文字列
+    image : bytes
+        画像データ
+    render_info : Dict[str, Any]
+        描画方法（mode）と描画に使った行数（points）、描画した点やビンの数（rendered_points）
 
     """
 
-    # 初期化
-    plt.clf()
-    plt.figure(figsize=(10, 9))
     x = jsons["variable1"]
     y = jsons["variable2"]
     # df = get_df()
 
     df[x] = df[x].apply(lambda label: label if len(label) <= 25 else label[:25] + "...")
 
-    # プロット
-    box_plot = sns.boxenplot(x=x, y=y, data=df)
-    plt.xticks(rotation=340, fontsize=8)
+    with create_figure(figsize=(10, 9)) as fig:
+        ax = fig.subplots()
+
+        # プロット
+        sns.boxenplot(x=x, y=y, data=df, ax=ax)
+        ax.tick_params(axis="x", labelrotation=340, labelsize=8)
 
-    # バイナリデータにエンコード
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    plot_url = base64.b64encode(buf.getvalue()).decode()
+        # バイナリデータにエンコード
+        image = figure_to_image(fig, fmt)
 
-    return plot_url
+    return image, {"mode": "full", "points": len(df), "rendered_points": len(df)}
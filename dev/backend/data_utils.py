@@ -1,11 +1,9 @@
-import base64
-import io
 import os
+import time
 import uuid
 from typing import Any, Dict, List, Optional, Tuple
 
 import matplotlib
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import seaborn as sns
@@ -14,8 +12,12 @@ from pandas import DataFrame, Series
 matplotlib.use("Agg")
 import json
 
+from column_dtypes import NUMERIC_DTYPES, apply_dtypes, to_strings
+from feature_importance import FeatureMatrix, build_feature_matrix, train_model
+from formula import evaluate_formula
+from rendering import create_figure, figure_to_base64, figure_to_image
 from scipy import interpolate
-from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.ensemble import RandomForestRegressor
 from sklearn.experimental import enable_iterative_imputer  # type: ignore
 from sklearn.impute import IterativeImputer, KNNImputer
 from sklearn.metrics import (
@@ -28,10 +30,20 @@ from sklearn.metrics import (
     r2_score,
     recall_score,
 )
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
 
-Divide_By_Zero = False
+# 数値変数の補完の方法（impute_numeric）
+NUMERIC_IMPUTE_METHODS = (
+    "平均値補完",
+    "中央値補完",
+    "定数値補完",
+    "線形補完",
+    "スプライン補完",
+    "KNN補完",
+    "ランダムフォレスト補完",
+)
+
+# カテゴリカル変数の補完の方法（impute_categorical）
+CATEGORICAL_IMPUTE_METHODS = ("最頻値補完", "定数値補完", "ホットデッキ法")
 
 
 def format_value(value):
@@ -82,9 +94,79 @@ def entropy(series):
     return -(value_counts * np.log2(value_counts)).sum()
 
 
+def get_mode(value_counts: Series) -> Any:
+    """value_countsの結果から最頻値を取得する関数
+
+    最頻値が複数ある場合はSeries.modeと同じく最小の値を返す
+
+    Args:
+        value_counts (Series): value_countsの結果
+
+    Returns:
+        Any: 最頻値（データが無い場合はnp.nan）
+    """
+
+    if value_counts.empty:
+        return np.nan
+
+    modes = value_counts.index[value_counts == value_counts.iloc[0]]
+    try:
+        return sorted(modes)[0]
+    except TypeError:
+        return modes[0]
+
+
+def calculate_statistics(block: DataFrame) -> Dict[str, Series]:
+    """量的変数のカラムの統計量をまとめて計算する関数
+
+    pandasの集計は同じ型のカラムを2次元配列のまま計算するため、
+    カラムごとではなく統計量ごとに1回ずつ（四分位数と中央値は1回のquantileで）求める。
+
+    Args:
+        block (DataFrame): 同じ型（int64 or float64）の量的変数のカラムのみのデータフレーム
+
+    Returns:
+        Dict[str, Series]: 統計量の名前とカラムごとの値
+    """
+
+    quantiles = block.quantile([0.25, 0.5, 0.75])
+    return {
+        "mean": block.mean(),
+        "median": quantiles.loc[0.5],
+        "std": block.std(),
+        "min": block.min(),
+        "max": block.max(),
+        "q1": quantiles.loc[0.25],
+        "q3": quantiles.loc[0.75],
+        "skew": block.skew(),
+        "kurtosis": block.kurt(),
+        "nunique": block.nunique(),
+    }
+
+
+def format_statistic(value: Any) -> Any:
+    """統計量をJSONで返せる値に変換する関数
+
+    データが無いカラムの平均値などはNaNになるが、NaNはJSONとして不正なためNoneにする
+
+    Args:
+        value (Any): 統計量
+
+    Returns:
+        Any: 変換後の値（NaNや無限大の場合はNone）
+    """
+
+    value = convert_to_serializable(value)
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return format_value(value)
+
+
 def get_data_info(df: DataFrame) -> Dict[str, List]:
     """データの詳細情報を取得する関数
 
+    統計量はカラムごとではなく、量的変数のカラムをまとめて一度に計算する
+
     Args:
         df (DataFrame): データフレーム
 
@@ -95,61 +177,79 @@ def get_data_info(df: DataFrame) -> Dict[str, List]:
     qualitative_list = []
     quantitative_list = []
 
+    n_rows = len(df)
+    dtypes = df.dtypes
+
+    def ratio(count: Any) -> Any:
+        # 行が無い（ヘッダーのみの）データの割合は求めない
+        return count / n_rows if n_rows > 0 else np.nan
+
+    # 全カラムの欠損値の数をまとめて計算
+    null_counts = df.isnull().sum()
+
+    # 量的変数の統計量を型ごとにまとめて計算
+    # 欠損値を含む整数のカラム（Int64型）は欠損値をNaNにしてfloat64型として計算する
+    int_columns = [col for col in df.columns if dtypes[col] == "int64"]
+    float_columns = [col for col in df.columns if dtypes[col] in ("float64", "Int64")]
+
+    numeric_statistics: Dict[str, Dict[str, Any]] = {}
+    for columns, dtype in ((int_columns, "int64"), (float_columns, "float64")):
+        if not columns:
+            continue
+        block = df[columns]
+        if any(dtypes[col] != dtype for col in columns):
+            block = block.astype(dtype)
+        statistics = calculate_statistics(block)
+        for col in columns:
+            numeric_statistics[col] = {
+                key: value[col] for key, value in statistics.items()
+            }
+
     for col in df.columns:
+        if col in numeric_statistics:
+            statistics = numeric_statistics[col]
+            unique_count = statistics["nunique"]
+        else:
+            # 質的変数はvalue_countsを1カラムにつき1回だけ計算する
+            value_counts = df[col].value_counts()
+            unique_count = len(value_counts)
+
         common_info = {
-            "データ型": str(df[col].dtype),
-            "ユニークな値の数": convert_to_serializable(df[col].nunique()),
-            "欠損値の数": convert_to_serializable(df[col].isnull().sum()),
-            "欠損値の割合": format_value(
-                convert_to_serializable(df[col].isnull().sum() / len(df))
-            ),
+            "データ型": str(dtypes[col]),
+            "ユニークな値の数": convert_to_serializable(unique_count),
+            "欠損値の数": convert_to_serializable(null_counts[col]),
+            "欠損値の割合": format_statistic(ratio(null_counts[col])),
         }
 
-        if df[col].dtype == "int64" or df[col].dtype == "float64":
+        if col in numeric_statistics:
+            mean, std = statistics["mean"], statistics["std"]
             quantitative_info = {
-                "平均値": format_value(convert_to_serializable(df[col].mean())),
-                "中央値": format_value(convert_to_serializable(df[col].median())),
-                "標準偏差": format_value(convert_to_serializable(df[col].std())),
-                "最小値": format_value(convert_to_serializable(df[col].min())),
-                "最大値": format_value(convert_to_serializable(df[col].max())),
-                "第1四分位数": format_value(
-                    convert_to_serializable(df[col].quantile(0.25))
-                ),
-                "第3四分位数": format_value(
-                    convert_to_serializable(df[col].quantile(0.75))
-                ),
-                "歪度": format_value(convert_to_serializable(df[col].skew())),
-                "尖度": format_value(convert_to_serializable(df[col].kurtosis())),
-                "変動係数": format_value(
-                    convert_to_serializable(
-                        df[col].std() / df[col].mean()
-                        if df[col].mean() != 0
-                        else np.nan
-                    )
-                ),
+                "平均値": format_statistic(mean),
+                "中央値": format_statistic(statistics["median"]),
+                "標準偏差": format_statistic(std),
+                "最小値": format_statistic(statistics["min"]),
+                "最大値": format_statistic(statistics["max"]),
+                "第1四分位数": format_statistic(statistics["q1"]),
+                "第3四分位数": format_statistic(statistics["q3"]),
+                "歪度": format_statistic(statistics["skew"]),
+                "尖度": format_statistic(statistics["kurtosis"]),
+                "変動係数": format_statistic(std / mean if mean != 0 else np.nan),
             }
             quantitative_list.append(
                 {"column_name": col, "common": common_info, "data": quantitative_info}
             )
         else:
+            top_count = value_counts.iloc[0] if not value_counts.empty else np.nan
+            probabilities = value_counts / value_counts.sum()
+
             qualitative_info = {
-                "最頻値": convert_to_serializable(
-                    df[col].mode().iloc[0] if not df[col].mode().empty else np.nan
-                ),
-                "最頻値の出現回数": convert_to_serializable(
-                    df[col].value_counts().iloc[0]
-                    if not df[col].value_counts().empty
-                    else np.nan
+                "最頻値": convert_to_serializable(get_mode(value_counts)),
+                "最頻値の出現回数": convert_to_serializable(top_count),
+                "最頻値の割合": format_statistic(ratio(top_count)),
+                "カテゴリ数": convert_to_serializable(unique_count),
+                "エントロピー": format_statistic(
+                    -(probabilities * np.log2(probabilities)).sum()
                 ),
-                "最頻値の割合": format_value(
-                    convert_to_serializable(
-                        df[col].value_counts().iloc[0] / len(df)
-                        if not df[col].value_counts().empty
-                        else np.nan
-                    )
-                ),
-                "カテゴリ数": convert_to_serializable(df[col].nunique()),
-                "エントロピー": format_value(convert_to_serializable(entropy(df[col]))),
             }
             qualitative_list.append(
                 {"column_name": col, "common": common_info, "data": qualitative_info}
@@ -184,10 +284,8 @@ def get_miss_columns(df: DataFrame) -> Dict[str, List]:
 
     # 欠損値があるカラムについて調べ、量的か質的かで各リストに入れる
     for col in df.columns:
-        if col == "JobRole":
-            print(col, df["JobRole"][3], type(df[col][3]))
         if df[col].isnull().any():
-            if df[col].dtype == "int64" or df[col].dtype == "float64":
+            if str(df[col].dtype) in NUMERIC_DTYPES:
                 quantitative_miss_list.append(col)
             else:
                 qualitative_miss_list.append(col)
@@ -221,7 +319,8 @@ def change_umeric_to_categorical(data: Dict[str, str], df: DataFrame) -> None:
 
     # df = get_df()
 
-    df[column] = df[column].astype(str)
+    # 欠損値は文字列の"nan"ではなく欠損値のまま扱う
+    df[column] = to_strings(df[column])
 
     # save_dtype(df, "./uploads/dtypes.json")
 
@@ -230,7 +329,9 @@ def change_umeric_to_categorical(data: Dict[str, str], df: DataFrame) -> None:
     return df
 
 
-def make_pie(data: Dict[str, Any], df: DataFrame) -> str:
+def make_pie(
+    data: Dict[str, Any], df: DataFrame, fmt: str = "png"
+) -> Tuple[bytes, Dict[str, Any]]:
     """
     説明
     ----------
@@ -240,16 +341,18 @@ def make_pie(data: Dict[str, Any], df: DataFrame) -> str:
     ----------
     data : Dict[str, str]
         データフレーム
+    fmt : str
+        画像形式（png, webp, svg）
 
     Return
     ----------
-    str
+    bytes
+        画像データ
+    Dict[str, Any]
+        描画方法（mode）と描画に使った行数（points）、描画した扇形の数（rendered_points）
 
     """
 
-    # 初期化
-    plt.clf()
-
     column = data["column_name"]
 
     # df = get_df()
@@ -260,142 +363,47 @@ def make_pie(data: Dict[str, Any], df: DataFrame) -> str:
     colors = sns.color_palette("pastel", n_colors=len(value_counts))
 
     # グラフの作成
-    fig, (ax1, ax2) = plt.subplots(1, 2, gridspec_kw={"width_ratios": [3, 1]})
-
-    # 円グラフの描画
-    ax1.pie(
-        value_counts.values, labels=value_counts.index, colors=colors, startangle=90
-    )
-    ax1.axis("equal")  # 円を真円に
-
-    # パーセンテージの表示
-    ax2.axis("off")
-    for i, (index, percentage) in enumerate(percentages.items()):
-        ax2.text(
-            0,
-            1 - i * 0.1,
-            f"{index}: {percentage:.1f}%",
-            fontsize=10,
-            verticalalignment="top",
+    with create_figure() as fig:
+        ax1, ax2 = fig.subplots(1, 2, gridspec_kw={"width_ratios": [3, 1]})
+
+        # 円グラフの描画
+        ax1.pie(
+            value_counts.values,
+            labels=value_counts.index,
+            colors=colors,
+            startangle=90,
         )
-
-    # バイナリデータにエンコード
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    plot_url = base64.b64encode(buf.getvalue()).decode()
-
-    return plot_url
-
-
-def calculate_quantitative(formula_list: List, row: Series) -> int:
-    """
-    説明
-    ----------
-    quantitativeに対応する計算を行う関数
-
-    Parameter
-    ----------
-    formula_list : List
-        計算式を保管しているリスト
-    row : Series
-        シリーズ型
-
-    Return
-    ----------
-    int
-
-    """
-
-    # 0除算があるかどうか
-    global Divide_By_Zero
-
-    # 式を構築
-    befor_item = ""
-    converted_expression = ""
-    for item in formula_list:
-        if item in ["+", "-", "*", "/", "%", "(", ")"]:  # 演算子の場合
-            converted_expression += item
-        elif item in row:  # カラム名の場合
-            if befor_item == "/" and row[item] == 0:  # 0除算が起こるの場合
-                Divide_By_Zero = True
-                return None
-            converted_expression += str(row[item])
-        else:  # それ以外はそのまま追加
-            if befor_item == "/" and item == 0:  # 0除算が起こるの場合
-                Divide_By_Zero = True
-                return None
-            converted_expression += str(item)
-        befor_item = item
-
-    # 計算式を評価
-    result = eval(converted_expression)
-
-    return result
-
-
-def calculate_qualitative(formula_list: List, row: Series) -> bool:
-    """
-    qualitativeに対応する計算を行う関数
-
-    Parameters
-    ----------
-    formula_list : List
-        条件式を構成するリスト
-    row : Series
-        データフレームの行を表すシリーズ型
-
-    Returns
-    ----------
-    bool
-        条件式の評価結果（True/False）
-    """
-
-    # 条件式を構築
-    converted_expression = ""
-    for i, item in enumerate(formula_list):
-        if item in ["==", "!=", "<", ">", "<=", ">="]:
-            # 左側（カラム名）と右側（値）の確認
-            left = formula_list[i - 1]  # "=="の左側
-            right = formula_list[i + 1]  # "=="の右側
-
-            # 左側はカラム名であるべき
-            if left not in row:
-                raise ValueError(f"'{left}' is not a valid column name in the data.")
-
-            # データ型に基づく処理
-            left_value = row[left]
-            if isinstance(left_value, (int, float)) and not isinstance(
-                right, (int, float)
-            ):
-                raise TypeError(
-                    f"Expected numeric value on the right side of '==' for column '{left}', got '{right}'"
-                )
-            if isinstance(left_value, str) and not isinstance(right, str):
-                raise TypeError(
-                    f"Expected string value on the right side of '==' for column '{left}', got '{right}'"
-                )
-
-        if item in ["==", "!=", "<", ">", "<=", ">=", "and", "or", "(", ")"]:
-            converted_expression += f" {item} "
-        elif item in row:
-            converted_expression += (
-                f"'{row[item]}'" if isinstance(row[item], str) else str(row[item])
+        ax1.axis("equal")  # 円を真円に
+
+        # パーセンテージの表示
+        ax2.axis("off")
+        for i, (index, percentage) in enumerate(percentages.items()):
+            ax2.text(
+                0,
+                1 - i * 0.1,
+                f"{index}: {percentage:.1f}%",
+                fontsize=10,
+                verticalalignment="top",
             )
-        else:
-            converted_expression += f"'{item}'" if isinstance(item, str) else str(item)
 
-    # 条件式を評価
-    result = eval(converted_expression)
-    return "True" if result else "False"
+        # バイナリデータにエンコード
+        image = figure_to_image(fig, fmt)
 
+    return image, {
+        "mode": "full",
+        "points": len(df),
+        "rendered_points": len(value_counts),
+    }
 
-def make_feature_value(data: Dict[str, Any], df: DataFrame) -> None:
+
+def make_feature_value(data: Dict[str, Any], df: DataFrame) -> Tuple[DataFrame, bool]:
     """
     説明
     ----------
     特徴量の作成する関数
 
+    計算式は一度だけ構文木に変換し、カラム単位でまとめて計算する
+
     Parameter
     ----------
     data : Dict[str, Any]
@@ -403,74 +411,69 @@ def make_feature_value(data: Dict[str, Any], df: DataFrame) -> None:
 
     Return
     ----------
-    DataFrame
+    Tuple[DataFrame, bool]
+        新しいカラムを追加したデータフレームと0除算があったかどうか
 
     """
 
-    # 0除算があるかどうか
-    global Divide_By_Zero
-
-    Divide_By_Zero = False
-
     formula_list = data["formula"]
     new_column_name = data["new_column_name"]
     feature_type = data["feature_type"]  # quantitative or qualitative
 
-    if feature_type == "quantitative":
-        df[new_column_name] = df.apply(
-            lambda row: calculate_quantitative(formula_list, row), axis=1
-        )
-    else:
-        df[new_column_name] = df.apply(
-            lambda row: calculate_qualitative(formula_list, row), axis=1
-        )
+    df[new_column_name], divide_by_zero = evaluate_formula(
+        formula_list, df, feature_type
+    )
 
-    return df, Divide_By_Zero
+    return df, divide_by_zero
 
 
 def prepare_data(
-    df: DataFrame, target_column: str, exclude_columns: Optional[List[str]] = None
+    df: DataFrame,
+    target_column: str,
+    exclude_columns: Optional[List[str]] = None,
+    features: Optional[FeatureMatrix] = None,
 ) -> Tuple[DataFrame, Series]:
     """
     説明
     ----------
     特徴量分析に必要な関数
+    エンコード済みの特徴量から目的変数のカラムを複製せずに除く
 
     Parameter
     ----------
     df : DataFrame
-        データフレーム
+        データフレーム（featuresを渡す場合は目的変数のカラムのみでよい）
     target_column : str
         目的変数のカラム名
     exclude_columns : Optional[List[str]]
         特徴量分析に使用しないカラムのリスト
+    features : Optional[FeatureMatrix]
+        データのバージョンごとに作成したエンコード済みの特徴量（省略時はdfから作成する）
 
     Return
     ----------
-    str
-        分析結果のバイナリデータ
+    Tuple[DataFrame, Series]
+        説明変数と目的変数
 
     """
 
-    if exclude_columns is None:
-        exclude_columns = []
-
-    # 目的変数に欠損値があるか確認
-    if df[target_column].isnull().any():
-        df = df.dropna(subset=[target_column])
+    if features is None:
+        features = build_feature_matrix(df)
 
-    columns_to_drop = [target_column] + exclude_columns
-    X = df.drop(columns_to_drop, axis=1)
     y = df[target_column]
+    X = features.without(target_column).to_frame(index=y.index)
+    if exclude_columns:
+        X = X.drop(exclude_columns, axis=1)
 
-    for column in X.select_dtypes(include=["object", "category"]).columns:
-        le = LabelEncoder()
-        X[column] = le.fit_transform(X[column].astype(str))
+    # 目的変数に欠損値がある行は除く
+    if y.isnull().any():
+        keep = y.notna().to_numpy()
+        X, y = X[keep], y[keep]
 
     return X, y
 
 
-def calculate_feature_importance(model, X: DataFrame) -> DataFrame:
+def calculate_feature_importance(importances: np.ndarray, X: DataFrame) -> DataFrame:
     """
     説明
     ----------
@@ -478,8 +481,8 @@ def calculate_feature_importance(model, X: DataFrame) -> DataFrame:
 
     Parameter
     ----------
-    model
-        ランダムフォレストのモデル
+    importances : np.ndarray
+        各カラムの重要度（train_modelで計算したもの）
     X : DataFrame
         データフレーム
 
@@ -490,7 +493,6 @@ def calculate_feature_importance(model, X: DataFrame) -> DataFrame:
 
     """
 
-    importances = model.feature_importances_
     feature_importance = pd.DataFrame({"feature": X.columns, "importance": importances})
     feature_importance = feature_importance.sort_values(
         "importance", ascending=False
@@ -519,28 +521,29 @@ def plot_feature_importance(feature_importance: DataFrame, top_n: int = 20) -> s
 
     """
 
-    # 初期化
-    plt.clf()
-
-    plt.figure(figsize=(7, 5.5))
     top_n = min(top_n, len(feature_importance))
-    sns.barplot(x="importance", y="feature", data=feature_importance.head(top_n))
-    plt.title(f"Top {top_n} Feature Importance")
-    plt.xlabel("Importance")
-    plt.ylabel("Feature")
+    with create_figure(figsize=(7, 5.5)) as fig:
+        ax = fig.subplots()
+        sns.barplot(
+            x="importance", y="feature", data=feature_importance.head(top_n), ax=ax
+        )
+        ax.set_title(f"Top {top_n} Feature Importance")
+        ax.set_xlabel("Importance")
+        ax.set_ylabel("Feature")
 
-    # バイナリデータにエンコード
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png", dpi=100, bbox_inches="tight")
-    buf.seek(0)
-    plot_url = base64.b64encode(buf.getvalue()).decode()
+        # バイナリデータにエンコード
+        plot_url = figure_to_base64(fig, dpi=100, bbox_inches="tight")
 
     return plot_url
 
 
 def evaluate_classification_model(
-    X: DataFrame, y: Series, test_size: float = 0.2, random_state: int = 42
-) -> str:
+    X: DataFrame,
+    y: Series,
+    test_size: float = 0.2,
+    random_state: int = 42,
+    engine: Optional[str] = None,
+) -> Dict[str, Any]:
     """
     説明
     ----------
@@ -556,21 +559,26 @@ def evaluate_classification_model(
         テストサイズ
     random_state : int
         乱数
+    engine : Optional[str]
+        重要度の計算方法（random_forest, hist_gradient_boosting, permutation）
 
     Return
     ----------
-    str
-        分析結果のバイナリデータ
+    Dict[str, Any]
+        分析結果のバイナリデータ（image_data）と学習の情報（training）
 
     """
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=test_size, random_state=random_state
+    # 行数・木の本数・時間などの上限を設定に合わせて学習し、重要度を計算する
+    model, importances, X_test, y_test, training = train_model(
+        X,
+        y,
+        classification=True,
+        test_size=test_size,
+        random_state=random_state,
+        engine=engine,
     )
 
-    model = RandomForestClassifier(random_state=random_state)
-    model.fit(X_train, y_train)
-
     y_pred = model.predict(X_test)
 
     accuracy = accuracy_score(y_test, y_pred)
@@ -587,17 +595,22 @@ def evaluate_classification_model(
     cm = confusion_matrix(y_test, y_pred)
 
     # 特徴量の重要度を計算して表示
-    feature_importance = calculate_feature_importance(model, X)
+    feature_importance = calculate_feature_importance(importances, X)
     print("\n特徴量の重要度:")
     print(feature_importance)
+    print("\n学習の情報:", training)
     plot_url = plot_feature_importance(feature_importance)
 
-    return plot_url
+    return {"image_data": plot_url, "training": training}
 
 
 def evaluate_regression_model(
-    X: DataFrame, y: Series, test_size: float = 0.2, random_state: int = 42
-) -> str:
+    X: DataFrame,
+    y: Series,
+    test_size: float = 0.2,
+    random_state: int = 42,
+    engine: Optional[str] = None,
+) -> Dict[str, Any]:
     """
     説明
     ----------
@@ -613,21 +626,26 @@ def evaluate_regression_model(
         テストサイズ
     random_state : int
         乱数
+    engine : Optional[str]
+        重要度の計算方法（random_forest, hist_gradient_boosting, permutation）
 
     Return
     ----------
-    str
-        分析結果のバイナリデータ
+    Dict[str, Any]
+        分析結果のバイナリデータ（image_data）と学習の情報（training）
 
     """
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=test_size, random_state=random_state
+    # 行数・木の本数・時間などの上限を設定に合わせて学習し、重要度を計算する
+    model, importances, X_test, y_test, training = train_model(
+        X,
+        y,
+        classification=False,
+        test_size=test_size,
+        random_state=random_state,
+        engine=engine,
     )
 
-    model = RandomForestRegressor(random_state=random_state)
-    model.fit(X_train, y_train)
-
     y_pred = model.predict(X_test)
 
     mse = mean_squared_error(y_test, y_pred)
@@ -642,15 +660,18 @@ def evaluate_regression_model(
     print(f"R-squared: {r2:.4f}")
 
     # 特徴量の重要度を計算して表示
-    feature_importance = calculate_feature_importance(model, X)
+    feature_importance = calculate_feature_importance(importances, X)
     print("\n特徴量の重要度:")
     print(feature_importance)
+    print("\n学習の情報:", training)
     plot_url = plot_feature_importance(feature_importance)
 
-    return plot_url
+    return {"image_data": plot_url, "training": training}
 
 
-def feature_value_analysis(data: Dict[str, str], df: DataFrame) -> str:
+def feature_value_analysis(
+    data: Dict[str, str], df: DataFrame, features: Optional[FeatureMatrix] = None
+) -> Dict[str, Any]:
     """
     説明
     ----------
@@ -661,28 +682,31 @@ def feature_value_analysis(data: Dict[str, str], df: DataFrame) -> str:
     data : Dict[str, Any]
         frontendからの情報
     df : DataFrame
-        データフレーム
+        データフレーム（featuresを渡す場合は目的変数のカラムのみでよい）
+    features : Optional[FeatureMatrix]
+        エンコード済みの特徴量（省略時はdfから作成する）
 
     Return
     ----------
-    str
-        分析結果のバイナリデータ
+    Dict[str, Any]
+        分析結果のバイナリデータ（image_data）と学習の情報（training）
 
     """
 
     # df = get_df()
 
     column_name = data["column_name"]
+    engine = data.get("engine")  # 重要度の計算方法（省略時は既定の方法）
     exclude_columns: List[str] = []  # 使わないカラムを指定
 
-    X, y = prepare_data(df, column_name, exclude_columns)
+    X, y = prepare_data(df, column_name, exclude_columns, features)
 
-    if df[column_name].dtype == "int64" or df[column_name].dtype == "float64":
-        plot_url = evaluate_regression_model(X, y)
+    if str(df[column_name].dtype) in NUMERIC_DTYPES:
+        result = evaluate_regression_model(X, y, engine=engine)
     else:
-        plot_url = evaluate_classification_model(X, y)
+        result = evaluate_classification_model(X, y, engine=engine)
 
-    return plot_url
+    return result
 
 
 def impute_numeric(column: str, method: str, df_imputed: DataFrame) -> None:
@@ -706,8 +730,13 @@ def impute_numeric(column: str, method: str, df_imputed: DataFrame) -> None:
 
     # df_imputed = get_df()
 
-    # 指定されたカラムが数値型かどうかをチェック
-    if np.issubdtype(df_imputed[column].dtype, np.number):
+    # 指定されたカラムが数値型かどうかをチェック（bool型は除く）
+    dtype = df_imputed[column].dtype
+    if is_numeric_column(df_imputed[column]):
+        if dtype == "Int64":
+            # 補完する値が小数になる場合があるため、欠損値をNaNにしてfloat64型にする
+            df_imputed[column] = df_imputed[column].astype("float64")
+
         if method == "平均値補完":
             # 1. 平均値補完
             df_imputed[column] = df_imputed[column].fillna(df_imputed[column].mean())
@@ -764,7 +793,88 @@ def impute_numeric(column: str, method: str, df_imputed: DataFrame) -> None:
     return df_imputed
 
 
-def impute_categorical(column: str, method: str, df_imputed: DataFrame):
+def fill_mode(series: Series) -> Series:
+    """
+    説明
+    ----------
+    欠損値を最頻値で補完する関数
+    値を整数のコードにしてから数えるため、値ごとの比較や並べ替えをしない
+    最頻値が複数ある場合はmode()と同じく最も小さい値を使う
+
+    Parameter
+    ----------
+    series : Series
+        object型もしくはcategory型のカラム
+
+    Return
+    ----------
+    Series
+        補完後のカラム（欠損値が無い場合やすべて欠損値の場合は元のカラム）
+
+    """
+
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        uniques = series.cat.categories
+    else:
+        codes, uniques = pd.factorize(series)
+
+    missing = codes < 0
+    if not missing.any() or missing.all():
+        return series
+
+    counts = np.bincount(codes[~missing], minlength=len(uniques))
+    mode = min(uniques[counts == counts.max()])
+    return series.fillna(mode)
+
+
+def fill_hot_deck(series: Series, rng: Optional[np.random.Generator] = None) -> Series:
+    """
+    説明
+    ----------
+    欠損値を同じカラムの欠損していない値から無作為に選んで補完する関数（ホットデッキ法）
+    選ぶ行の番号をまとめて生成し、配列から一度に取り出して代入する
+    category型はコードのみを入れ替えるため、値の変換をしない
+
+    Parameter
+    ----------
+    series : Series
+        object型もしくはcategory型のカラム
+    rng : Optional[np.random.Generator]
+        乱数生成器（省略時はシードなしで作成する）
+
+    Return
+    ----------
+    Series
+        補完後のカラム（欠損値が無い場合やすべて欠損値の場合は元のカラム）
+
+    """
+
+    if rng is None:
+        rng = np.random.default_rng()
+
+    is_category = isinstance(series.dtype, pd.CategoricalDtype)
+    values = series.cat.codes.to_numpy() if is_category else series.to_numpy()
+    missing = (values < 0) if is_category else series.isna().to_numpy()
+    if not missing.any() or missing.all():
+        return series
+
+    donors = values[~missing]
+    filled = values.copy()
+    filled[missing] = donors[rng.integers(0, len(donors), size=int(missing.sum()))]
+
+    if is_category:
+        filled = pd.Categorical.from_codes(filled, dtype=series.dtype)
+    # string型などの拡張型もobject型にならないように元の型で作成する
+    return pd.Series(filled, index=series.index, name=series.name, dtype=series.dtype)
+
+
+def impute_categorical(
+    column: str,
+    method: str,
+    df_imputed: DataFrame,
+    rng: Optional[np.random.Generator] = None,
+):
     """
     説明
     ----------
@@ -776,6 +886,8 @@ def impute_categorical(column: str, method: str, df_imputed: DataFrame):
         カラム名
     method : str
         補完の方法について
+    rng : Optional[np.random.Generator]
+        ホットデッキ法で使う乱数生成器（省略時はシードなしで作成する）
 
     Return
     ----------
@@ -792,12 +904,16 @@ def impute_categorical(column: str, method: str, df_imputed: DataFrame):
     ):
         if method == "最頻値補完":
             # 3. 最頻値補完
-            df_imputed[column] = df_imputed[column].fillna(
-                df_imputed[column].mode().iloc[0]
-            )
+            df_imputed[column] = fill_mode(df_imputed[column])
 
         elif method == "定数値補完":
             # 4. 定数値補完 (ここでは'Unknown'を使用)
+            if (
+                df_imputed[column].dtype.name == "category"
+                and "Unknown" not in df_imputed[column].cat.categories
+            ):
+                # category型はカテゴリに無い値で補完できないため、先に追加する
+                df_imputed[column] = df_imputed[column].cat.add_categories("Unknown")
             df_imputed[column] = df_imputed[column].fillna("Unknown")
 
         # elif method == 'ffill':
@@ -810,11 +926,7 @@ def impute_categorical(column: str, method: str, df_imputed: DataFrame):
 
         elif method == "ホットデッキ法":
             # 17. ホットデッキ法
-            null_mask = df_imputed[column].isnull()
-            non_null_values = df_imputed.loc[~null_mask, column]
-            df_imputed.loc[null_mask, column] = np.random.choice(
-                non_null_values, size=null_mask.sum()
-            )
+            df_imputed[column] = fill_hot_deck(df_imputed[column], rng)
     else:
         print(
             f"警告: カラム '{column}' はカテゴリカル型または文字列型ではありません。補完は行われません。"
@@ -824,6 +936,101 @@ def impute_categorical(column: str, method: str, df_imputed: DataFrame):
     return df_imputed
 
 
+def is_numeric_column(series: Series) -> bool:
+    """
+    説明
+    ----------
+    数値変数の補完の対象（bool型を除く数値型）のカラムか判定する関数
+
+    Parameter
+    ----------
+    series : Series
+        カラム
+
+    Return
+    ----------
+    bool
+        数値変数の補完の対象の場合はTrue
+
+    """
+
+    dtype = series.dtype
+    return pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(
+        dtype
+    )
+
+
+def check_impute_plan(plan: Dict[str, str], df: DataFrame) -> Dict[str, str]:
+    """
+    説明
+    ----------
+    まとめて補完するカラムと方法の組み合わせを確認する関数
+
+    Parameter
+    ----------
+    plan : Dict[str, str]
+        カラム名と補完の方法
+    df : DataFrame
+        データフレーム
+
+    Return
+    ----------
+    Dict[str, str]
+        補完できないカラムと理由（すべて補完できる場合は空）
+
+    """
+
+    invalid = {}
+    for column, method in plan.items():
+        if column not in df.columns:
+            invalid[column] = "カラムが見つかりません"
+        elif is_numeric_column(df[column]):
+            if method not in NUMERIC_IMPUTE_METHODS:
+                invalid[column] = f"数値型のカラムは{method}で補完できません"
+        elif df[column].dtype == "object" or df[column].dtype.name == "category":
+            if method not in CATEGORICAL_IMPUTE_METHODS:
+                invalid[column] = f"質的データのカラムは{method}で補完できません"
+        else:
+            invalid[column] = f"{df[column].dtype}型のカラムは補完できません"
+    return invalid
+
+
+def impute_columns(
+    plan: Dict[str, str], df_imputed: DataFrame, rng: np.random.Generator
+) -> Dict[str, float]:
+    """
+    説明
+    ----------
+    複数のカラムの欠損値をまとめて補完する関数
+    カラムの型に合わせてimpute_numericもしくはimpute_categoricalで補完する
+
+    Parameter
+    ----------
+    plan : Dict[str, str]
+        カラム名と補完の方法（check_impute_planで確認済みのもの）
+    df_imputed : DataFrame
+        データフレーム（補完したカラムを置き換える）
+    rng : np.random.Generator
+        ホットデッキ法で使う乱数生成器（すべてのカラムで共有する）
+
+    Return
+    ----------
+    Dict[str, float]
+        カラムごとの補完にかかった時間（ミリ秒）
+
+    """
+
+    timings = {}
+    for column, method in plan.items():
+        started = time.perf_counter()
+        if is_numeric_column(df_imputed[column]):
+            impute_numeric(column, method, df_imputed)
+        else:
+            impute_categorical(column, method, df_imputed, rng)
+        timings[column] = round((time.perf_counter() - started) * 1000, 3)
+    return timings
+
+
 def save_dtype(df: DataFrame, filename: str) -> None:
     """
     説明
@@ -889,31 +1096,32 @@ def set_dtypes(df: DataFrame, dtypes: Dict[str, str]) -> DataFrame:
         DataFrame: 型適応後のデータフレーム
     """
 
-    for col, dtype in dtypes.items():
-        if dtype == "object":
-            df[col] = df[col].astype(str)
-            df[col] = df[col].replace("nan", np.nan)
-        elif dtype == "int64":
-            df[col] = df[col].astype(int)
-
-    return df
+    # 文字列はobject型（ユニークな値が少ない場合はcategory型）、欠損値を含む整数はInt64型にし、
+    # すべてのカラムを変換してからデータフレームを1回で作成する
+    return apply_dtypes(df, dtypes)
 
 
 def extraction_df(
-    df: DataFrame, filename: str, user_id: str, csv_id: str
+    filename: str, user_id: str, csv_id: str, data_info: Dict[str, int]
 ) -> Dict[str, any]:
     """
     説明
     ----------
-    dfの情報を取得する関数
+    csvを保存する際の情報を取得する関数
+    （大きさ・行数・列数は送信するデータを作成した際に求めたものを使い、
+    データフレームを再度変換しない）
 
 
     Parameter
     ----------
-    df : DataFrame
-        データフレーム
     filename : str
-        データフレームの型情報を保存しているファイルのpath
+        アップロードされたファイル名
+    user_id : str
+        ユーザーの固有id
+    csv_id : str
+        csvの固有id
+    data_info : Dict[str, int]
+        data_size, data_columns, data_rowsの辞書（make_payloadの戻り値）
 
     Return
     ----------
@@ -925,21 +1133,13 @@ def extraction_df(
     # csv_id = str(uuid.uuid4())
     # user_id = str(uuid.uuid4())
 
-    # メモリ上で一時的にCSVを作成
-    csv_buffer = io.StringIO()
-    df.to_csv(csv_buffer, index=False)
-    data_size = len(csv_buffer.getvalue().encode("utf-8"))
-
-    data_columns = len(df.columns)
-    data_rows = len(df)
-
     form_data = {
         "csv_id": csv_id,
         "user_id": user_id,
         "file_name": filename,
-        "data_size": data_size,
-        "data_columns": data_columns,
-        "data_rows": data_rows,
+        "data_size": data_info["data_size"],
+        "data_columns": data_info["data_columns"],
+        "data_rows": data_info["data_rows"],
     }
 
     return form_data
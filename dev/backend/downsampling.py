@@ -0,0 +1,121 @@
+import math
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+# この行数を超えるとグラフを間引き・集約して描画する（環境変数で変更可能）
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "50000"))
+
+# 回帰直線の計算に使う最大行数（環境変数で変更可能）
+CHART_FIT_SAMPLE = int(os.getenv("CHART_FIT_SAMPLE", "5000"))
+
+# 層化抽出で各グループに最低限残す行数
+MIN_STRATUM_SIZE = 100
+
+# 抽出結果を毎回同じにするための乱数シード
+RANDOM_STATE = 0
+
+
+def sample_rows(df: DataFrame, n: int) -> DataFrame:
+    """最大n行を無作為に抽出する関数
+
+    Args:
+        df (DataFrame): データフレーム
+        n (int): 抽出する最大行数
+
+    Returns:
+        DataFrame: n行以下の場合は元のデータフレーム、それ以外は抽出したデータフレーム
+    """
+
+    if len(df) <= n:
+        return df
+    return df.sample(n=n, random_state=RANDOM_STATE)
+
+
+def stratified_sample(df: DataFrame, column: str, n: int) -> DataFrame:
+    """カラムの値ごとの割合を保ったまま最大n行程度を抽出する関数
+
+    行数の少ない値も消えないよう、各値から最低MIN_STRATUM_SIZE行（値の行数が
+    それより少ない場合は全行）を残す。欠損値の行は除く。
+
+    Args:
+        df (DataFrame): データフレーム
+        column (str): 層化に使うカラム名
+        n (int): 抽出する行数の目安
+
+    Returns:
+        DataFrame: 抽出したデータフレーム
+    """
+
+    frac = n / len(df)
+    samples = []
+    for _, group in df.groupby(column, sort=False, observed=True):
+        size = max(math.ceil(len(group) * frac), MIN_STRATUM_SIZE)
+        samples.append(sample_rows(group, size))
+
+    if not samples:
+        return df.iloc[:0]
+    return pd.concat(samples)
+
+
+def bin_counts(
+    df: DataFrame, variable: str, target: Optional[str] = None
+) -> Tuple[DataFrame, Optional[np.ndarray]]:
+    """ヒストグラム用にカラムの値を集計する関数
+
+    数値のカラムはseabornと同じ方法（numpyのauto）でビンの境界を決め、ビンごとの件数を数える。
+    それ以外のカラムは値ごとの件数を数える。targetを指定した場合はtargetの値ごとに数える。
+
+    Args:
+        df (DataFrame): データフレーム
+        variable (str): 集計するカラム名
+        target (Optional[str]): 色分けに使うカラム名
+
+    Returns:
+        Tuple[DataFrame, Optional[np.ndarray]]: variable, (target,) countをカラムに持つ集計結果と
+            ビンの境界（数値でない場合はNone）
+    """
+
+    if not pd.api.types.is_numeric_dtype(df[variable]):
+        # 値の並び順を元のデータと揃えるため、欠損値の行も残す（描画時にseabornが除く）
+        keys = [variable] if target is None else [variable, target]
+        counts = df.groupby(keys, sort=False, observed=True, dropna=False).size()
+        return counts.rename("count").reset_index(), None
+
+    values = df[variable].to_numpy(dtype=float)
+    valid = ~np.isnan(values)
+
+    if target is None:
+        edges = np.histogram_bin_edges(values[valid], bins="auto")
+        counts, _ = np.histogram(values[valid], bins=edges)
+        centers = (edges[:-1] + edges[1:]) / 2
+        return DataFrame({variable: centers, "count": counts}), edges
+
+    # seabornと同様にtargetが欠損している行を除いてビンの境界を決める
+    categorical = pd.Categorical(df[target])
+    codes = categorical.codes
+    levels = categorical.categories
+    valid &= codes >= 0
+    edges = np.histogram_bin_edges(values[valid], bins="auto")
+    n_bins = len(edges) - 1
+    centers = (edges[:-1] + edges[1:]) / 2
+
+    # targetの値とビンの組ごとの件数を1回の走査で数える
+    bins = np.searchsorted(edges, values[valid], side="right") - 1
+    bins = np.clip(bins, 0, n_bins - 1)  # 最大値は最後のビンに含める
+    counts = np.bincount(
+        codes[valid].astype(np.int64) * n_bins + bins, minlength=len(levels) * n_bins
+    )
+    return (
+        DataFrame(
+            {
+                variable: np.tile(centers, len(levels)),
+                target: np.repeat(levels.to_numpy(), n_bins),
+                "count": counts,
+            }
+        ),
+        edges,
+    )
@@ -0,0 +1,495 @@
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from joblib import effective_n_jobs
+from pandas import DataFrame, Series
+from sklearn.ensemble import (
+    HistGradientBoostingClassifier,
+    HistGradientBoostingRegressor,
+    RandomForestClassifier,
+    RandomForestRegressor,
+)
+from sklearn.inspection import permutation_importance
+from sklearn.model_selection import train_test_split
+
+# 既定で使う重要度の計算方法（IMPORTANCE_ENGINESのキー、環境変数で変更可能）
+ANALYSIS_ENGINE = os.getenv("ANALYSIS_ENGINE", "random_forest")
+
+# ランダムフォレストの学習に使うCPUコア数（-1の場合はすべて、環境変数で変更可能）
+ANALYSIS_N_JOBS = int(os.getenv("ANALYSIS_N_JOBS", "-1"))
+
+# 学習・評価に使う最大行数（超える場合は目的変数で層化抽出する、0の場合は制限しない）
+ANALYSIS_MAX_ROWS = int(os.getenv("ANALYSIS_MAX_ROWS", "200000"))
+
+# 作成する木の本数（勾配ブースティングの場合は反復回数、環境変数で変更可能）
+ANALYSIS_N_ESTIMATORS = int(os.getenv("ANALYSIS_N_ESTIMATORS", "100"))
+
+# 1本の木の学習に使う行（割合もしくは行数、空の場合はすべて、環境変数で変更可能）
+ANALYSIS_MAX_SAMPLES = os.getenv("ANALYSIS_MAX_SAMPLES", "")
+
+# 木の深さの上限（空の場合は制限しない、環境変数で変更可能）
+ANALYSIS_MAX_DEPTH = os.getenv("ANALYSIS_MAX_DEPTH", "")
+
+# 学習にかける秒数の上限（超えた場合はそれまでに作った木で打ち切る、0の場合は制限しない）
+ANALYSIS_TIME_BUDGET = float(os.getenv("ANALYSIS_TIME_BUDGET", "60"))
+
+# 並べ替えによる重要度を計算する評価用データの最大行数（環境変数で変更可能）
+ANALYSIS_PERMUTATION_ROWS = int(os.getenv("ANALYSIS_PERMUTATION_ROWS", "10000"))
+
+# 並べ替えによる重要度で各カラムを並べ替える回数（環境変数で変更可能）
+ANALYSIS_PERMUTATION_REPEATS = int(os.getenv("ANALYSIS_PERMUTATION_REPEATS", "5"))
+
+# 時間の上限を確認するまでに追加する木の最小本数
+TREE_BATCH_SIZE = 10
+
+RandomForest = Union[RandomForestClassifier, RandomForestRegressor]
+HistGradientBoosting = Union[
+    HistGradientBoostingClassifier, HistGradientBoostingRegressor
+]
+Model = Union[RandomForest, HistGradientBoosting]
+
+# (学習済みのモデル, 各カラムの重要度, 上限に達した設定)
+EngineResult = Tuple[Model, np.ndarray, List[str]]
+
+
+def encode_column(series: Series) -> np.ndarray:
+    """文字列のカラムを整数のコードに変換する関数
+
+    値を文字列にして（欠損値は"nan"）辞書順に番号を振るため、
+    LabelEncoderでfit_transformした場合と同じコードになる。
+    category型はカテゴリのみを並べ替えてコードを付け替えるため、行ごとの文字列変換をしない。
+
+    Args:
+        series (Series): object型もしくはcategory型のカラム
+
+    Returns:
+        np.ndarray: 各行のコード（int64）
+    """
+
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        codes, _ = pd.factorize(series.astype(str), sort=True)
+        return codes.astype(np.int64)
+
+    labels = series.cat.categories.astype(str)
+    codes = series.cat.codes.to_numpy().astype(np.int64)
+    if (codes < 0).any():
+        codes[codes < 0] = len(labels)
+        labels = labels.append(pd.Index(["nan"]))
+    # 同じ文字列になるカテゴリ（1と"1"など）は同じコードにする
+    _, ranks = np.unique(labels.to_numpy(dtype=str), return_inverse=True)
+    return ranks.astype(np.int64)[codes]
+
+
+def encode_values(series: Series) -> np.ndarray:
+    """カラムを特徴量の配列に入れる数値に変換する関数
+
+    Args:
+        series (Series): カラム
+
+    Returns:
+        np.ndarray: 各行の値（文字列のカラムはencode_columnのコード、欠損値はNaN）
+    """
+
+    if pd.api.types.is_object_dtype(series.dtype) or isinstance(
+        series.dtype, pd.CategoricalDtype
+    ):
+        return encode_column(series)
+    return series.to_numpy(dtype=np.float32, na_value=np.nan)
+
+
+class FeatureMatrix:
+    """エンコード済みの特徴量をfloat32の1つの配列にまとめたもの
+
+    カラムごとに連続するFortran順の配列に、カラムを1周と最後のカラムを除いた分だけ
+    並べておく（[c0, c1, ..., cn-1, c0, ..., cn-2]）。j番目のカラムを目的変数にする場合は
+    j+1からn-1本分を切り出すと、目的変数以外のすべてのカラムが複製せずに参照できる。
+    カラムの並びはj+1番目から始まる順に回転するため、columnsで対応を持つ。
+    """
+
+    def __init__(self, values: np.ndarray, columns: List[str], ring: bool) -> None:
+        # (行数, カラム数) もしくは ring の場合は (行数, カラム数 * 2 - 1)
+        self.values = values
+        self.columns = columns
+        self.ring = ring
+
+    @property
+    def nbytes(self) -> int:
+        """配列のバイト数"""
+
+        return self.values.nbytes
+
+    def without(self, column: str) -> "FeatureMatrix":
+        """目的変数のカラムを除いた特徴量を取得する関数（ringの場合は複製しない）
+
+        Args:
+            column (str): 除くカラム名
+
+        Returns:
+            FeatureMatrix: 除いた後の特徴量（columnが無い場合は自身）
+        """
+
+        if column not in self.columns:
+            return self
+
+        n = len(self.columns)
+        j = self.columns.index(column)
+        if not self.ring:
+            columns = self.columns[:j] + self.columns[j + 1 :]
+            return FeatureMatrix(np.delete(self.values, j, axis=1), columns, False)
+
+        columns = [self.columns[(j + 1 + k) % n] for k in range(n - 1)]
+        return FeatureMatrix(self.values[:, j + 1 : j + n], columns, False)
+
+    def to_frame(self, index: Optional[pd.Index] = None) -> DataFrame:
+        """配列を複製せずにデータフレームにする関数（ringの場合は1周分のみ）
+
+        Args:
+            index (Optional[pd.Index]): 行のインデックス
+
+        Returns:
+            DataFrame: 特徴量のデータフレーム
+        """
+
+        values = self.values[:, : len(self.columns)]
+        return DataFrame(values, columns=self.columns, index=index, copy=False)
+
+
+def build_feature_matrix(df: DataFrame) -> FeatureMatrix:
+    """すべての重要度の計算方法で共通の前処理（文字列のカラムを整数に変換）を行う関数
+
+    すべてのカラムをエンコードしてfloat32の配列にまとめる。どのカラムが目的変数になっても
+    FeatureMatrix.withoutで除けるため、データのバージョンごとに1回作成すればよい。
+
+    Args:
+        df (DataFrame): データフレーム（目的変数の候補を含むすべてのカラム）
+
+    Returns:
+        FeatureMatrix: エンコード済みの特徴量
+    """
+
+    columns = [str(col) for col in df.columns]
+    n = len(columns)
+    values = np.empty((len(df), max(n * 2 - 1, 0)), dtype=np.float32, order="F")
+    for k, col in enumerate(df.columns):
+        values[:, k] = encode_values(df[col])
+    # 2周目は1周目の先頭からn-1本をそのまま複製する
+    values[:, n:] = values[:, : n - 1]
+    return FeatureMatrix(values, columns, True)
+
+
+def parse_max_samples(value: str) -> Optional[Union[int, float]]:
+    """max_samplesの設定値（"0.5"や"50000"）を変換する関数
+
+    Args:
+        value (str): 設定値
+
+    Returns:
+        Optional[Union[int, float]]: 割合（小数点を含む場合）もしくは行数（空の場合はNone）
+    """
+
+    if not value:
+        return None
+    return float(value) if "." in value else int(value)
+
+
+def sample_rows(
+    X: DataFrame, y: Series, max_rows: int, stratify: bool, random_state: int
+) -> Tuple[DataFrame, Series]:
+    """学習に使う行を最大行数まで減らす関数
+
+    分類の場合は各クラスの割合が変わらないように目的変数で層化抽出する。
+    1行しかないクラスがあるなど層化できない場合は単純に無作為抽出する。
+
+    Args:
+        X (DataFrame): 説明変数
+        y (Series): 目的変数
+        max_rows (int): 最大行数（0の場合は減らさない）
+        stratify (bool): 目的変数で層化するか（分類の場合True）
+        random_state (int): 乱数
+
+    Returns:
+        Tuple[DataFrame, Series]: 抽出後の説明変数と目的変数
+    """
+
+    if max_rows <= 0 or len(X) <= max_rows:
+        return X, y
+
+    if stratify:
+        try:
+            X_sample, _, y_sample, _ = train_test_split(
+                X, y, train_size=max_rows, stratify=y, random_state=random_state
+            )
+            return X_sample, y_sample
+        except ValueError:
+            pass
+
+    index = y.sample(n=max_rows, random_state=random_state).index
+    return X.loc[index], y.loc[index]
+
+
+def make_forest(classification: bool, random_state: int) -> RandomForest:
+    """設定に合わせてランダムフォレストを作成する関数
+
+    Args:
+        classification (bool): 分類の場合True、回帰の場合False
+        random_state (int): 乱数
+
+    Returns:
+        RandomForest: 未学習のモデル
+    """
+
+    model_class = RandomForestClassifier if classification else RandomForestRegressor
+    return model_class(
+        n_estimators=ANALYSIS_N_ESTIMATORS,
+        max_samples=parse_max_samples(ANALYSIS_MAX_SAMPLES),
+        max_depth=int(ANALYSIS_MAX_DEPTH) if ANALYSIS_MAX_DEPTH else None,
+        n_jobs=ANALYSIS_N_JOBS,
+        random_state=random_state,
+    )
+
+
+def make_boosting(classification: bool, random_state: int) -> HistGradientBoosting:
+    """設定に合わせてヒストグラム型の勾配ブースティングを作成する関数
+
+    値を256個までのビンにまとめてから学習するため、行数が多い量的変数のデータでも速い。
+
+    Args:
+        classification (bool): 分類の場合True、回帰の場合False
+        random_state (int): 乱数
+
+    Returns:
+        HistGradientBoosting: 未学習のモデル
+    """
+
+    model_class = (
+        HistGradientBoostingClassifier
+        if classification
+        else HistGradientBoostingRegressor
+    )
+    return model_class(
+        max_iter=ANALYSIS_N_ESTIMATORS,
+        max_depth=int(ANALYSIS_MAX_DEPTH) if ANALYSIS_MAX_DEPTH else None,
+        random_state=random_state,
+    )
+
+
+def fit_in_batches(
+    model: Model,
+    X: DataFrame,
+    y: Series,
+    param: str,
+    time_budget: float = ANALYSIS_TIME_BUDGET,
+) -> List[str]:
+    """木を少しずつ追加しながら学習し、時間の上限を超えたら打ち切る関数
+
+    warm_startで木をTREE_BATCH_SIZE本（コア数の方が多い場合はコア数）ずつ追加するため、
+    打ち切った場合もそれまでに作った木で予測・重要度の計算ができる。
+    勾配ブースティングが早期終了した場合はそこで終える。
+
+    Args:
+        model (Model): make_forestもしくはmake_boostingで作成したモデル
+        X (DataFrame): 説明変数
+        y (Series): 目的変数
+        param (str): 木の本数のパラメータ名（n_estimatorsもしくはmax_iter）
+        time_budget (float): 学習にかける秒数の上限（0の場合は制限しない）
+
+    Returns:
+        List[str]: 上限に達した設定（"time_budget"）
+    """
+
+    total = model.get_params()[param]
+    batch_size = max(TREE_BATCH_SIZE, effective_n_jobs(ANALYSIS_N_JOBS))
+    started = time.perf_counter()
+    budgets = []
+
+    model.set_params(warm_start=True)
+    built = 0
+    while built < total:
+        built = min(built + batch_size, total)
+        model.set_params(**{param: built})
+        model.fit(X, y)
+        if getattr(model, "n_iter_", built) < built:
+            break
+        if 0 < time_budget <= time.perf_counter() - started and built < total:
+            budgets.append("time_budget")
+            break
+    model.set_params(warm_start=False)
+    return budgets
+
+
+def forest_budgets(model: RandomForest, n_samples: int) -> List[str]:
+    """ランダムフォレストで上限に達した木ごとの設定を調べる関数
+
+    Args:
+        model (RandomForest): 学習済みのモデル
+        n_samples (int): 学習に使った行数
+
+    Returns:
+        List[str]: 上限に達した設定（"max_depth", "max_samples"）
+    """
+
+    budgets = []
+    if model.max_depth is not None and any(
+        tree.get_depth() >= model.max_depth for tree in model.estimators_
+    ):
+        budgets.append("max_depth")
+    max_samples = model.max_samples
+    if max_samples is not None and (
+        max_samples < 1.0 if isinstance(max_samples, float) else max_samples < n_samples
+    ):
+        budgets.append("max_samples")
+    return budgets
+
+
+def sampled_permutation_importance(
+    model: Model, X: DataFrame, y: Series, classification: bool, random_state: int
+) -> Tuple[np.ndarray, List[str]]:
+    """評価用データの一部で並べ替えによる重要度を計算する関数
+
+    各カラムの値を並べ替えたときに評価用データのスコアがどれだけ下がるかを重要度とする。
+    予測の回数はカラム数×繰り返し回数になるため、行数はANALYSIS_PERMUTATION_ROWSまでに減らす。
+
+    Args:
+        model (Model): 学習済みのモデル
+        X (DataFrame): 評価用の説明変数
+        y (Series): 評価用の目的変数
+        classification (bool): 分類の場合True（目的変数で層化して減らす）
+        random_state (int): 乱数
+
+    Returns:
+        Tuple[np.ndarray, List[str]]: 各カラムの重要度、上限に達した設定（"permutation_rows"）
+    """
+
+    X_sample, y_sample = sample_rows(
+        X, y, ANALYSIS_PERMUTATION_ROWS, classification, random_state
+    )
+    result = permutation_importance(
+        model,
+        X_sample,
+        y_sample,
+        n_repeats=ANALYSIS_PERMUTATION_REPEATS,
+        random_state=random_state,
+    )
+    budgets = ["permutation_rows"] if len(X_sample) < len(X) else []
+    return result.importances_mean, budgets
+
+
+def random_forest_engine(
+    X_train: DataFrame,
+    y_train: Series,
+    X_test: DataFrame,
+    y_test: Series,
+    classification: bool,
+    random_state: int,
+) -> EngineResult:
+    """ランダムフォレストの不純度（ジニ係数・二乗誤差）の減少量を重要度とする計算方法"""
+
+    model = make_forest(classification, random_state)
+    budgets = fit_in_batches(model, X_train, y_train, "n_estimators")
+    budgets += forest_budgets(model, len(X_train))
+    return model, model.feature_importances_, budgets
+
+
+def hist_gradient_boosting_engine(
+    X_train: DataFrame,
+    y_train: Series,
+    X_test: DataFrame,
+    y_test: Series,
+    classification: bool,
+    random_state: int,
+) -> EngineResult:
+    """勾配ブースティングで学習し、並べ替えによる重要度を計算する方法
+
+    勾配ブースティングには不純度による重要度が無いため、評価用データの一部で並べ替える。
+    """
+
+    model = make_boosting(classification, random_state)
+    budgets = fit_in_batches(model, X_train, y_train, "max_iter")
+    importances, permutation_budgets = sampled_permutation_importance(
+        model, X_test, y_test, classification, random_state
+    )
+    return model, importances, budgets + permutation_budgets
+
+
+def permutation_engine(
+    X_train: DataFrame,
+    y_train: Series,
+    X_test: DataFrame,
+    y_test: Series,
+    classification: bool,
+    random_state: int,
+) -> EngineResult:
+    """ランダムフォレストで学習し、並べ替えによる重要度を計算する方法
+
+    不純度による重要度はユニークな値が多いカラムを過大に評価するため、
+    評価用データでスコアへの影響を直接測る。
+    """
+
+    model, _, budgets = random_forest_engine(
+        X_train, y_train, X_test, y_test, classification, random_state
+    )
+    importances, permutation_budgets = sampled_permutation_importance(
+        model, X_test, y_test, classification, random_state
+    )
+    return model, importances, budgets + permutation_budgets
+
+
+# 重要度の計算方法（リクエストのengineで選択する）
+IMPORTANCE_ENGINES: Dict[str, Callable[..., EngineResult]] = {
+    "random_forest": random_forest_engine,
+    "hist_gradient_boosting": hist_gradient_boosting_engine,
+    "permutation": permutation_engine,
+}
+
+
+def train_model(
+    X: DataFrame,
+    y: Series,
+    classification: bool,
+    test_size: float,
+    random_state: int,
+    engine: Optional[str] = None,
+) -> Tuple[Model, np.ndarray, DataFrame, Series, Dict[str, Any]]:
+    """行数を制限してから学習用と評価用に分け、選んだ方法で学習して重要度を計算する関数
+
+    Args:
+        X (DataFrame): FeatureMatrixから作成した説明変数
+        y (Series): 目的変数
+        classification (bool): 分類の場合True、回帰の場合False
+        test_size (float): 評価用データの割合
+        random_state (int): 乱数
+        engine (Optional[str]): 重要度の計算方法（省略時はANALYSIS_ENGINE）
+
+    Returns:
+        Tuple[Model, np.ndarray, DataFrame, Series, Dict[str, Any]]:
+            学習済みのモデル、各カラムの重要度、評価用の説明変数と目的変数、学習の情報
+            （計算方法、使った行数、全体の行数、作った木の本数、秒数、上限に達した設定）
+    """
+
+    started = time.perf_counter()
+    engine = engine or ANALYSIS_ENGINE
+    total_rows = len(X)
+    X, y = sample_rows(X, y, ANALYSIS_MAX_ROWS, classification, random_state)
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=test_size, random_state=random_state
+    )
+
+    model, importances, budgets = IMPORTANCE_ENGINES[engine](
+        X_train, y_train, X_test, y_test, classification, random_state
+    )
+    if len(X) < total_rows:
+        budgets.insert(0, "max_rows")
+
+    training = {
+        "engine": engine,
+        "rows": len(X),
+        "total_rows": total_rows,
+        "n_estimators": getattr(model, "n_iter_", None) or len(model.estimators_),
+        "seconds": round(time.perf_counter() - started, 3),
+        "budgets": budgets,
+    }
+    return model, importances, X_test, y_test, training
@@ -0,0 +1,227 @@
+import ast
+import operator
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from column_dtypes import to_numpy_backed
+from pandas import DataFrame, Series
+
+# quantitativeで使用できる演算子
+QUANTITATIVE_OPERATORS = ["+", "-", "*", "/", "%", "(", ")"]
+
+# qualitativeで使用できる演算子
+QUALITATIVE_OPERATORS = ["==", "!=", "<", ">", "<=", ">=", "and", "or", "(", ")"]
+
+# 比較演算子
+COMPARISON_OPERATORS = ["==", "!=", "<", ">", "<=", ">="]
+
+_BINARY_OPERATORS: Dict[type, Callable[[Any, Any], Any]] = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Mod: operator.mod,
+}
+
+_UNARY_OPERATORS: Dict[type, Callable[[Any], Any]] = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+_COMPARE_OPERATORS: Dict[type, Callable[[Any, Any], Any]] = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.Gt: operator.gt,
+    ast.LtE: operator.le,
+    ast.GtE: operator.ge,
+}
+
+
+def _validate_comparison(formula_list: List, df: DataFrame) -> None:
+    """qualitativeの比較式の左辺と右辺の型を確認する関数
+
+    Args:
+        formula_list (List): 条件式を構成するリスト
+        df (DataFrame): データフレーム
+
+    Raises:
+        ValueError: 左辺がカラム名でない場合
+        TypeError: 左辺のカラムの型と右辺の値の型が一致しない場合
+    """
+
+    for i, item in enumerate(formula_list):
+        if item not in COMPARISON_OPERATORS:
+            continue
+
+        # 左側（カラム名）と右側（値）の確認
+        left = formula_list[i - 1]
+        right = formula_list[i + 1]
+
+        # 左側はカラム名であるべき
+        if left not in df.columns:
+            raise ValueError(f"'{left}' is not a valid column name in the data.")
+
+        # データ型に基づく処理
+        if pd.api.types.is_numeric_dtype(df[left]) and not isinstance(
+            right, (int, float)
+        ):
+            raise TypeError(
+                f"Expected numeric value on the right side of '==' for column '{left}', got '{right}'"
+            )
+        if (
+            pd.api.types.is_object_dtype(df[left])
+            or isinstance(df[left].dtype, pd.CategoricalDtype)
+        ) and not isinstance(right, str):
+            raise TypeError(
+                f"Expected string value on the right side of '==' for column '{left}', got '{right}'"
+            )
+
+
+def compile_formula(
+    formula_list: List, df: DataFrame, feature_type: str
+) -> Tuple[ast.Expression, Dict[str, str]]:
+    """計算式のリストを一度だけ構文木に変換する関数
+
+    カラム名は識別子（__col0, __col1, ...）に置き換えて構文木を作成し、
+    評価時にカラム全体（Series）を割り当てる。
+
+    Args:
+        formula_list (List): 計算式を保管しているリスト
+        df (DataFrame): データフレーム
+        feature_type (str): quantitative or qualitative
+
+    Returns:
+        Tuple[ast.Expression, Dict[str, str]]: 構文木と識別子からカラム名への対応
+    """
+
+    if feature_type == "quantitative":
+        operators = QUANTITATIVE_OPERATORS
+    else:
+        operators = QUALITATIVE_OPERATORS
+        _validate_comparison(formula_list, df)
+
+    names: Dict[str, str] = {}
+    parts = []
+    for item in formula_list:
+        if item in operators:  # 演算子の場合
+            parts.append(item)
+        elif item in df.columns:  # カラム名の場合
+            name = f"__col{len(names)}"
+            names[name] = item
+            parts.append(name)
+        elif feature_type != "quantitative" and isinstance(item, str):
+            parts.append(repr(item))
+        else:  # それ以外はそのまま追加
+            parts.append(str(item))
+
+    try:
+        tree = ast.parse(" ".join(parts), mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Invalid formula: {formula_list}") from e
+
+    return tree, names
+
+
+def _evaluate(node: ast.AST, columns: Dict[str, Series]) -> Tuple[Any, Any]:
+    """構文木をカラム単位で評価する関数
+
+    Args:
+        node (ast.AST): 構文木のノード
+        columns (Dict[str, Series]): 識別子とカラムの対応
+
+    Returns:
+        Tuple[Any, Any]: 評価結果と0除算が起こる行のマスク
+    """
+
+    if isinstance(node, ast.Name) and node.id in columns:
+        return columns[node.id], False
+
+    if isinstance(node, ast.Constant):
+        return node.value, False
+
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        value, mask = _evaluate(node.operand, columns)
+        return _UNARY_OPERATORS[type(node.op)](value), mask
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        left, left_mask = _evaluate(node.left, columns)
+        right, right_mask = _evaluate(node.right, columns)
+        mask = left_mask | right_mask
+        calculate = _BINARY_OPERATORS[type(node.op)]
+
+        if isinstance(node.op, (ast.Div, ast.Mod)):
+            # 0除算が起こる行を記録
+            mask = mask | (right == 0)
+            if not isinstance(right, Series) and right == 0:
+                return np.nan, mask
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return calculate(left, right), mask
+
+        return calculate(left, right), mask
+
+    if isinstance(node, ast.Compare) and all(
+        type(op) in _COMPARE_OPERATORS for op in node.ops
+    ):
+        left, mask = _evaluate(node.left, columns)
+        result: Any = True
+        for op, comparator in zip(node.ops, node.comparators):
+            right, right_mask = _evaluate(comparator, columns)
+            result = result & _COMPARE_OPERATORS[type(op)](left, right)
+            mask = mask | right_mask
+            left = right
+        return result, mask
+
+    if isinstance(node, ast.BoolOp) and isinstance(node.op, (ast.And, ast.Or)):
+        result, mask = _evaluate(node.values[0], columns)
+        for value_node in node.values[1:]:
+            value, value_mask = _evaluate(value_node, columns)
+            if isinstance(node.op, ast.And):
+                result = result & value
+            else:
+                result = result | value
+            mask = mask | value_mask
+        return result, mask
+
+    raise ValueError(f"Unsupported expression: {ast.dump(node)}")
+
+
+def evaluate_formula(
+    formula_list: List, df: DataFrame, feature_type: str
+) -> Tuple[Series, bool]:
+    """計算式をカラム単位で評価し、新しいカラムを作成する関数
+
+    Args:
+        formula_list (List): 計算式を保管しているリスト
+        df (DataFrame): データフレーム
+        feature_type (str): quantitative or qualitative
+
+    Returns:
+        Tuple[Series, bool]: 新しいカラムと0除算があったかどうか
+    """
+
+    tree, names = compile_formula(formula_list, df, feature_type)
+    # category型・Int64型のカラムは値ごとに演算できるよう従来の型に戻す
+    columns = {name: to_numpy_backed(df[column]) for name, column in names.items()}
+
+    result, mask = _evaluate(tree.body, columns)
+
+    # 定数のみの式の場合は全行に同じ値を入れる
+    if not isinstance(result, Series):
+        result = pd.Series(result, index=df.index)
+    if not isinstance(mask, Series):
+        mask = pd.Series(bool(mask), index=df.index)
+
+    divide_by_zero = bool(mask.any())
+
+    if feature_type == "quantitative":
+        # 0除算が起こる行は欠損値にする
+        if divide_by_zero:
+            result = result.where(~mask)
+        return result, divide_by_zero
+
+    return (
+        pd.Series(np.where(result, "True", "False"), index=df.index, dtype=object),
+        divide_by_zero,
+    )
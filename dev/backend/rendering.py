@@ -0,0 +1,60 @@
+import base64
+import io
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional, Tuple
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+@contextmanager
+def create_figure(figsize: Optional[Tuple[float, float]] = None) -> Iterator[Figure]:
+    """pyplotを使わずに描画用のFigureを作成する関数
+
+    Figureはpyplotに登録されないため、スレッドごとに独立して描画できる。
+    withブロックを抜けると図の要素を破棄し、メモリを確実に解放する。
+
+    Args:
+        figsize (Optional[Tuple[float, float]]): 図の大きさ（インチ）
+
+    Yields:
+        Iterator[Figure]: Agg キャンバスに紐づいたFigure
+    """
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    try:
+        yield fig
+    finally:
+        fig.clear()
+
+
+def figure_to_image(fig: Figure, fmt: str = "png", **kwargs: Any) -> bytes:
+    """Figureを画像に変換する関数
+
+    Args:
+        fig (Figure): 描画済みのFigure
+        fmt (str): 画像形式（png, webp, svg）
+        **kwargs (Any): savefigに渡す引数（dpi, bbox_inchesなど）
+
+    Returns:
+        bytes: 画像データ
+    """
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format=fmt, **kwargs)
+    return buf.getvalue()
+
+
+def figure_to_base64(fig: Figure, **kwargs: Any) -> str:
+    """FigureをPNG画像にしてBase64エンコードする関数
+
+    Args:
+        fig (Figure): 描画済みのFigure
+        **kwargs (Any): savefigに渡す引数（dpi, bbox_inchesなど）
+
+    Returns:
+        str: 画像データをBase64エンコードした文字列
+    """
+
+    return base64.b64encode(figure_to_image(fig, "png", **kwargs)).decode()
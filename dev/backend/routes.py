@@ -1,38 +1,47 @@
 import base64
-import io
 import json
 import os
 import shutil
-from typing import Any, Dict, List
+import time
+from typing import Any, Dict, List, Optional
 
 import google.generativeai as GEMINI
+import numpy as np
 import pandas as pd
 import requests
-from data_plt import (
-    plot_box,
-    plot_hist,
-    plot_scatter,
-    read_qualitative,
-    read_quantitative,
-)
+from column_dtypes import downcast_dtypes
 from data_utils import (
     change_umeric_to_categorical,
+    check_impute_plan,
     extraction_df,
-    feature_value_analysis,
-    get_data_info,
-    get_miss_columns,
     impute_categorical,
+    impute_columns,
     impute_numeric,
     make_feature_value,
-    make_pie,
-    set_dtypes,
 )
 from dotenv import load_dotenv
+from feature_importance import ANALYSIS_ENGINE, IMPORTANCE_ENGINES
 from flask import jsonify, request
 from flask.wrappers import Response
 from read_CSV import read
-from src.backend.chats import save_chat
-from src.backend.csvs import get_csv, update_csv
+from src.backend.analysis import analysis_jobs
+from src.backend.cache import chart_cache, dataframe_cache, feature_cache
+from src.backend.charts import get_chart, make_chart_response
+from src.backend.chats import chat_writer
+from src.backend.csvs import (
+    get_csv,
+    get_profile,
+    patch_compactor,
+    update_column,
+    update_columns,
+)
+from src.backend.gemini import gemini_clients
+from src.backend.go_api import go_api
+from src.backend.llm_cache import llm_cache, make_key
+from src.backend.profile import build_profile, encode_profile, profile_store
+from src.backend.storage import make_payload, use_parquet
+from src.backend.streaming import stream_text, wants_stream
+from src.backend.uploads import MultipartStream, read_csv_stream, stream_size
 
 # 環境変数を読み込む
 load_dotenv()
@@ -40,8 +49,6 @@ load_dotenv()
 # データアップロード先の定義
 UPLOAD_PATH = "./uploads"
 
-GO_API_URL = os.getenv("DB_API_URL")
-
 
 def setup_routes(app):
     # テスト
@@ -83,39 +90,57 @@ def setup_routes(app):
         user_id = json_data["user_id"]
         csv_id = json_data["csv_id"]
 
-        # CSVデータを直接読み込み
-        csv_data = file.read().decode("utf-8")  # バイトデータを文字列に変換
-        df = pd.read_csv(
-            io.StringIO(csv_data),
-            na_values=["null", ""],  # ここでnullや空文字をNaNとして認識
-            keep_default_na=True,  # デフォルトのNaN認識を保持
-        )  # データフレームに変換
-
-        dtypes = {col: str(dtype) for col, dtype in df.dtypes.items()}
-
-        files = {
-            "csv_file": ("data.csv", csv_data.encode("utf-8"), "text/csv"),
-            "json_file": (
-                "data.json",
-                json.dumps(dtypes).encode("utf-8"),
-                "application/json",
-            ),
-        }
-
-        # csvを保存する際の情報を取得
-        form_data = extraction_df(
-            df=df, filename=file.filename, user_id=user_id, csv_id=csv_id
+        # werkzeugが大きなリクエストボディを一時ファイルに書き出しているため、
+        # 文字列に変換せずにストリームから直接読み込む
+        stream = file.stream
+        data_size = stream_size(stream)
+        try:
+            df = read_csv_stream(stream)
+        except (
+            UnicodeDecodeError,
+            pd.errors.ParserError,
+            pd.errors.EmptyDataError,
+        ) as e:
+            print("Error parsing CSV data:", str(e))
+            return jsonify({"error": "Error parsing CSV data", "details": str(e)}), 400
+
+        # ユニークな値が少ない文字列のカラムはcategory型にする（保存する型情報にも反映される）
+        df = downcast_dtypes(df)
+
+        # 保存形式（ParquetもしくはCSV）に変換し、プロファイルも合わせて作成
+        # （CSV形式で保存する場合はアップロードされたバイト列をそのまま送る）
+        profile = build_profile(df)
+        csv_file = None if use_parquet() else ("data.csv", stream, "text/csv")
+        files, data_info = make_payload(
+            df,
+            profile_file=encode_profile(profile),
+            csv_file=csv_file,
+            data_size=data_size,
         )
 
-        proxies = {"http": None, "https": None}  # 大学で行うときはここを有効に
-        response = requests.post(
-            f"{GO_API_URL}/upload_csv",
-            files=files,
-            data=form_data,
-            proxies=proxies,
+        # csvを保存する際の情報を取得（大きさはアップロードされたバイト数）
+        form_data = extraction_df(
+            filename=file.filename,
+            user_id=user_id,
+            csv_id=csv_id,
+            data_info=data_info,
         )
 
+        try:
+            # 一時ファイルから読みながら送信する
+            body = MultipartStream(fields=form_data, files=files)
+            response = go_api.post("/upload_csv", data=body, headers=body.headers)
+        except requests.exceptions.RequestException as e:
+            print("Request Error:", str(e))
+            return jsonify({"error": "Failed to upload data to Go API"}), 500
+
+        # 同じcsv_idで再アップロードされた場合に備えてキャッシュを破棄
+        dataframe_cache.invalidate(csv_id)
+        chart_cache.invalidate(csv_id)
+        feature_cache.invalidate(csv_id)
+
         if response.status_code == 200:
+            profile_store.put(csv_id, dataframe_cache.get_version(csv_id), profile)
             return (
                 jsonify({"message": f"File {file.filename} uploaded successfully"}),
                 200,
@@ -131,6 +156,182 @@ def setup_routes(app):
                 print(f"エラーレスポンス: {response.text}")
             return jsonify({"error": "Failed to upload data to Go API"}), 500
 
+    @app.route("/download_csv/<csv_id>", methods=["GET"])
+    def download_csv(csv_id: str):
+        """
+        説明
+        ----------
+        データをCSV形式でダウンロードするapi
+        データベースにはParquet形式と統合前の列ごとの差分で保存されている場合があるため、
+        差分を適用した最新のデータをCSV形式に変換して返す
+
+        Request
+        ----------
+        csv_id : str（URLのパス）
+
+        Response
+        ----------
+        text/csv
+            CSVファイル（エラーの場合はJSON）
+
+        """
+
+        data = get_csv(csv_id=csv_id)
+
+        if isinstance(data[1], int):
+            return data  # エラーの場合（レスポンスとステータスコード）はそのまま返す
+
+        df, _ = data
+        response = Response(df.to_csv(index=False).encode("utf-8"), mimetype="text/csv")
+        response.headers["Content-Disposition"] = f'attachment; filename="{csv_id}.csv"'
+        return response
+
+    @app.route("/get_cache_stats", methods=["GET"])
+    def get_cache_stats():
+        """
+        説明
+        ----------
+        DataFrameキャッシュの統計情報を取得するapi
+
+        Request
+        ----------
+        None
+
+        Response
+        ----------
+        send_data : Dict[str, int]
+            ヒット数、ミス数、追い出し数、使用メモリ量など
+            （chartsにグラフキャッシュ、featuresにエンコード済みの特徴量のキャッシュの統計情報）
+
+        """
+
+        send_data = dataframe_cache.stats()
+        send_data["charts"] = chart_cache.stats()
+        send_data["features"] = feature_cache.stats()
+
+        return jsonify(send_data), 200
+
+    @app.route("/get_go_api_stats", methods=["GET"])
+    def get_go_api_stats():
+        """
+        説明
+        ----------
+        GoのデータベースAPIの呼び出し統計を取得するapi
+
+        Request
+        ----------
+        None
+
+        Response
+        ----------
+        send_data : Dict[str, Dict[str, Any]]
+            エンドポイントごとの呼び出し回数、エラー数、再試行回数、
+            レイテンシ（平均、p50、p95、最大、ミリ秒）
+
+        """
+
+        return jsonify(go_api.stats()), 200
+
+    @app.route("/get_chat_queue_stats", methods=["GET"])
+    def get_chat_queue_stats():
+        """
+        説明
+        ----------
+        chatの保存待ちキューの統計情報を取得するapi
+
+        Request
+        ----------
+        None
+
+        Response
+        ----------
+        send_data : Dict[str, int]
+            保存待ちの件数、保存した件数、一括保存の回数、再試行回数、破棄した件数など
+
+        """
+
+        return jsonify(chat_writer.stats()), 200
+
+    @app.route("/get_gemini_client_stats", methods=["GET"])
+    def get_gemini_client_stats():
+        """
+        説明
+        ----------
+        GeminiのAPIキーとクライアントのキャッシュの統計情報を取得するapi
+
+        Request
+        ----------
+        None
+
+        Response
+        ----------
+        send_data : Dict[str, Any]
+            ヒット数、ミス数、ヒット率、期限切れ数、保持しているユーザー数など
+
+        """
+
+        return jsonify(gemini_clients.stats()), 200
+
+    @app.route("/get_compaction_stats", methods=["GET"])
+    def get_compaction_stats():
+        """
+        説明
+        ----------
+        カラムごとの更新差分の統合の統計情報を取得するapi
+
+        Request
+        ----------
+        None
+
+        Response
+        ----------
+        send_data : Dict[str, Any]
+            統合待ちの件数、統合した回数、既に統合済みだった回数、失敗した回数など
+
+        """
+
+        return jsonify(patch_compactor.stats()), 200
+
+    @app.route("/get_analysis_job_stats", methods=["GET"])
+    def get_analysis_job_stats():
+        """
+        説明
+        ----------
+        特徴量分析のジョブの統計情報を取得するapi
+
+        Request
+        ----------
+        None
+
+        Response
+        ----------
+        send_data : Dict[str, int]
+            待ち・実行中の件数、登録した件数、まとめた件数、完了・失敗した件数など
+
+        """
+
+        return jsonify(analysis_jobs.stats()), 200
+
+    @app.route("/get_llm_cache_stats", methods=["GET"])
+    def get_llm_cache_stats():
+        """
+        説明
+        ----------
+        Geminiの応答のキャッシュの統計情報を取得するapi
+
+        Request
+        ----------
+        None
+
+        Response
+        ----------
+        send_data : Dict[str, Any]
+            ヒット数、ファイルからのヒット数、ミス数、ヒット率、保持している応答数など
+
+        """
+
+        return jsonify(llm_cache.stats()), 200
+
     # 今後不要になる
     @app.route("/clear-uploads", methods=["POST"])
     def clear_uploads():
@@ -210,17 +411,12 @@ def setup_routes(app):
         # csv取得
         json_data = request.get_json()
         csv_id = json_data["csv_id"]
-        data = get_csv(csv_id=csv_id)
-
-        if type(data) == dict:
-            return data  # もし辞書型の場合はエラー
-
-        df, dtypes = data
+        profile = get_profile(csv_id=csv_id)
 
-        # dfの型適応
-        df = set_dtypes(df=df, dtypes=dtypes)
+        if isinstance(profile, tuple):
+            return profile  # エラーの場合はそのまま返す
 
-        quantitative_list = read_quantitative(df=df)
+        quantitative_list = profile["quantitative_variables"]
 
         return jsonify({"quantitative_variables": quantitative_list}), 200
 
@@ -245,17 +441,12 @@ def setup_routes(app):
         # csv取得
         json_data = request.get_json()
         csv_id = json_data["csv_id"]
-        data = get_csv(csv_id=csv_id)
-
-        if type(data) == dict:
-            return data  # もし辞書型の場合はエラー
-
-        df, dtypes = data
+        profile = get_profile(csv_id=csv_id)
 
-        # dfの型適応
-        df = set_dtypes(df=df, dtypes=dtypes)
+        if isinstance(profile, tuple):
+            return profile  # エラーの場合はそのまま返す
 
-        qualitative_list = read_qualitative(df=df)
+        qualitative_list = profile["qualitative_variables"]
 
         return jsonify({"qualitative_variables": qualitative_list})
 
@@ -278,27 +469,33 @@ def setup_routes(app):
         json_data = request.get_json()
         csv_id = json_data["csv_id"]
 
-        # CSVデータの取得
-        data = get_csv(csv_id=csv_id)
-        if isinstance(data, dict):
-            return data  # エラーの場合はそのまま返す
+        # プロファイルの取得
+        profile = get_profile(csv_id=csv_id)
+        if isinstance(profile, tuple):
+            return profile  # エラーの場合はそのまま返す
 
-        df, dtypes = data
+        qualitative_values = profile["qualitative_values"]
 
-        # 型適応
-        df = set_dtypes(df=df, dtypes=dtypes)
+        # ユニークな値が上限を超えて打ち切られている場合のみデータを読み込む
+        if any(values["truncated"] for values in qualitative_values.values()):
+            data = get_csv(csv_id=csv_id)
+            if isinstance(data[1], int):
+                return data  # エラーの場合はそのまま返す
 
-        # 質的変数の取得
-        qualitative_columns = read_qualitative(df=df)
+            df, dtypes = data
 
-        # 質的変数とユニーク値の辞書作成
-        qualitative_dict = {
-            col: df[col].dropna().unique().tolist() for col in qualitative_columns
-        }
+            # 質的変数とユニーク値の辞書作成
+            qualitative_dict = {
+                col: df[col].dropna().unique().tolist() for col in qualitative_values
+            }
+        else:
+            qualitative_dict = {
+                col: values["values"] for col, values in qualitative_values.items()
+            }
 
         return jsonify({"qualitative_variables": qualitative_dict})
 
-    @app.route("/scatter", methods=["POST"])
+    @app.route("/scatter", methods=["GET", "POST"])
     def make_scatter():
         """
         説明
@@ -313,27 +510,21 @@ def setup_routes(app):
         ----------
         image_data : str
             画像データをBase64エンコードされたバイト列をUTF-8でエンコーディングした文字列
+            （Acceptでimage/png, image/webp, image/svg+xmlを指定した場合は画像をそのまま返す）
 
         """
 
-        # csv取得
-        json_data = request.get_json()
+        # パラメータ取得（GETの場合はクエリパラメータから取得）
+        if request.method == "GET":
+            json_data = request.args.to_dict()
+        else:
+            json_data = request.get_json()
         csv_id = json_data["csv_id"]
-        data = get_csv(csv_id=csv_id)
-
-        if type(data) == dict:
-            return data  # もし辞書型の場合はエラー
-
-        df, dtypes = data
-
-        # dfの型適応
-        df = set_dtypes(df=df, dtypes=dtypes)
-
-        image_data = plot_scatter(json_data, df)
 
-        return jsonify({"image_data": image_data})
+        # 描画済みのグラフがあればキャッシュから返す
+        return make_chart_response(csv_id=csv_id, endpoint="scatter", params=json_data)
 
-    @app.route("/hist", methods=["POST"])
+    @app.route("/hist", methods=["GET", "POST"])
     def make_hist():
         """
         説明
@@ -348,27 +539,21 @@ def setup_routes(app):
         ----------
         image_data : str
             画像データをBase64エンコードされたバイト列をUTF-8でエンコーディングした文字列
+            （Acceptでimage/png, image/webp, image/svg+xmlを指定した場合は画像をそのまま返す）
 
         """
 
-        # csv取得
-        json_data = request.get_json()
+        # パラメータ取得（GETの場合はクエリパラメータから取得）
+        if request.method == "GET":
+            json_data = request.args.to_dict()
+        else:
+            json_data = request.get_json()
         csv_id = json_data["csv_id"]
-        data = get_csv(csv_id=csv_id)
-
-        if type(data) == dict:
-            return data  # もし辞書型の場合はエラー
-
-        df, dtypes = data
-
-        # dfの型適応
-        df = set_dtypes(df=df, dtypes=dtypes)
 
-        image_data = plot_hist(json_data, df)
+        # 描画済みのグラフがあればキャッシュから返す
+        return make_chart_response(csv_id=csv_id, endpoint="hist", params=json_data)
 
-        return jsonify({"image_data": image_data})
-
-    @app.route("/box", methods=["POST"])
+    @app.route("/box", methods=["GET", "POST"])
     def make_box():
         """
         説明
@@ -383,25 +568,19 @@ def setup_routes(app):
         ----------
         image_data : str
             画像データをBase64エンコードされたバイト列をUTF-8でエンコーディングした文字列
+            （Acceptでimage/png, image/webp, image/svg+xmlを指定した場合は画像をそのまま返す）
 
         """
 
-        # csv取得
-        json_data = request.get_json()
+        # パラメータ取得（GETの場合はクエリパラメータから取得）
+        if request.method == "GET":
+            json_data = request.args.to_dict()
+        else:
+            json_data = request.get_json()
         csv_id = json_data["csv_id"]
-        data = get_csv(csv_id=csv_id)
-
-        if type(data) == dict:
-            return data  # もし辞書型の場合はエラー
-
-        df, dtypes = data
 
-        # dfの型適応
-        df = set_dtypes(df=df, dtypes=dtypes)
-
-        image_data = plot_box(json_data, df)
-
-        return jsonify({"image_data": image_data})
+        # 描画済みのグラフがあればキャッシュから返す
+        return make_chart_response(csv_id=csv_id, endpoint="box", params=json_data)
 
     # データの基本情報の取得
     @app.route("/get_data_info", methods=["POST"])
@@ -425,17 +604,12 @@ def setup_routes(app):
         # csv取得
         json_data = request.get_json()
         csv_id = json_data["csv_id"]
-        data = get_csv(csv_id=csv_id)
-
-        if type(data[0]) == Response:
-            return data  # もし辞書型の場合はエラー
+        profile = get_profile(csv_id=csv_id)
 
-        df, dtypes = data
-
-        # dfの型適応
-        df = set_dtypes(df=df, dtypes=dtypes)
+        if isinstance(profile, tuple):
+            return profile  # エラーの場合はそのまま返す
 
-        send_data = get_data_info(df=df)
+        send_data = profile["data_info"]
 
         return jsonify(send_data)
 
@@ -460,17 +634,12 @@ def setup_routes(app):
         # csv取得
         json_data = request.get_json()
         csv_id = json_data["csv_id"]
-        data = get_csv(csv_id=csv_id)
-
-        if type(data) == dict:
-            return data  # もし辞書型の場合はエラー
+        profile = get_profile(csv_id=csv_id)
 
-        df, dtypes = data
-
-        # dfの型適応
-        df = set_dtypes(df=df, dtypes=dtypes)
+        if isinstance(profile, tuple):
+            return profile  # エラーの場合はそのまま返す
 
-        send_data = get_miss_columns(df=df)
+        send_data = profile["miss_columns"]
 
         return jsonify(send_data)
 
@@ -497,22 +666,19 @@ def setup_routes(app):
         csv_id = json_data["csv_id"]
         data = get_csv(csv_id=csv_id)
 
-        if type(data) == dict:
-            return data  # もし辞書型の場合はエラー
+        if isinstance(data[1], int):
+            return data  # エラーの場合（レスポンスとステータスコード）はそのまま返す
 
         df, dtypes = data
 
-        # dfの型適応
-        df = set_dtypes(df=df, dtypes=dtypes)
-
         df = change_umeric_to_categorical(json_data, df)
 
-        # csvファイルを更新
-        message = update_csv(csv_id=csv_id, df=df)
+        # csvファイルを更新（変換したカラムのみを差分として保存）
+        message = update_column(csv_id=csv_id, df=df, column=json_data["column_name"])
 
         return message
 
-    @app.route("/get_pie", methods=["POST"])
+    @app.route("/get_pie", methods=["GET", "POST"])
     def get_pie():
         """
         説明
@@ -527,25 +693,19 @@ def setup_routes(app):
         ----------
         send_data : dict[str, str]
             バイナリデータ
+            （Acceptでimage/png, image/webp, image/svg+xmlを指定した場合は画像をそのまま返す）
 
         """
 
-        # csv取得
-        json_data = request.get_json()
+        # パラメータ取得（GETの場合はクエリパラメータから取得）
+        if request.method == "GET":
+            json_data = request.args.to_dict()
+        else:
+            json_data = request.get_json()
         csv_id = json_data["csv_id"]
-        data = get_csv(csv_id=csv_id)
-
-        if type(data) == dict:
-            return data  # もし辞書型の場合はエラー
 
-        df, dtypes = data
-
-        # dfの型適応
-        df = set_dtypes(df=df, dtypes=dtypes)
-
-        image_data = make_pie(json_data, df)
-
-        return jsonify({"image_data": image_data})
+        # 描画済みのグラフがあればキャッシュから返す
+        return make_chart_response(csv_id=csv_id, endpoint="pie", params=json_data)
 
     # 今後不要になる
     @app.route("/read-csv", methods=["GET"])
@@ -580,31 +740,22 @@ def setup_routes(app):
         Request
         ----------
         Dict[str, List[Dict[str, str]]]
+            streamがtrueの場合（もしくはAccept: text/event-stream）はストリーミングで返す
+            refreshがtrueの場合はキャッシュされた応答を使わずに生成し直す
 
         Response
         ----------
         send_data : str
             回答文章
+            （ストリーミングの場合はServer-Sent Eventsでchunkイベントごとに差分、
+            最後にdoneイベントで{"reply": 全文}を返す）
 
         """
 
-        model = GEMINI.GenerativeModel("gemini-pro")
-
         data: Dict[str, List[Dict[str, str]]] = request.get_json()
 
         user_id = data.get("user_id")
-
-        proxies = {"http": None, "https": None}  # 大学で行うときはここを有効に
-        response = requests.post(
-            f"{GO_API_URL}/users/get/api",
-            json={"user_id": user_id},
-            proxies=proxies,
-        )
-
-        response = response.json()
-
-        GEMINI_API_KEY = response.get("GeminiApiKey")
-        GEMINI.configure(api_key=GEMINI_API_KEY)
+        model_name = "gemini-pro"
 
         message = data.get("message")
         user_message = data.get("user_message")
@@ -612,22 +763,50 @@ def setup_routes(app):
         post_id = data.get("post_id")
         if not message:
             return jsonify({"reply": "メッセージが空です。"}), 400
-        try:
-            reply = model.generate_content(message)
-            # databaseに保存
-            user_response = save_chat(
+
+        def save_chats(reply_text: str) -> None:
+            chat_writer.enqueue(
                 room_id=room_id, user_chat=True, message=user_message, post_id=post_id
             )
-            print(user_response)
-            bot_response = save_chat(
+            chat_writer.enqueue(
                 room_id=room_id,
                 user_chat=False,
-                message=reply.text,
+                message=reply_text,
                 post_id=post_id + 1,
             )
-            print(bot_response)
+
+        # 同じ内容への応答があれば生成せずに返す（履歴は通常どおり保存する）
+        cache_key = make_key(model_name, message)
+        cached = None if data.get("refresh") else llm_cache.get(cache_key)
+        if cached is not None:
+            if wants_stream(data):
+                return stream_text([cached], key="reply", on_complete=save_chats)
+            save_chats(cached)
+            return jsonify({"reply": cached})
+
+        def complete(reply_text: str) -> None:
+            llm_cache.put(cache_key, model_name, reply_text)
+            save_chats(reply_text)
+
+        try:
+            # ユーザーのAPIキーを設定したモデル（APIキーはTTLの間キャッシュされる）
+            model = gemini_clients.get_model(user_id=user_id, model_name=model_name)
+        except requests.exceptions.RequestException as e:
+            print("Request Error:", str(e))
+            return jsonify({"reply": "APIキーの取得に失敗しました。"}), 500
+
+        try:
+            if wants_stream(data):
+                # 生成された部分から順に返し、完了後に保存する
+                chunks = model.generate_content(message, stream=True)
+                return stream_text(chunks, key="reply", on_complete=complete)
+
+            reply = model.generate_content(message)
+            # databaseへの保存はバックグラウンドで行い、回答をすぐに返す
+            complete(reply.text)
             return jsonify({"reply": reply.text})
         except Exception as e:
+            gemini_clients.invalidate_on_error(user_id, e)
             return jsonify({"reply": f"エラーが発生しました: {str(e)}"}), 500
 
     @app.route("/make_feature", methods=["POST"])
@@ -654,21 +833,20 @@ def setup_routes(app):
         first = json_data["first"]
         data = get_csv(csv_id=csv_id)
 
-        if type(data) == dict:
-            return data  # もし辞書型の場合はエラー
+        if isinstance(data[1], int):
+            return data  # エラーの場合（レスポンスとステータスコード）はそのまま返す
 
         df, dtypes = data
 
-        # dfの型適応
-        df = set_dtypes(df=df, dtypes=dtypes)
-
         df, Divide_By_Zero = make_feature_value(json_data, df=df)
 
         if Divide_By_Zero and first:  # ゼロ除算がある場合
             return jsonify({"message": "judge"})
 
-        # postgresqlに保存
-        message = update_csv(csv_id=csv_id, df=df)
+        # postgresqlに保存（追加したカラムのみを差分として保存）
+        message = update_column(
+            csv_id=csv_id, df=df, column=json_data["new_column_name"]
+        )
 
         return message
 
@@ -677,37 +855,79 @@ def setup_routes(app):
         """
         説明
         ----------
-        特定の特徴量についての分析するapi
+        特定の特徴量についての分析を依頼するapi
+        ランダムフォレストの学習はワーカープロセスで行い、すぐにジョブのidを返す
+        同じデータ・同じカラム・同じ計算方法の分析が既にある場合はそのジョブ（終わっていれば結果）を返す
 
         Request
         ----------
         Dict[str, str]
+            csv_id, column_name（目的変数のカラム名）
+            engine（重要度の計算方法、省略可）: random_forest, hist_gradient_boosting, permutation
 
         Response
         ----------
-        send_data : dict[str, str]
-            ランダムフォレストで特徴量を分析する
+        send_data : Dict[str, Any]
+            job_id, status（queued, running, done, failed）
+            終わっている場合はimage_dataとtraining（学習に使った行数、上限に達した設定など）も返す
 
         """
 
-        # csv取得
         json_data = request.get_json()
         csv_id = json_data["csv_id"]
-        data = get_csv(csv_id=csv_id)
+        column_name = json_data["column_name"]
+        engine = json_data.get("engine") or ANALYSIS_ENGINE
+        if engine not in IMPORTANCE_ENGINES:
+            return jsonify({"error": f"{engine}という計算方法はありません"}), 400
 
-        if type(data) == dict:
-            return data  # もし辞書型の場合はエラー
+        # 同じデータ・同じカラム・同じ計算方法のジョブがあればcsvを読み込まずに返す
+        key = (csv_id, dataframe_cache.get_version(csv_id), column_name, engine)
+        job = analysis_jobs.find(key)
+        if job is None:
+            # csv取得
+            data = get_csv(csv_id=csv_id)
 
-        df, dtypes = data
+            if isinstance(data[1], int):
+                return data  # エラーの場合はそのまま返す
 
-        # dfの型適応
-        df = set_dtypes(df=df, dtypes=dtypes)
+            df, dtypes = data
+            if column_name not in df.columns:
+                return jsonify({"error": f"{column_name}が見つかりません"}), 400
 
-        # data: Dict[str, str] = request.get_json()
+            try:
+                job = analysis_jobs.submit(key, df)
+            except Exception as e:
+                return jsonify({"error": f"エラーが発生しました: {str(e)}"}), 500
+
+        return jsonify(job), 200 if job["status"] == "done" else 202
+
+    @app.route("/feature_analysis/<job_id>", methods=["GET"])
+    def get_feature_analysis(job_id: str):
+        """
+        説明
+        ----------
+        特徴量分析のジョブの状態と結果を取得するapi
+
+        Request
+        ----------
+        job_id : str
+            /feature_analysisで返されたジョブのid
 
-        image_data = feature_value_analysis(json_data, df)
+        Response
+        ----------
+        send_data : Dict[str, Any]
+            job_id, status（queued, running, done, failed）, elapsed（経過秒数）
+            待っている場合はposition（前に待っているジョブの数）
+            終わっている場合はimage_dataとtraining、失敗した場合はerror
+
+        """
 
-        return jsonify({"image_data": image_data})
+        job = analysis_jobs.get(job_id)
+        if job is None:
+            return jsonify({"error": "ジョブが見つかりません"}), 404
+        if job["status"] == "failed":
+            return jsonify(job), 500
+        return jsonify(job), 200
 
     @app.route("/complement/numeric", methods=["POST"])
     def complement_numeric():
@@ -730,23 +950,21 @@ def setup_routes(app):
         # csv取得
         json_data = request.get_json()
         csv_id = json_data["csv_id"]
-        data = get_csv(csv_id=csv_id)
+        column = json_data["column_name"]
+        # 補完するカラムのみを読み込む
+        data = get_csv(csv_id=csv_id, columns=[column])
 
-        if type(data) == dict:
-            return data  # もし辞書型の場合はエラー
+        if isinstance(data[1], int):
+            return data  # エラーの場合（レスポンスとステータスコード）はそのまま返す
 
         df, dtypes = data
 
-        # dfの型適応
-        df = set_dtypes(df=df, dtypes=dtypes)
-
-        column = json_data["column_name"]
         methods = json_data["complementary_methods"]
 
         df = impute_numeric(column, methods, df)
 
-        # postgresqlに保存
-        message = update_csv(csv_id=csv_id, df=df)
+        # postgresqlに保存（補完したカラムのみを差分として保存）
+        message = update_column(csv_id=csv_id, df=df, column=column, dtypes=dtypes)
 
         return message
 
@@ -771,28 +989,96 @@ def setup_routes(app):
         # csv取得
         json_data = request.get_json()
         csv_id = json_data["csv_id"]
-        data = get_csv(csv_id=csv_id)
+        column = json_data["column_name"]
+        # 補完するカラムのみを読み込む
+        data = get_csv(csv_id=csv_id, columns=[column])
 
-        if type(data) == dict:
-            return data  # もし辞書型の場合はエラー
+        if isinstance(data[1], int):
+            return data  # エラーの場合（レスポンスとステータスコード）はそのまま返す
 
         df, dtypes = data
 
-        # dfの型適応
-        df = set_dtypes(df=df, dtypes=dtypes)
-
         # data: Dict[str, str] = request.get_json()
 
-        column = json_data["column_name"]
         methods = json_data["complementary_methods"]
 
         df = impute_categorical(column, methods, df)
 
-        # postgresqlに保存
-        message = update_csv(csv_id=csv_id, df=df)
+        # postgresqlに保存（補完したカラムのみを差分として保存）
+        message = update_column(csv_id=csv_id, df=df, column=column, dtypes=dtypes)
 
         return message
 
+    @app.route("/complement/batch", methods=["POST"])
+    def complement_batch():
+        """
+        説明
+        ----------
+        複数のカラムの欠損値をまとめて補完するapi
+        補完するカラムのみを1回で読み込み、補完したカラムを1つの差分として1回で保存する
+        数値型のカラムは数値データ、文字列・カテゴリのカラムは質的データの方法で補完する
+
+        Request
+        ----------
+        Dict[str, Any]
+            csv_id
+            plan : Dict[str, str]（カラム名と補完の方法）
+            seed : int（ホットデッキ法の乱数のシード、省略時は0）
+
+        Response
+        ----------
+        send_data : Dict[str, Any]
+            補完が完了したことを伝えるメッセージ、
+            timings（カラムごとの補完にかかった時間（ミリ秒））、
+            load_ms, impute_ms, save_ms（読み込み・補完・保存にかかった時間（ミリ秒））
+
+        """
+
+        json_data = request.get_json()
+        csv_id = json_data["csv_id"]
+        plan: Dict[str, str] = json_data.get("plan") or {}
+        if not plan:
+            return jsonify({"error": "補完するカラムがありません"}), 400
+
+        # 補完するカラムのみを読み込む
+        started = time.perf_counter()
+        data = get_csv(csv_id=csv_id, columns=list(plan))
+
+        # 存在しないカラムを指定された場合などは(エラー, ステータスコード)が返る
+        if isinstance(data[1], int):
+            return data  # エラーの場合（レスポンスとステータスコード）はそのまま返す
+
+        df, dtypes = data
+        load_ms = (time.perf_counter() - started) * 1000
+
+        invalid = check_impute_plan(plan, df)
+        if invalid:
+            return jsonify(
+                {"error": "補完できないカラムがあります", "columns": invalid}
+            ), 400
+
+        started = time.perf_counter()
+        rng = np.random.default_rng(json_data.get("seed", 0))
+        timings = impute_columns(plan, df, rng)
+        impute_ms = (time.perf_counter() - started) * 1000
+
+        # postgresqlに保存（補完したカラムをまとめて1つの差分として保存）
+        started = time.perf_counter()
+        message = update_columns(
+            csv_id=csv_id, df=df, columns=list(plan), dtypes=dtypes
+        )
+        save_ms = (time.perf_counter() - started) * 1000
+
+        if not isinstance(message, tuple) or message[1] != 200:
+            return message  # エラーの場合はそのまま返す
+
+        send_data = message[0].get_json()
+        send_data["timings"] = timings
+        send_data["load_ms"] = round(load_ms, 3)
+        send_data["impute_ms"] = round(impute_ms, 3)
+        send_data["save_ms"] = round(save_ms, 3)
+        return jsonify(send_data), 200
+
     @app.route("/gemini/image", methods=["POST"])
     def gemini_image():
         """
@@ -802,35 +1088,45 @@ def setup_routes(app):
 
         Request
         ----------
-        Dict[str, str]
+        Dict[str, Any]
+            image_data（Base64エンコードされた画像）もしくは
+            chart（endpointとグラフのパラメータ）を指定する
+            streamがtrueの場合（もしくはAccept: text/event-stream）はストリーミングで返す
+            refreshがtrueの場合はキャッシュされた応答を使わずに生成し直す
 
         Response
         ----------
         send_data : dict[str, str]
             画像解析結果の回答
+            （ストリーミングの場合はServer-Sent Eventsでchunkイベントごとに差分、
+            最後にdoneイベントで{"text": 全文}を返す）
 
         """
 
+        # リクエストの読み込みに失敗した場合はuser_idが無いまま例外の処理に進む
+        user_id: Optional[str] = None
         try:
-            model = GEMINI.GenerativeModel("gemini-1.5-flash")
-            data: Dict[str, str] = request.get_json()
+            data: Dict[str, Any] = request.get_json()
 
             user_id = data.get("user_id")
+            model_name = "gemini-1.5-flash"
 
-            proxies = {"http": None, "https": None}  # 大学で行うときはここを有効に
-            response = requests.post(
-                f"{GO_API_URL}/users/get/api",
-                json={"user_id": user_id},
-                proxies=proxies,
-            )
-
-            response = response.json()
+            room_id = data["room_id"]
 
-            GEMINI_API_KEY = response.get("GeminiApiKey")
-            GEMINI.configure(api_key=GEMINI_API_KEY)
+            if "image_data" in data:
+                image_data = data["image_data"]
+            else:
+                # グラフのパラメータが渡された場合はBase64を経由せずに画像を取得
+                chart = data["chart"]
+                rendered = get_chart(
+                    csv_id=chart["csv_id"],
+                    endpoint=chart["endpoint"],
+                    params={k: v for k, v in chart.items() if k != "endpoint"},
+                )
+                if not isinstance(rendered[0], bytes):
+                    return rendered  # エラーの場合はそのまま返す
+                image_data = rendered[0]
 
-            image_data = data["image_data"]
-            room_id = data["room_id"]
             cookie_picture = {"mime_type": "image/png", "data": image_data}
 
             prompt = """
@@ -839,20 +1135,51 @@ def setup_routes(app):
             Let's first understand the problem and devise a plan to solve the problem.
             Then, let's carry out the plan and solve the problem step by step.
             """
-            response = model.generate_content(
-                contents=[prompt, cookie_picture],
-                generation_config=GEMINI.types.GenerationConfig(
-                    candidate_count=1, temperature=1.0
-                ),
-            )
+            generation_config = {"candidate_count": 1, "temperature": 1.0}
+            contents = [prompt, cookie_picture]
+
+            def save_chats(text: str) -> None:
+                chat_writer.enqueue(
+                    room_id=room_id, user_chat=False, message=text, post_id=0
+                )
+
+            # 同じグラフの解析結果があれば生成せずに返す（履歴は通常どおり保存する）
+            cache_key = make_key(model_name, contents, generation_config)
+            cached = None if data.get("refresh") else llm_cache.get(cache_key)
+            if cached is not None:
+                if wants_stream(data):
+                    return stream_text([cached], key="text", on_complete=save_chats)
+                save_chats(cached)
+                return jsonify({"text": cached}), 200
+
+            def complete(text: str) -> None:
+                llm_cache.put(cache_key, model_name, text)
+                save_chats(text)
+
+            # ユーザーのAPIキーを設定したモデル（APIキーはTTLの間キャッシュされる）
+            model = gemini_clients.get_model(user_id=user_id, model_name=model_name)
+
+            if wants_stream(data):
+                # 生成された部分から順に返し、完了後に保存する
+                chunks = model.generate_content(
+                    contents=contents,
+                    generation_config=GEMINI.types.GenerationConfig(
+                        **generation_config
+                    ),
+                    stream=True,
+                )
+                return stream_text(chunks, key="text", on_complete=complete)
 
-            # データベースに保存
-            response_database = save_chat(
-                room_id=room_id, user_chat=False, message=response.text, post_id=0
+            response = model.generate_content(
+                contents=contents,
+                generation_config=GEMINI.types.GenerationConfig(**generation_config),
             )
 
-            print(response_database)
+            # databaseへの保存はバックグラウンドで行い、回答をすぐに返す
+            complete(response.text)
 
             return jsonify({"text": response.text}), 200
         except Exception as e:
+            if user_id is not None:
+                gemini_clients.invalidate_on_error(user_id, e)
             return jsonify({"error": str(e)}), 500
@@ -0,0 +1,304 @@
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Tuple
+
+from data_utils import feature_value_analysis
+from feature_importance import FeatureMatrix, build_feature_matrix
+from pandas import DataFrame
+
+from src.backend.cache import feature_cache
+
+# 特徴量分析を実行するプロセス数（環境変数で変更可能）
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+
+# 終わったジョブの結果を保持する件数（環境変数で変更可能）
+ANALYSIS_MAX_RESULTS = int(os.getenv("ANALYSIS_MAX_RESULTS", "256"))
+
+# (csv_id, データのバージョン, 目的変数のカラム名, 重要度の計算方法)
+JobKey = Tuple[str, int, str, str]
+
+
+def run_analysis(
+    column_name: str, engine: str, target: DataFrame, features: FeatureMatrix
+) -> Dict[str, Any]:
+    """ワーカープロセスで特徴量分析を行う関数（プロセス間で渡せるようにモジュール直下に置く）
+
+    Args:
+        column_name (str): 目的変数のカラム名
+        engine (str): 重要度の計算方法
+        target (DataFrame): 目的変数のカラムのみのデータフレーム
+        features (FeatureMatrix): 目的変数を除いたエンコード済みの特徴量
+
+    Returns:
+        Dict[str, Any]: 特徴量の重要度のグラフ（image_data）と学習の情報（training）
+    """
+
+    data = {"column_name": column_name, "engine": engine}
+    return feature_value_analysis(data, target, features)
+
+
+def load_features(csv_id: str, version: int, df: DataFrame) -> FeatureMatrix:
+    """エンコード済みの特徴量をキャッシュから取得する関数（無い場合は作成して保存する）
+
+    Args:
+        csv_id (str): csvの固有id
+        version (int): dfのバージョン
+        df (DataFrame): データフレーム
+
+    Returns:
+        FeatureMatrix: エンコード済みの特徴量
+    """
+
+    features = feature_cache.get(csv_id, version)
+    if features is None:
+        features = build_feature_matrix(df)
+        feature_cache.put(csv_id, version, features)
+    return features
+
+
+def make_context() -> Any:
+    """ワーカープロセスの起動方法を選ぶ関数
+
+    Flaskのプロセスはスレッド（chatの保存や差分の統合）を持つため、そのままforkせず、
+    data_utilsを読み込んだだけのforkserverからワーカーを作成する。
+
+    Returns:
+        Any: multiprocessingのコンテキスト
+    """
+
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["data_utils"])
+    return context
+
+
+class AnalysisJobQueue:
+    """特徴量分析（ランダムフォレストの学習とグラフの描画）をプロセスプールで行うジョブキュー
+
+    同じデータ（csv_idとバージョン）・同じ目的変数・同じ計算方法のジョブは1つにまとめ、
+    実行中であればそのジョブを、終わっていれば保持している結果を返す。
+    失敗したジョブはまとめずに、次の依頼で実行し直す。
+    """
+
+    def __init__(self, max_workers: int, max_results: int) -> None:
+        self.max_workers = max_workers
+        self.max_results = max_results
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # job_id -> ジョブの情報（古いものから順に並ぶ）
+        self._jobs: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        # (csv_id, バージョン, カラム名, 計算方法) -> job_id
+        self._keys: Dict[JobKey, str] = {}
+        self._lock = threading.Lock()
+        self._registered = False
+        self.submitted = 0
+        self.deduplicated = 0
+        self.completed = 0
+        self.failures = 0
+
+    def find(self, key: JobKey) -> Optional[Dict[str, Any]]:
+        """同じデータ・同じ目的変数・同じ計算方法のジョブを探す関数
+
+        Args:
+            key (JobKey): (csv_id, データのバージョン, 目的変数のカラム名, 重要度の計算方法)
+
+        Returns:
+            Optional[Dict[str, Any]]: ジョブの状態（無い場合はNone）
+        """
+
+        with self._lock:
+            job_id = self._keys.get(key)
+            if job_id is None:
+                return None
+            self.deduplicated += 1
+            return self._snapshot(self._jobs[job_id])
+
+    def submit(self, key: JobKey, df: DataFrame) -> Dict[str, Any]:
+        """特徴量分析のジョブを登録する関数（同じジョブが既にある場合はそれを返す）
+
+        ワーカーには目的変数のカラムと、目的変数を除いた特徴量の配列のみを渡す。
+
+        Args:
+            key (JobKey): (csv_id, データのバージョン, 目的変数のカラム名, 重要度の計算方法)
+            df (DataFrame): データフレーム
+
+        Returns:
+            Dict[str, Any]: ジョブの状態
+        """
+
+        features = load_features(key[0], key[1], df).without(key[2])
+        target = df[[key[2]]]
+
+        with self._lock:
+            job_id = self._keys.get(key)
+            if job_id is not None:
+                self.deduplicated += 1
+                return self._snapshot(self._jobs[job_id])
+
+            job: Dict[str, Any] = {
+                "job_id": uuid.uuid4().hex,
+                "csv_id": key[0],
+                "version": key[1],
+                "column_name": key[2],
+                "engine": key[3],
+                "created_at": time.time(),
+                "finished_at": None,
+                "result": None,
+                "error": None,
+            }
+            job["future"] = self._submit(key[2], key[3], target, features)
+            self._jobs[job["job_id"]] = job
+            self._keys[key] = job["job_id"]
+            self.submitted += 1
+            self._evict()
+
+        job["future"].add_done_callback(lambda future: self._finish(key, job, future))
+        return self.get(job["job_id"]) or {}
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """ジョブの状態を取得する関数
+
+        Args:
+            job_id (str): ジョブのid
+
+        Returns:
+            Optional[Dict[str, Any]]: ジョブの状態（無い場合はNone）
+        """
+
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return None if job is None else self._snapshot(job)
+
+    def stats(self) -> Dict[str, int]:
+        """ジョブの統計情報を取得する関数
+
+        Returns:
+            Dict[str, int]: 待ち・実行中の件数、登録した件数、まとめた件数、完了・失敗した件数
+        """
+
+        with self._lock:
+            statuses = [self._status(job) for job in self._jobs.values()]
+            return {
+                "queued": statuses.count("queued"),
+                "running": statuses.count("running"),
+                "results": statuses.count("done"),
+                "submitted": self.submitted,
+                "deduplicated": self.deduplicated,
+                "completed": self.completed,
+                "failures": self.failures,
+                "max_workers": self.max_workers,
+                "max_results": self.max_results,
+            }
+
+    def shutdown(self) -> None:
+        """待っているジョブを取り消してプロセスプールを終了する関数"""
+
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(
+        self, column_name: str, engine: str, target: DataFrame, features: FeatureMatrix
+    ) -> Future:
+        """プロセスプールにジョブを渡す関数（ロック取得済みで呼ぶ）
+
+        ワーカーが異常終了してプールが使えなくなっている場合は作り直す。
+        """
+
+        for _ in range(2):
+            if self._executor is None:
+                if not self._registered:
+                    atexit.register(self.shutdown)
+                    self._registered = True
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=make_context()
+                )
+            try:
+                return self._executor.submit(
+                    run_analysis, column_name, engine, target, features
+                )
+            except BrokenProcessPool:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+        raise BrokenProcessPool("特徴量分析のワーカーを起動できませんでした")
+
+    def _finish(self, key: JobKey, job: Dict[str, Any], future: Future) -> None:
+        """ジョブが終わったときに結果を保存する関数"""
+
+        try:
+            result, error = future.result(), None
+        except Exception as e:
+            result, error = None, f"{type(e).__name__}: {e}"
+
+        with self._lock:
+            job["finished_at"] = time.time()
+            job["result"] = result
+            job["error"] = error
+            if error is None:
+                self.completed += 1
+            else:
+                # 失敗したジョブはまとめずに、次の依頼で実行し直す
+                self.failures += 1
+                if self._keys.get(key) == job["job_id"]:
+                    del self._keys[key]
+            self._evict()
+
+    def _evict(self) -> None:
+        """終わったジョブを古いものから削除して上限に収める関数（ロック取得済みで呼ぶ）"""
+
+        finished = [
+            job_id for job_id, job in self._jobs.items() if job["future"].done()
+        ]
+        for job_id in finished[: max(len(finished) - self.max_results, 0)]:
+            job = self._jobs.pop(job_id)
+            key = (job["csv_id"], job["version"], job["column_name"], job["engine"])
+            if self._keys.get(key) == job_id:
+                del self._keys[key]
+
+    def _status(self, job: Dict[str, Any]) -> str:
+        """ジョブの状態（queued, running, done, failed）を求める関数"""
+
+        future: Future = job["future"]
+        if future.done() and job["finished_at"] is not None:
+            return "done" if job["error"] is None else "failed"
+        return "running" if future.running() or future.done() else "queued"
+
+    def _snapshot(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """レスポンスで返すジョブの状態を作成する関数（ロック取得済みで呼ぶ）"""
+
+        status = self._status(job)
+        end = job["finished_at"] or time.time()
+        snapshot: Dict[str, Any] = {
+            "job_id": job["job_id"],
+            "csv_id": job["csv_id"],
+            "column_name": job["column_name"],
+            "engine": job["engine"],
+            "status": status,
+            "elapsed": round(end - job["created_at"], 3),
+        }
+        if status == "queued":
+            # 自分より前に登録されて、まだ始まっていないジョブの数
+            snapshot["position"] = sum(
+                1
+                for other in self._jobs.values()
+                if other["created_at"] < job["created_at"]
+                and self._status(other) == "queued"
+            )
+        if status == "done":
+            snapshot.update(job["result"])
+        if status == "failed":
+            snapshot["error"] = job["error"]
+        return snapshot
+
+
+analysis_jobs = AnalysisJobQueue(
+    max_workers=ANALYSIS_WORKERS, max_results=ANALYSIS_MAX_RESULTS
+)
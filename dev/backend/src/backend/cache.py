@@ -0,0 +1,526 @@
+import atexit
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+from feature_importance import FeatureMatrix
+from pandas import DataFrame
+
+# キャッシュの上限（環境変数で変更可能）
+DF_CACHE_MAX_ENTRIES = int(os.getenv("DF_CACHE_MAX_ENTRIES", "32"))
+DF_CACHE_MAX_BYTES = int(os.getenv("DF_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+CHART_CACHE_MAX_BYTES = int(os.getenv("CHART_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+FEATURE_CACHE_MAX_BYTES = int(
+    os.getenv("FEATURE_CACHE_MAX_BYTES", str(512 * 1024 * 1024))
+)
+
+# データのバージョンを進めるまでの秒数（0以下の場合は進めない）
+# 複数のインスタンスで動かす場合、他のインスタンスでの更新はこの秒数が経つまで反映されない
+DF_CACHE_TTL = float(os.getenv("DF_CACHE_TTL", "300"))
+
+# グラフキャッシュのディスク領域（未設定の場合はメモリのみ）
+CHART_CACHE_DIR = os.getenv("CHART_CACHE_DIR")
+CHART_CACHE_DISK_MAX_BYTES = int(
+    os.getenv("CHART_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024))
+)
+
+# グラフキャッシュのキー（csv_id, バージョン, エンドポイント, パラメータのハッシュ値）
+ChartKey = Tuple[str, int, str, str]
+
+# グラフキャッシュの値（画像, 描画情報）
+ChartEntry = Tuple[bytes, Dict[str, Any]]
+
+
+class DataFrameCache:
+    """型適応済みのDataFrameをcsv_idとバージョンをキーに保持するLRUキャッシュ
+
+    バージョンはcsv_idごとのカウンタで、update_csvやアップロードでデータが
+    変更されたときにinvalidateで進める。古いバージョンのエントリは参照されない。
+    invalidateはこのプロセスでの変更しか検知できないため、バージョンはttl秒ごとにも
+    進める（他のインスタンスで変更された場合も、ttl秒後にはGoサーバーから取得し直す）。
+    グラフ・プロファイル・特徴量のキャッシュもこのバージョンをキーに使うため、同時に期限切れになる。
+    一部のカラムのみを読み込んだ場合は、読み込んだカラムだけを保持し、
+    同じバージョンで別のカラムを読み込んだときに追加していく。
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float = 0) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # (csv_id, version) -> (DataFrame, 型情報, メモリ使用量, すべてのカラムがあるか)
+        self._entries: OrderedDict[
+            Tuple[str, int], Tuple[DataFrame, Dict[str, str], int, bool]
+        ] = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        # csv_id -> 現在のバージョンになった時刻
+        self._version_times: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get_version(self, csv_id: str) -> int:
+        """csv_idの現在のバージョンを取得する関数
+
+        Args:
+            csv_id (str): csvの固有id
+
+        Returns:
+            int: データのバージョン
+        """
+
+        with self._lock:
+            return self._current_version(csv_id)
+
+    def get(
+        self, csv_id: str, columns: Optional[List[str]] = None
+    ) -> Optional[Tuple[DataFrame, Dict[str, str]]]:
+        """キャッシュからDataFrameを取得する関数
+
+        呼び出し側でDataFrameが書き換えられてもキャッシュが壊れないようにコピーを返す
+        （columnsを指定した場合はそのカラムのみをコピーする）
+
+        Args:
+            csv_id (str): csvの固有id
+            columns (Optional[List[str]]): 取得するカラム名（Noneの場合はすべて）
+
+        Returns:
+            Optional[Tuple[DataFrame, Dict[str, str]]]: DataFrameと型情報（無い場合や
+                指定したカラムが読み込まれていない場合はNone）
+        """
+
+        with self._lock:
+            key = (csv_id, self._current_version(csv_id))
+            entry = self._entries.get(key)
+            # 必要なカラムが読み込まれていない場合はキャッシュに無いものとして扱う
+            if entry is not None and (
+                not entry[3]
+                if columns is None
+                else any(col not in entry[0].columns for col in columns)
+            ):
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            df, dtypes, _, _ = entry
+
+        if columns is None:
+            return df.copy(), dict(dtypes)
+        return df[columns].copy(), dict(dtypes)
+
+    def put(
+        self,
+        csv_id: str,
+        version: int,
+        df: DataFrame,
+        dtypes: Dict[str, str],
+        complete: bool = True,
+    ) -> None:
+        """DataFrameをキャッシュに保存する関数
+
+        取得中にデータが更新された場合（versionが古い場合）は保存しない。
+        一部のカラムのみの場合は、同じバージョンで読み込み済みのカラムに追加する。
+
+        Args:
+            csv_id (str): csvの固有id
+            version (int): 取得を開始した時点のバージョン
+            df (DataFrame): 型適応済みのデータフレーム
+            dtypes (Dict[str, str]): 全カラムの型情報
+            complete (bool): dfにすべてのカラムがある場合はTrue
+        """
+
+        with self._lock:
+            if self._current_version(csv_id) != version:
+                return
+
+            key = (csv_id, version)
+            old = self._entries.get(key)
+
+        if not complete and old is not None:
+            if old[3]:
+                return  # すべてのカラムを保持済み
+            new_columns = [col for col in df.columns if col not in old[0].columns]
+            df = pd.concat([old[0], df[new_columns]], axis=1)
+
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if self._current_version(csv_id) != version:
+                return
+
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[2]
+
+            self._entries[key] = (df, dict(dtypes), size, complete)
+            self.current_bytes += size
+
+            # 上限を超えた分を古いものから削除
+            while self._entries and (
+                len(self._entries) > self.max_entries
+                or self.current_bytes > self.max_bytes
+            ):
+                _, (_, _, evicted_size, _) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, csv_id: str) -> None:
+        """csv_idのバージョンを進め、キャッシュを破棄する関数
+
+        Args:
+            csv_id (str): csvの固有id
+        """
+
+        with self._lock:
+            self._advance(csv_id)
+
+    def stats(self) -> Dict[str, int]:
+        """キャッシュの統計情報を取得する関数
+
+        Returns:
+            Dict[str, int]: ヒット数、ミス数、追い出し数などの統計情報
+        """
+
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": len(self._entries),
+                "current_bytes": self.current_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _current_version(self, csv_id: str) -> int:
+        """csv_idの現在のバージョンを取得し、ttl秒が経っている場合は進める関数（ロック取得済みで呼ぶ）"""
+
+        now = time.monotonic()
+        started = self._version_times.setdefault(csv_id, now)
+        if self.ttl > 0 and now - started >= self.ttl:
+            self._advance(csv_id)
+            self.expirations += 1
+        return self._versions.get(csv_id, 0)
+
+    def _advance(self, csv_id: str) -> None:
+        """csv_idのバージョンを進め、古いバージョンのエントリを削除する関数（ロック取得済みで呼ぶ）"""
+
+        self._versions[csv_id] = self._versions.get(csv_id, 0) + 1
+        self._version_times[csv_id] = time.monotonic()
+        for key in [key for key in self._entries if key[0] == csv_id]:
+            _, _, size, _ = self._entries.pop(key)
+            self.current_bytes -= size
+
+
+class ChartCache:
+    """描画済みのグラフ（画像と描画情報）を保持するLRUキャッシュ
+
+    キーにはデータのバージョンを含むため、データが更新されると古い画像は参照されない。
+    ディスク領域を設定した場合は、メモリから追い出した画像をディスクに退避する。
+    ディスク領域はプロセスごとに作成し、プロセス終了時に削除する。
+    """
+
+    def __init__(
+        self, max_bytes: int, disk_dir: Optional[str] = None, disk_max_bytes: int = 0
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: OrderedDict[ChartKey, ChartEntry] = OrderedDict()
+        # キー -> (ファイルパス, サイズ, 描画情報)
+        self._disk: OrderedDict[ChartKey, Tuple[str, int, Dict[str, Any]]] = (
+            OrderedDict()
+        )
+        self._disk_path: Optional[str] = None
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.disk_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(
+        csv_id: str, version: int, endpoint: str, params: Dict[str, Any]
+    ) -> ChartKey:
+        """グラフキャッシュのキーを作成する関数
+
+        パラメータはキーの順番に依存しないように正規化してからハッシュ値にする
+
+        Args:
+            csv_id (str): csvの固有id
+            version (int): データのバージョン
+            endpoint (str): グラフの種類（scatter, hist, box, pieなど）
+            params (Dict[str, Any]): グラフのパラメータ（csv_idは除く）
+
+        Returns:
+            ChartKey: キャッシュのキー
+        """
+
+        normalized = json.dumps(
+            {k: v for k, v in params.items() if k != "csv_id"},
+            sort_keys=True,
+            separators=(",", ":"),
+            default=str,
+        )
+        digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        return (csv_id, version, endpoint, digest)
+
+    def get(self, key: ChartKey) -> Optional[ChartEntry]:
+        """キャッシュから画像を取得する関数
+
+        Args:
+            key (ChartKey): キャッシュのキー
+
+        Returns:
+            Optional[ChartEntry]: 画像と描画情報（無い場合はNone）
+        """
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry
+
+            disk_entry = self._disk.pop(key, None)
+            if disk_entry is None:
+                self.misses += 1
+                return None
+
+            # ディスクから読み込み、メモリに戻す
+            path, size, info = disk_entry
+            self.disk_bytes -= size
+            try:
+                with open(path, "rb") as f:
+                    image = f.read()
+                os.remove(path)
+            except OSError:
+                self.misses += 1
+                return None
+
+            self.disk_hits += 1
+            self._put_memory(key, (image, info))
+            return image, info
+
+    def put(self, key: ChartKey, image: bytes, info: Dict[str, Any]) -> None:
+        """画像をキャッシュに保存する関数
+
+        Args:
+            key (ChartKey): キャッシュのキー
+            image (bytes): 画像
+            info (Dict[str, Any]): 描画情報
+        """
+
+        if len(image) > self.max_bytes:
+            return
+
+        with self._lock:
+            self._put_memory(key, (image, info))
+
+    def invalidate(self, csv_id: str) -> None:
+        """csv_idの画像をすべて削除する関数
+
+        Args:
+            csv_id (str): csvの固有id
+        """
+
+        with self._lock:
+            for key in [key for key in self._memory if key[0] == csv_id]:
+                self.current_bytes -= len(self._memory.pop(key)[0])
+            for key in [key for key in self._disk if key[0] == csv_id]:
+                self._remove_disk(key)
+
+    def stats(self) -> Dict[str, int]:
+        """キャッシュの統計情報を取得する関数
+
+        Returns:
+            Dict[str, int]: ヒット数、ミス数、追い出し数などの統計情報
+        """
+
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._memory),
+                "current_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self.disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes if self.disk_dir else 0,
+            }
+
+    def _put_memory(self, key: ChartKey, entry: ChartEntry) -> None:
+        """メモリに画像を保存し、上限を超えた分をディスクに退避する関数（ロック取得済みで呼ぶ）"""
+
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self.current_bytes -= len(old[0])
+        self._memory[key] = entry
+        self.current_bytes += len(entry[0])
+
+        while self._memory and self.current_bytes > self.max_bytes:
+            evicted_key, evicted_entry = self._memory.popitem(last=False)
+            self.current_bytes -= len(evicted_entry[0])
+            self.evictions += 1
+            self._put_disk(evicted_key, evicted_entry)
+
+    def _put_disk(self, key: ChartKey, entry: ChartEntry) -> None:
+        """ディスクに画像を保存する関数（描画情報はメモリ上の索引に保持する、ロック取得済みで呼ぶ）"""
+
+        image, info = entry
+        if not self.disk_dir or len(image) > self.disk_max_bytes:
+            return
+
+        try:
+            if self._disk_path is None:
+                os.makedirs(self.disk_dir, exist_ok=True)
+                self._disk_path = tempfile.mkdtemp(prefix="charts-", dir=self.disk_dir)
+                atexit.register(shutil.rmtree, self._disk_path, ignore_errors=True)
+
+            name = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+            path = os.path.join(self._disk_path, f"{name}.img")
+            with open(path, "wb") as f:
+                f.write(image)
+        except OSError as e:
+            print("Chart cache disk error:", str(e))
+            return
+
+        self._disk[key] = (path, len(image), info)
+        self.disk_bytes += len(image)
+
+        while self._disk and self.disk_bytes > self.disk_max_bytes:
+            self._remove_disk(next(iter(self._disk)))
+
+    def _remove_disk(self, key: ChartKey) -> None:
+        """ディスクから画像を削除する関数（ロック取得済みで呼ぶ）"""
+
+        path, size, _ = self._disk.pop(key)
+        self.disk_bytes -= size
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class FeatureMatrixCache:
+    """特徴量分析用にエンコードした特徴量をcsv_idとバージョンをキーに保持するLRUキャッシュ
+
+    同じデータで目的変数だけを変えて分析する場合は、エンコードをやり直さずに
+    ここから取り出した配列から目的変数のカラムを除いて使う。
+    バージョンはDataFrameCacheと同じものを使う。
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Tuple[str, int], FeatureMatrix] = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, csv_id: str, version: int) -> Optional[FeatureMatrix]:
+        """キャッシュからエンコード済みの特徴量を取得する関数
+
+        Args:
+            csv_id (str): csvの固有id
+            version (int): データのバージョン
+
+        Returns:
+            Optional[FeatureMatrix]: エンコード済みの特徴量（無い場合はNone）
+        """
+
+        with self._lock:
+            features = self._entries.get((csv_id, version))
+            if features is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((csv_id, version))
+            self.hits += 1
+            return features
+
+    def put(self, csv_id: str, version: int, features: FeatureMatrix) -> None:
+        """エンコード済みの特徴量をキャッシュに保存する関数
+
+        上限より大きい場合は保存しない。
+
+        Args:
+            csv_id (str): csvの固有id
+            version (int): エンコードしたデータのバージョン
+            features (FeatureMatrix): エンコード済みの特徴量
+        """
+
+        if features.nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop((csv_id, version), None)
+            if old is not None:
+                self.current_bytes -= old.nbytes
+            self._entries[(csv_id, version)] = features
+            self.current_bytes += features.nbytes
+
+            # 上限を超えた分を古いものから削除
+            while self._entries and self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def invalidate(self, csv_id: str) -> None:
+        """csv_idのエンコード済みの特徴量を破棄する関数
+
+        Args:
+            csv_id (str): csvの固有id
+        """
+
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == csv_id]:
+                self.current_bytes -= self._entries.pop(key).nbytes
+
+    def stats(self) -> Dict[str, int]:
+        """キャッシュの統計情報を取得する関数
+
+        Returns:
+            Dict[str, int]: ヒット数、ミス数、追い出し数などの統計情報
+        """
+
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "current_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+dataframe_cache = DataFrameCache(
+    max_entries=DF_CACHE_MAX_ENTRIES, max_bytes=DF_CACHE_MAX_BYTES, ttl=DF_CACHE_TTL
+)
+
+chart_cache = ChartCache(
+    max_bytes=CHART_CACHE_MAX_BYTES,
+    disk_dir=CHART_CACHE_DIR,
+    disk_max_bytes=CHART_CACHE_DISK_MAX_BYTES,
+)
+
+feature_cache = FeatureMatrixCache(max_bytes=FEATURE_CACHE_MAX_BYTES)
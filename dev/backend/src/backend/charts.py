@@ -0,0 +1,151 @@
+import base64
+import os
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+from data_plt import plot_box, plot_hist, plot_scatter
+from data_utils import make_pie
+from flask import jsonify, request
+from flask.wrappers import Response
+from pandas import DataFrame
+
+from src.backend.cache import chart_cache, dataframe_cache
+from src.backend.csvs import get_csv
+
+# グラフの種類と描画する関数の対応（描画関数は画像と描画情報を返す）
+CHART_RENDERERS: Dict[
+    str, Callable[[Dict[str, Any], DataFrame, str], Tuple[bytes, Dict[str, Any]]]
+] = {
+    "scatter": plot_scatter,
+    "hist": plot_hist,
+    "box": plot_box,
+    "pie": make_pie,
+}
+
+# グラフの種類ごとに、描画に使うカラム名が入っているパラメータ
+# （この値のカラムのみを読み込む。"None"や未指定のパラメータは無視する）
+CHART_COLUMNS: Dict[str, List[str]] = {
+    "scatter": ["variable1", "variable2", "target"],
+    "hist": ["variable", "target"],
+    "box": ["variable1", "variable2"],
+    "pie": ["column_name"],
+}
+
+# 画像として返す場合のMIMEタイプと画像形式の対応
+IMAGE_FORMATS = {"image/png": "png", "image/webp": "webp", "image/svg+xml": "svg"}
+
+# 画像として返す場合に描画情報を載せるヘッダー
+RENDER_INFO_HEADERS = {
+    "mode": "X-Chart-Mode",
+    "points": "X-Chart-Points",
+    "rendered_points": "X-Chart-Rendered-Points",
+    "fit_points": "X-Chart-Fit-Points",
+}
+
+# ブラウザに画像をキャッシュさせる秒数（0の場合は毎回ETagで確認させる）
+CHART_HTTP_MAX_AGE = int(os.getenv("CHART_HTTP_MAX_AGE", "0"))
+
+
+def chart_columns(endpoint: str, params: Dict[str, Any]) -> List[str]:
+    """グラフの描画に使うカラム名をパラメータから取得する関数
+
+    Args:
+        endpoint (str): グラフの種類（scatter, hist, box, pie）
+        params (Dict[str, Any]): グラフのパラメータ
+
+    Returns:
+        List[str]: 描画に使うカラム名（重複は除く）
+    """
+
+    columns = [params.get(key) for key in CHART_COLUMNS[endpoint]]
+    return list(dict.fromkeys(col for col in columns if col and col != "None"))
+
+
+def get_chart(
+    csv_id: str, endpoint: str, params: Dict[str, Any], fmt: str = "png"
+) -> Union[Tuple[bytes, Dict[str, Any]], Tuple[Response, int]]:
+    """グラフをキャッシュから取得し、無い場合は描画してキャッシュする関数
+
+    Args:
+        csv_id (str): csvの固有id
+        endpoint (str): グラフの種類（scatter, hist, box, pie）
+        params (Dict[str, Any]): グラフのパラメータ
+        fmt (str): 画像形式（png, webp, svg）
+
+    Returns:
+        Union[Tuple[bytes, Dict[str, Any]], Tuple[Response, int]]: 画像データと描画情報
+            （描画方法、描画に使った行数など）もしくはエラーを返す
+    """
+
+    render = CHART_RENDERERS.get(endpoint)
+    if render is None:
+        return jsonify({"error": f"Unknown chart type: {endpoint}"}), 400
+
+    # 描画中にデータが更新された場合に備え、先にバージョンを取得しておく
+    version = dataframe_cache.get_version(csv_id)
+    key = chart_cache.make_key(csv_id, version, f"{endpoint}.{fmt}", params)
+
+    cached = chart_cache.get(key)
+    if cached is not None:
+        return cached
+
+    # 描画に使うカラムのみを読み込む
+    data = get_csv(csv_id=csv_id, columns=chart_columns(endpoint, params))
+    if isinstance(data[1], int):
+        return data  # エラーの場合（レスポンスとステータスコード）はそのまま返す
+
+    df, _ = data
+    image, render_info = render(params, df, fmt)
+    chart_cache.put(key, image, render_info)
+
+    return image, render_info
+
+
+def make_chart_response(
+    csv_id: str, endpoint: str, params: Dict[str, Any]
+) -> Union[Response, Tuple[Response, int]]:
+    """Acceptヘッダーに応じた形式でグラフを返す関数
+
+    既定では従来どおりBase64エンコードしたPNG画像をJSONで返す。
+    Acceptで画像形式（image/png, image/webp, image/svg+xml）が優先された場合は
+    画像をそのまま返し、ETagとCache-Controlを付けてブラウザやプロキシでキャッシュできるようにする。
+    描画情報（間引きや集約をしたかどうか）はJSONのrender_info、もしくはX-Chart-*ヘッダーで返す。
+
+    Args:
+        csv_id (str): csvの固有id
+        endpoint (str): グラフの種類（scatter, hist, box, pie）
+        params (Dict[str, Any]): グラフのパラメータ
+
+    Returns:
+        Union[Response, Tuple[Response, int]]: レスポンスもしくはエラーを返す
+    """
+
+    mimetype = request.accept_mimetypes.best_match(
+        ["application/json", *IMAGE_FORMATS], default="application/json"
+    )
+    fmt = IMAGE_FORMATS.get(mimetype, "png")
+
+    chart = get_chart(csv_id=csv_id, endpoint=endpoint, params=params, fmt=fmt)
+    if not isinstance(chart[0], bytes):
+        return chart  # エラーの場合はそのまま返す
+
+    image, render_info = chart
+    if mimetype == "application/json":
+        return jsonify(
+            {"image_data": base64.b64encode(image).decode(), "render_info": render_info}
+        )
+
+    response = Response(image, mimetype=mimetype)
+    for key, header in RENDER_INFO_HEADERS.items():
+        if key in render_info:
+            response.headers[header] = str(render_info[key])
+    response.add_etag()
+    response.vary.add("Accept")
+    response.cache_control.private = True
+    if CHART_HTTP_MAX_AGE > 0:
+        response.cache_control.max_age = CHART_HTTP_MAX_AGE
+    else:
+        response.cache_control.no_cache = True
+
+    # If-None-Matchが一致する場合は304にする
+    response.make_conditional(request)
+    return response
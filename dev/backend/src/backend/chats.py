@@ -1,54 +1,233 @@
+import atexit
 import os
+import queue
+import threading
+import time
 import uuid
-from typing import Dict
+from typing import Any, Dict, List, Optional
 
 import requests
-from flask import jsonify
 
-GO_API_URL = os.getenv("DB_API_URL")
+from src.backend.go_api import go_api
 
+# 保存待ちのchatを溜めておく上限（環境変数で変更可能）
+CHAT_QUEUE_MAX_SIZE = int(os.getenv("CHAT_QUEUE_MAX_SIZE", "10000"))
 
-def save_chat(
+# 1回の呼び出しでまとめて保存するchatの上限（環境変数で変更可能）
+CHAT_BATCH_SIZE = int(os.getenv("CHAT_BATCH_SIZE", "100"))
+
+# 最初のchatが届いてから後続のchatを待つ秒数（環境変数で変更可能）
+CHAT_FLUSH_INTERVAL = float(os.getenv("CHAT_FLUSH_INTERVAL", "0.05"))
+
+# 保存に失敗した場合に試行する最大回数（環境変数で変更可能）
+CHAT_MAX_ATTEMPTS = int(os.getenv("CHAT_MAX_ATTEMPTS", "5"))
+
+# 再試行までの待ち時間の基準秒数（1, 2, 4...と倍にしていく）
+CHAT_RETRY_BACKOFF = float(os.getenv("CHAT_RETRY_BACKOFF", "1.0"))
+
+# プロセス終了時に保存待ちのchatを書き込むまで待つ秒数
+CHAT_SHUTDOWN_TIMEOUT = 5.0
+
+
+def make_chat(
     room_id: str, user_chat: bool, message: str, post_id: int
-) -> Dict[str, str]:
-    """chatをdatabaseに保存する関数
+) -> Dict[str, Any]:
+    """保存するchatの行を作成する関数
+
+    chat_idはここで採番するため、同じ行を再送してもGo側で重複しない
 
     Args:
         room_id (str): room_id
         user_chat (bool): チャットがユーザーの物かどうか
         message (str): チャット内容
-        post_id (_type_): チャットの順番
+        post_id (int): チャットの順番
 
     Returns:
-        Dict[str, str]: ステータメッセージ
+        Dict[str, Any]: chatsテーブルの1行
     """
 
-    chat_id = str(uuid.uuid4())
-    json_data = {
-        "chat_id": chat_id,
+    return {
+        "chat_id": str(uuid.uuid4()),
         "room_id": room_id,
         "message": message,
         "post_id": post_id,
         "user_chat": user_chat,
     }
-    try:
-        # chatを保存
-        proxies = {"http": None, "https": None}  # 大学で行うときはここを有効に
-        response = requests.post(
-            f"{GO_API_URL}/chats/save/chat", json=json_data, proxies=proxies
+
+
+class ChatWriter:
+    """chatをバックグラウンドでまとめて保存するキュー（write-behind）
+
+    enqueueはキューに積むだけで戻り、バックグラウンドのスレッドが溜まったchatを
+    /chats/save/chats に一括で保存する。保存に失敗した場合は間隔を空けて再試行する。
+    キューが一杯の場合（Goサーバーが遅い・停止している場合）は応答を待たせないよう、
+    そのchatを破棄して数える。
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        batch_size: int,
+        flush_interval: float,
+        max_attempts: int,
+        retry_backoff: float,
+    ) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.saved = 0
+        self.batches = 0
+        self.retries = 0
+        self.dropped = 0
+
+    def enqueue(
+        self, room_id: str, user_chat: bool, message: str, post_id: int
+    ) -> None:
+        """chatを保存待ちのキューに積む関数
+
+        Args:
+            room_id (str): room_id
+            user_chat (bool): チャットがユーザーの物かどうか
+            message (str): チャット内容
+            post_id (int): チャットの順番
+        """
+
+        chat = make_chat(
+            room_id=room_id, user_chat=user_chat, message=message, post_id=post_id
         )
+        self._start()
+        try:
+            self._queue.put_nowait(chat)
+        except queue.Full:
+            # バッファが一杯の場合は応答を待たせないよう、保存せずに破棄する
+            with self._lock:
+                self.dropped += 1
+            print("Chat queue is full, dropped chat:", chat["chat_id"])
 
-        print("Response Status Code:", response.status_code)
-        if response.status_code == 200:
-            return (
-                jsonify({"message": "chat uploaded successfully"}),
-                200,
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """キューに積まれたchatがすべて処理されるまで待つ関数
+
+        Args:
+            timeout (Optional[float]): 待つ最大秒数（Noneの場合は無制限）
+
+        Returns:
+            bool: 時間内にすべて処理された場合はTrue
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """キューの統計情報を取得する関数
+
+        Returns:
+            Dict[str, int]: 保存待ちの件数、保存した件数、再試行回数、破棄した件数など
+        """
+
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "max_size": self._queue.maxsize,
+                "saved": self.saved,
+                "batches": self.batches,
+                "retries": self.retries,
+                "dropped": self.dropped,
+            }
+
+    def _start(self) -> None:
+        """バックグラウンドのスレッドを起動する関数（forkしたプロセスでも最初の利用時に起動する）"""
+
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="chat-writer", daemon=True
             )
-        else:
-            return (
-                jsonify({"message": "chat uploaded failed"}),
-                500,
+            self._thread.start()
+            atexit.register(self.flush, CHAT_SHUTDOWN_TIMEOUT)
+
+    def _run(self) -> None:
+        """キューからchatを取り出し、まとめて保存し続ける関数"""
+
+        while True:
+            batch = [self._queue.get()]
+            # 後続のchatを少しだけ待ってまとめる
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self._write_with_retry(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_with_retry(self, batch: List[Dict[str, Any]]) -> None:
+        """chatを保存し、失敗した場合は間隔を空けて再試行する関数"""
+
+        for attempt in range(self.max_attempts):
+            status_code = self._write(batch)
+            if status_code == 200:
+                return
+            if status_code is not None and status_code < 500:
+                break  # リクエストの内容が不正な場合は再試行しない
+            if attempt + 1 < self.max_attempts:
+                with self._lock:
+                    self.retries += 1
+                time.sleep(self.retry_backoff * (2**attempt))
+
+        with self._lock:
+            self.dropped += len(batch)
+        print("Failed to save chats:", [chat["chat_id"] for chat in batch])
+
+    def _write(self, batch: List[Dict[str, Any]]) -> Optional[int]:
+        """chatを一括で保存する関数
+
+        Returns:
+            Optional[int]: ステータスコード（接続できなかった場合はNone）
+        """
+
+        try:
+            # chat_idが重複した行はGo側で無視されるため、再送してもよい
+            response = go_api.post(
+                "/chats/save/chats", json={"chats": batch}, idempotent=True
             )
-    except Exception as e:
-        print("error:", str(e))
-        return jsonify({"error": "Failed to upload data to Go API"}), 500
+        except requests.exceptions.RequestException as e:
+            print("Request Error:", str(e))
+            return None
+
+        if response.status_code == 200:
+            with self._lock:
+                self.saved += len(batch)
+                self.batches += 1
+        else:
+            print("Error saving chats:", response.text)
+        return response.status_code
+
+
+chat_writer = ChatWriter(
+    max_size=CHAT_QUEUE_MAX_SIZE,
+    batch_size=CHAT_BATCH_SIZE,
+    flush_interval=CHAT_FLUSH_INTERVAL,
+    max_attempts=CHAT_MAX_ATTEMPTS,
+    retry_backoff=CHAT_RETRY_BACKOFF,
+)
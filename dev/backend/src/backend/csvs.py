@@ -1,31 +1,84 @@
+import atexit
 import base64
-import io
 import json
 import os
-from typing import Dict, Tuple, Union
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
 
-import pandas as pd
 import requests
+from data_utils import set_dtypes
 from flask import jsonify
+from flask.wrappers import Response
 from pandas import DataFrame
 
-GO_API_URL = os.getenv("DB_API_URL")
+from src.backend.cache import chart_cache, dataframe_cache, feature_cache
+from src.backend.go_api import go_api
+from src.backend.profile import (
+    build_profile,
+    decode_profile,
+    encode_profile,
+    merge_profile,
+    profile_store,
+)
+from src.backend.storage import (
+    apply_patches,
+    decode_dataframe,
+    encode_columns,
+    encode_dtypes,
+    get_dtypes,
+    is_parquet,
+    make_payload,
+    patch_columns,
+    use_parquet,
+)
+from src.backend.uploads import MultipartStream
 
+# この件数の差分が溜まったらすぐに元のデータに統合する（環境変数で変更可能）
+CSV_MAX_PATCHES = int(os.getenv("CSV_MAX_PATCHES", "8"))
 
-def get_csv(csv_id: str) -> Union[Tuple[DataFrame, Dict[str, str]], Dict[str, str]]:
+# 最後に差分を保存してから元のデータに統合するまでの秒数（環境変数で変更可能）
+CSV_COMPACT_DELAY = float(os.getenv("CSV_COMPACT_DELAY", "10"))
+
+# プロセス終了時に統合待ちの差分を統合するまで待つ秒数
+CSV_COMPACT_SHUTDOWN_TIMEOUT = 30.0
+
+# 差分に記録するカラム名の最大文字数（csv_patches.column_nameの長さ）
+PATCH_COLUMN_NAME_MAX_LENGTH = 255
+
+
+def get_csv(
+    csv_id: str, columns: Optional[List[str]] = None
+) -> Union[Tuple[DataFrame, Dict[str, str]], Tuple[Response, int]]:
     """csvをデータベースから取得する関数
 
+    型適応済みのDataFrameを返す。一度取得したデータはキャッシュし、
+    データが更新されるまではGoサーバーへの問い合わせを行わない。
+    columnsを指定した場合はそのカラムのみを読み込み・型適応する
+    （返す型情報は全カラムのもの）。
+
     Args:
         csv_id (str): csvの固有id
+        columns (Optional[List[str]]): 使用するカラム名（Noneの場合はすべて）
 
     Returns:
-        Union[Tuple[DataFrame, Dict[str, str]], Dict[str, str]]: DataFrameもしくはエラーを返す
+        Union[Tuple[DataFrame, Dict[str, str]], Tuple[Response, int]]:
+            DataFrameと型情報もしくはエラーを返す
     """
 
+    if columns is not None:
+        # 同じカラムを複数回指定された場合は1つにまとめる
+        columns = list(dict.fromkeys(columns))
+
+    # キャッシュにあればそれを返す
+    version = dataframe_cache.get_version(csv_id)
+    cached = dataframe_cache.get(csv_id, columns=columns)
+    if cached is not None:
+        return cached
+
     try:
         # GoサーバーからCSVデータを取得
-        proxies = {"http": None, "https": None}  # 大学で行うときはここを有効に
-        response = requests.get(f"{GO_API_URL}/get_csv/{csv_id}", proxies=proxies)
+        response = go_api.get(f"/get_csv/{csv_id}", endpoint="/get_csv")
 
         # レスポンスの内容とステータスコードを表示
         print("Response Status Code:", response.status_code)
@@ -34,19 +87,51 @@ def get_csv(csv_id: str) -> Union[Tuple[DataFrame, Dict[str, str]], Dict[str, st
             try:
                 # filesキーからCSVデータを取得
                 csv_files = response_data.get("file", [])
-                # バイナリデータを取得
-                csv_content = csv_files.get("csv_file")
-                json_content = csv_files.get("json_file")
-                if csv_content and json_content:
-                    # バイナリデータをDataFrameに変換
-                    decoded_csv_content = base64.b64decode(csv_content).decode("utf-8")
-                    decoded_json_content = base64.b64decode(json_content).decode(
-                        "utf-8"
+                df, dtypes, patches, parquet = decode_csv_files(
+                    csv_files, columns=columns
+                )
+
+                if columns is not None:
+                    if parquet and patches:
+                        # 統合されずに残っている差分（プロセスの再起動時など）の統合を予約する
+                        # （データ全体は統合時に取得し、保存直後の予約は置き換えない）
+                        patch_compactor.schedule(
+                            csv_id=csv_id,
+                            df=None,
+                            patch_id=patches[-1]["patch_id"],
+                            patch_count=len(patches),
+                            replace=False,
+                        )
+                    # 一部のカラムのみの場合は移行はせず、読み込んだカラムのみ保存する
+                    dataframe_cache.put(
+                        csv_id=csv_id,
+                        version=version,
+                        df=df,
+                        dtypes=dtypes,
+                        complete=False,
+                    )
+                    return df.copy(), dtypes
+
+                if not parquet:
+                    # 初回アクセス時にParquet形式へ移行する（差分も統合される）
+                    if use_parquet():
+                        update_csv(csv_id=csv_id, df=df)
+                        version = dataframe_cache.get_version(csv_id)
+                elif patches:
+                    # 統合されずに残っている差分（プロセスの再起動時など）を統合する
+                    patch_compactor.schedule(
+                        csv_id=csv_id,
+                        df=df,
+                        patch_id=patches[-1]["patch_id"],
+                        patch_count=len(patches),
                     )
-                    df = pd.read_csv(io.StringIO(decoded_csv_content))
-                    dtypes = json.loads(decoded_json_content)
 
-                return df, dtypes
+                # キャッシュに保存（呼び出し側の変更が影響しないようにコピーを返す）
+                dataframe_cache.put(
+                    csv_id=csv_id, version=version, df=df, dtypes=dtypes
+                )
+
+                return df.copy(), dtypes
 
             except Exception as parse_error:
                 print("Error parsing CSV data:", str(parse_error))
@@ -75,57 +160,257 @@ def get_csv(csv_id: str) -> Union[Tuple[DataFrame, Dict[str, str]], Dict[str, st
         return jsonify({"error": "Unexpected error", "details": str(e)}), 500
 
 
-def update_csv(csv_id: str, df: DataFrame) -> Dict[str, str]:
+def decode_csv_files(
+    csv_files: Dict[str, Any], columns: Optional[List[str]] = None
+) -> Tuple[DataFrame, Dict[str, str], List[Dict[str, Any]], bool]:
+    """Goサーバーから取得したデータを型適応済みのDataFrameに変換する関数
+
+    元のデータを読み込み、列ごとの更新差分を保存された順に適用する。
+    columnsを指定した場合は、そのカラムのみを読み込み、そのカラムの差分のみを適用する。
+
+    Args:
+        csv_files (Dict[str, Any]): /get_csvのfile（Base64エンコードされたデータ、
+            型情報、差分）
+        columns (Optional[List[str]]): 読み込むカラム名（Noneの場合はすべて）
+
+    Returns:
+        Tuple[DataFrame, Dict[str, str], List[Dict[str, Any]], bool]: DataFrame、
+            全カラムの型情報、保存されている差分、元のデータがParquet形式かどうか
+    """
+
+    # バイナリデータを取得
+    csv_content = base64.b64decode(csv_files["csv_file"])
+    json_content = base64.b64decode(csv_files["json_file"]).decode("utf-8")
+    dtypes = json.loads(json_content)
+    # 列ごとの更新差分（保存された順）
+    patches = csv_files.get("patches") or []
+
+    contents = [base64.b64decode(patch["patch_file"]) for patch in patches]
+    base_columns = None
+    if columns is not None:
+        # 差分で置き換えられたカラムは元のデータから読み込まない
+        # （複数のカラムをまとめた差分もあるため、差分のスキーマからカラム名を求める）
+        patched = {col for content in contents for col in patch_columns(content)}
+        base_columns = [col for col in columns if col not in patched]
+
+    # バイナリデータをDataFrameに変換
+    df = decode_dataframe(csv_content, columns=base_columns)
+
+    # CSV形式で保存されている場合は型適応が必要
+    # （差分で追加されたカラムの型は差分に含まれる）
+    parquet = is_parquet(csv_content)
+    if not parquet:
+        df = set_dtypes(
+            df=df,
+            dtypes={col: dtype for col, dtype in dtypes.items() if col in df.columns},
+        )
+
+    # 列ごとの更新差分を保存された順に適用する
+    if contents:
+        df = apply_patches(df, contents, columns=columns)
+
+    if columns is not None:
+        # 指定された順に並べる
+        df = df[columns]
+
+    return df, dtypes, patches, parquet
+
+
+def update_csv(csv_id: str, df: DataFrame) -> Tuple[Response, int]:
     """csvをアップデートする関数
 
     Args:
         df (DataFrame): アップロードするデータフレーム
 
     Returns:
-        Dict[str, str]: goからのメッセージ
+        Tuple[Response, int]: goからのメッセージとステータスコード
     """
 
-    # データフレームをCSV文字列に変換
-    csv_buffer = io.StringIO()
-    df.to_csv(csv_buffer, index=False)
-    data_size = len(csv_buffer.getvalue().encode("utf-8"))
+    # 全体を保存すると差分はすべて破棄されるため、統合待ちの差分も不要になる
+    patch_compactor.discard(csv_id)
+
+    profile = build_profile(df)
+    response = send_csv(csv_id=csv_id, df=df, profile=profile)
 
-    data_columns = len(df.columns)
-    data_rows = len(df)
+    print(response.status_code)
 
-    dtypes = {col: str(dtype) for col, dtype in df.dtypes.items()}
+    # データが変更されたのでキャッシュを破棄
+    dataframe_cache.invalidate(csv_id)
+    chart_cache.invalidate(csv_id)
+    feature_cache.invalidate(csv_id)
+
+    if response.status_code == 200:
+        profile_store.put(csv_id, dataframe_cache.get_version(csv_id), profile)
+        json_response = response.json()
+        print(json_response)
+        return (
+            jsonify(
+                {
+                    "message": f"File {json_response.get('file_name', 'not name')} update successfully"
+                }
+            ),
+            200,
+        )
+    else:
+        return update_error(response)
+
+
+def send_csv(
+    csv_id: str,
+    df: DataFrame,
+    profile: Dict[str, Any],
+    applied_patch_id: Optional[int] = None,
+) -> requests.Response:
+    """データフレーム全体をGoサーバーに保存する関数
+
+    Args:
+        csv_id (str): csvの固有id
+        df (DataFrame): 保存するデータフレーム
+        profile (Dict[str, Any]): データと一緒に保存するプロファイル
+        applied_patch_id (Optional[int]): 差分を統合する場合は、統合した最後の差分のid
+            （Goサーバーはそれ以前の差分のみを削除し、既に統合済みの場合は409を返す）
+
+    Returns:
+        requests.Response: Goサーバーのレスポンス
+    """
+
+    # データフレームを保存形式（ParquetもしくはCSV）のバイト列に1回だけ変換し、
+    # プロファイルも合わせて送る（大きさなどは変換結果から求める）
+    files, data_info = make_payload(df, profile_file=encode_profile(profile))
+
+    json_data = {"csv_id": csv_id, **data_info}
+    if applied_patch_id is not None:
+        json_data["applied_patch_id"] = applied_patch_id
+
+    # print(json_data)
+
+    # 同じ内容で上書きするだけなので再試行してよい（再試行時も先頭から送り直す）
+    body = MultipartStream(fields=json_data, files=files)
+    return go_api.post("/csvs/update", data=body, headers=body.headers, idempotent=True)
+
+
+def update_column(
+    csv_id: str,
+    df: DataFrame,
+    column: str,
+    dtypes: Optional[Dict[str, str]] = None,
+) -> Tuple[Response, int]:
+    """1つのカラムのみを変更・追加した場合にcsvをアップデートする関数
+
+    Args:
+        csv_id (str): csvの固有id
+        df (DataFrame): 変更後のデータフレーム（一部のカラムのみでもよい）
+        column (str): 変更・追加したカラム名
+        dtypes (Optional[Dict[str, str]]): 変更前の全カラムの型情報
+            （dfにすべてのカラムがある場合は不要）
+
+    Returns:
+        Tuple[Response, int]: goからのメッセージとステータスコード
+    """
+
+    return update_columns(csv_id=csv_id, df=df, columns=[column], dtypes=dtypes)
+
+
+def update_columns(
+    csv_id: str,
+    df: DataFrame,
+    columns: List[str],
+    dtypes: Optional[Dict[str, str]] = None,
+) -> Tuple[Response, int]:
+    """一部のカラムのみを変更・追加した場合にcsvをアップデートする関数
+
+    変更したカラムのみを1つの差分としてGoサーバーに送り、データ本体は書き換えない。
+    差分は取得時に元のデータへ適用され、patch_compactorがバックグラウンドで統合する。
+    Parquet形式で保存しない場合や、Goサーバーが差分の保存に対応していない場合は
+    update_csvで全体を保存する。
+    get_csvで一部のカラムのみを取得した場合は、get_csvが返した全カラムの型情報を
+    dtypesに渡す（型情報とプロファイルは変更したカラムのみ作成し直す）。
+
+    Args:
+        csv_id (str): csvの固有id
+        df (DataFrame): 変更後のデータフレーム（一部のカラムのみでもよい）
+        columns (List[str]): 変更・追加したカラム名
+        dtypes (Optional[Dict[str, str]]): 変更前の全カラムの型情報
+            （dfにすべてのカラムがある場合は不要）
+
+    Returns:
+        Tuple[Response, int]: goからのメッセージとステータスコード
+    """
+
+    projected = dtypes is not None and any(col not in df.columns for col in dtypes)
+
+    if not use_parquet():
+        return update_whole(csv_id=csv_id, df=df, columns=columns, projected=projected)
+
+    if projected:
+        # 変更したカラムの型情報とプロファイルのみを作成し直す
+        current_profile = get_profile(csv_id=csv_id)
+        if not isinstance(current_profile, dict):
+            return current_profile  # エラーの場合はそのまま返す
+        new_dtypes = {**dtypes, **get_dtypes(df[columns])}
+        profile = merge_profile(current_profile, df[columns], list(new_dtypes))
+    else:
+        new_dtypes = get_dtypes(df)
+        profile = build_profile(df)
+
+    # 差分に記録するカラム名は表示用（取得時に適用するカラムは差分のスキーマから求める）
+    # のため、長い場合は切り詰める
+    column_name = ",".join(columns)
+    if len(column_name) > PATCH_COLUMN_NAME_MAX_LENGTH:
+        column_name = column_name[: PATCH_COLUMN_NAME_MAX_LENGTH - 3] + "..."
 
     files = {
-        "csv_file": ("data.csv", csv_buffer.getvalue().encode("utf-8"), "text/csv"),
-        "json_file": (
-            "data.json",
-            json.dumps(dtypes).encode("utf-8"),
-            "application/json",
-        ),
+        "patch_file": encode_columns(df, columns),
+        "json_file": encode_dtypes(new_dtypes),
+        "profile_file": encode_profile(profile),
     }
-
     json_data = {
         "csv_id": csv_id,
-        "data_size": data_size,
-        "data_columns": data_columns,
-        "data_rows": data_rows,
+        "column_name": column_name,
+        "data_columns": len(new_dtypes),
+        "data_rows": len(df),
     }
 
-    # print(json_data)
-
-    proxies = {"http": None, "https": None}  # 大学で行うときはここを有効に
-    response = requests.post(
-        f"{GO_API_URL}/csvs/update",
-        files=files,
-        data=json_data,
-        proxies=proxies,
+    # 同じ差分を再送しても適用結果は変わらないので再試行してよい
+    body = MultipartStream(fields=json_data, files=files)
+    response = go_api.post(
+        "/csvs/update/column", data=body, headers=body.headers, idempotent=True
     )
 
     print(response.status_code)
 
+    if response.status_code == 404:
+        # 差分の保存に対応していないGoサーバーの場合は全体を保存する
+        return update_whole(csv_id=csv_id, df=df, columns=columns, projected=projected)
+
+    # データが変更されたのでキャッシュを破棄
+    dataframe_cache.invalidate(csv_id)
+    chart_cache.invalidate(csv_id)
+    feature_cache.invalidate(csv_id)
+
     if response.status_code == 200:
         json_response = response.json()
         print(json_response)
+
+        # 手元のデータが最新なので、Goサーバーから取得し直さずにキャッシュする
+        version = dataframe_cache.get_version(csv_id)
+        dataframe_cache.put(
+            csv_id=csv_id,
+            version=version,
+            df=df,
+            dtypes=new_dtypes,
+            complete=not projected,
+        )
+        profile_store.put(csv_id, version, profile)
+
+        # 一部のカラムのみの場合は、統合時にデータ全体を取得し直す
+        patch_compactor.schedule(
+            csv_id=csv_id,
+            df=None if projected else df,
+            patch_id=json_response["patch_id"],
+            patch_count=json_response["patch_count"],
+            profile=None if projected else profile,
+        )
         return (
             jsonify(
                 {
@@ -135,15 +420,328 @@ def update_csv(csv_id: str, df: DataFrame) -> Dict[str, str]:
             200,
         )
     else:
+        return update_error(response)
+
+
+def update_whole(
+    csv_id: str, df: DataFrame, columns: List[str], projected: bool
+) -> Tuple[Response, int]:
+    """差分を保存できない場合にupdate_csvでデータ全体を保存する関数
+
+    Args:
+        csv_id (str): csvの固有id
+        df (DataFrame): 変更後のデータフレーム
+        columns (List[str]): 変更・追加したカラム名
+        projected (bool): dfが一部のカラムのみの場合はTrue
+            （データ全体を取得し、変更したカラムを置き換えてから保存する）
+
+    Returns:
+        Tuple[Response, int]: goからのメッセージとステータスコード
+    """
+
+    if projected:
+        data = get_csv(csv_id=csv_id)
+        if isinstance(data[1], int):
+            return data  # エラーの場合（レスポンスとステータスコード）はそのまま返す
+        whole, _ = data
+        for column in columns:
+            whole[column] = df[column].values
+        df = whole
+
+    return update_csv(csv_id=csv_id, df=df)
+
+
+def update_error(response: requests.Response) -> Tuple[Response, int]:
+    """Goサーバーでの更新に失敗した場合のレスポンスを作成する関数
+
+    Args:
+        response (requests.Response): Goサーバーのレスポンス
+
+    Returns:
+        Tuple[Response, int]: エラーメッセージとステータスコード
+    """
+
+    try:
+        # レスポンスからJSONデータを取得し、エラーメッセージを表示
+        error_response = response.json()
+        error_message = error_response.get("error", "Unknown error occurred")
+        message = error_response.get("message", "Unkown message")
+        print(f"エラーが発生しました: {error_message}")
+        print(f"メッセージ: {message}")
+        return jsonify({"error": f"{error_message}"}), 500
+    except ValueError:
+        # JSONでない場合のエラーメッセージを表示
+        print(f"エラーレスポンス: {response.text}")
+    return jsonify({"error": "Failed to upload data to Go API"}), 500
+
+
+def get_profile(csv_id: str) -> Union[Dict[str, Any], Tuple[Response, int]]:
+    """csvのプロファイルを取得する関数
+
+    メモリ上のプロファイル、Goサーバーに保存されたプロファイルの順に探し、
+    どちらにも無い場合（プロファイル導入前のデータ）はデータから作成して保存する
+
+    Args:
+        csv_id (str): csvの固有id
+
+    Returns:
+        Union[Dict[str, Any], Tuple[Response, int]]: プロファイルもしくはエラーを返す
+    """
+
+    version = dataframe_cache.get_version(csv_id)
+    profile = profile_store.get(csv_id, version)
+    if profile is not None:
+        return profile
+
+    try:
+        # Goサーバーからプロファイルのみを取得
+        response = go_api.get(f"/get_profile/{csv_id}", endpoint="/get_profile")
+        if response.status_code == 200:
+            profile_content = response.json().get("profile_file")
+            if profile_content:
+                profile = decode_profile(base64.b64decode(profile_content))
+                if profile is not None:
+                    profile_store.put(csv_id, version, profile)
+                    return profile
+    except requests.exceptions.RequestException as e:
+        print("Request Error:", str(e))
+
+    # プロファイルが無い場合はデータを取得して作成する
+    data = get_csv(csv_id=csv_id)
+    if isinstance(data[1], int):
+        return data  # エラーの場合（レスポンスとステータスコード）はそのまま返す
+
+    # CSV形式からの移行時はget_csv内で作成済み
+    version = dataframe_cache.get_version(csv_id)
+    profile = profile_store.get(csv_id, version)
+    if profile is not None:
+        return profile
+
+    df, _ = data
+    profile = build_profile(df)
+    update_profile(csv_id=csv_id, profile=profile)
+    profile_store.put(csv_id, version, profile)
+
+    return profile
+
+
+def update_profile(csv_id: str, profile: Dict[str, Any]) -> None:
+    """プロファイルのみをGoサーバーに保存する関数
+
+    Args:
+        csv_id (str): csvの固有id
+        profile (Dict[str, Any]): プロファイル
+    """
+
+    try:
+        response = go_api.post(
+            "/csvs/update/profile",
+            files={"profile_file": encode_profile(profile)},
+            data={"csv_id": csv_id},
+            idempotent=True,
+        )
+        if response.status_code != 200:
+            print("Error saving profile:", response.text)
+    except requests.exceptions.RequestException as e:
+        print("Request Error:", str(e))
+
+
+class PatchCompactor:
+    """列ごとの更新差分をバックグラウンドで元のデータに統合するクラス
+
+    差分を保存するたびに最新のデータフレームを預かり、最後の差分から一定時間が経つか
+    差分が一定数溜まったら、データ全体を保存して統合した差分を削除する。
+    続けて更新された場合は最新のデータのみを保存する。
+    一部のカラムのみを更新・取得した場合はデータフレームを預からず、統合時にデータ全体を取得する。
+    """
+
+    def __init__(self, max_patches: int, delay: float) -> None:
+        self.max_patches = max_patches
+        self.delay = delay
+        # csv_id -> (統合する時刻, データフレーム, 最後の差分のid, プロファイル)
+        self._pending: Dict[
+            str, Tuple[float, Optional[DataFrame], int, Optional[Dict[str, Any]]]
+        ] = {}
+        self._busy = False
+        self._thread: Optional[threading.Thread] = None
+        self._condition = threading.Condition()
+        self.compactions = 0
+        self.stale = 0
+        self.failures = 0
+
+    def schedule(
+        self,
+        csv_id: str,
+        df: Optional[DataFrame],
+        patch_id: int,
+        patch_count: int,
+        profile: Optional[Dict[str, Any]] = None,
+        replace: bool = True,
+    ) -> None:
+        """差分の統合を予約する関数（同じcsv_idの予約は最新のものに置き換える）
+
+        Args:
+            csv_id (str): csvの固有id
+            df (Optional[DataFrame]): 差分を適用した最新のデータフレーム
+                （Noneの場合は統合時にGoサーバーから取得する）
+            patch_id (int): dfに反映されている最後の差分のid
+            patch_count (int): Goサーバーに保存されている差分の件数
+            profile (Optional[Dict[str, Any]]): dfのプロファイル（省略時は統合時に作成する）
+            replace (bool): Falseの場合、同じcsv_idの予約が既にあればそのままにする
+        """
+
+        delay = 0.0 if patch_count >= self.max_patches else self.delay
+        self._start()
+        with self._condition:
+            if not replace and csv_id in self._pending:
+                return
+            self._pending[csv_id] = (time.monotonic() + delay, df, patch_id, profile)
+            self._condition.notify_all()
+
+    def discard(self, csv_id: str) -> None:
+        """差分の統合の予約を取り消す関数（全体を保存した場合など）
+
+        Args:
+            csv_id (str): csvの固有id
+        """
+
+        with self._condition:
+            self._pending.pop(csv_id, None)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """予約されている統合をすぐに行い、すべて終わるまで待つ関数
+
+        Args:
+            timeout (Optional[float]): 待つ最大秒数（Noneの場合は無制限）
+
+        Returns:
+            bool: 時間内にすべて統合された場合はTrue
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._pending = {
+                csv_id: (0.0, *entry[1:]) for csv_id, entry in self._pending.items()
+            }
+            self._condition.notify_all()
+            while self._pending or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """統合の統計情報を取得する関数
+
+        Returns:
+            Dict[str, Any]: 統合待ちの件数、統合した回数、既に統合済みだった回数、失敗した回数、
+                統合する差分の件数と統合までの秒数（float）の設定
+        """
+
+        with self._condition:
+            return {
+                "pending": len(self._pending),
+                "compactions": self.compactions,
+                "stale": self.stale,
+                "failures": self.failures,
+                "max_patches": self.max_patches,
+                "delay": self.delay,
+            }
+
+    def _start(self) -> None:
+        """バックグラウンドのスレッドを起動する関数（forkしたプロセスでも最初の利用時に起動する）"""
+
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="patch-compactor", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.flush, CSV_COMPACT_SHUTDOWN_TIMEOUT)
+
+    def _run(self) -> None:
+        """統合する時刻になった差分を順に統合し続ける関数"""
+
+        while True:
+            with self._condition:
+                while True:
+                    if not self._pending:
+                        self._condition.wait()
+                        continue
+                    csv_id = min(self._pending, key=lambda key: self._pending[key][0])
+                    remaining = self._pending[csv_id][0] - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                _, df, patch_id, profile = self._pending.pop(csv_id)
+                self._busy = True
+
+            try:
+                self._compact(csv_id, df, patch_id, profile)
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
+
+    def _compact(
+        self,
+        csv_id: str,
+        df: Optional[DataFrame],
+        patch_id: int,
+        profile: Optional[Dict[str, Any]],
+    ) -> None:
+        """データ全体を保存し、patch_id以前の差分を削除する関数
+
+        データの内容は変わらないため、キャッシュは破棄しない
+        """
+
         try:
-            # レスポンスからJSONデータを取得し、エラーメッセージを表示
-            error_response = response.json()
-            error_message = error_response.get("error", "Unknown error occurred")
-            message = error_response.get("message", "Unkown message")
-            print(f"エラーが発生しました: {error_message}")
-            print(f"メッセージ: {message}")
-            return jsonify({"error": f"{error_message}"}), 500
-        except ValueError:
-            # JSONでない場合のエラーメッセージを表示
-            print(f"エラーレスポンス: {response.text}")
-        return jsonify({"error": "Failed to upload data to Go API"}), 500
+            if df is None:
+                df, patch_id = self._fetch(csv_id)
+                if df is None:
+                    return  # 既に統合済み
+            if profile is None:
+                profile = build_profile(df)
+            response = send_csv(
+                csv_id=csv_id, df=df, profile=profile, applied_patch_id=patch_id
+            )
+            status_code = response.status_code
+        except Exception as e:
+            print("Error compacting patches:", str(e))
+            status_code = None
+
+        with self._condition:
+            if status_code == 200:
+                self.compactions += 1
+            elif status_code == 409:
+                # 既に新しいデータで上書きされている
+                self.stale += 1
+            else:
+                self.failures += 1
+
+    def _fetch(self, csv_id: str) -> Tuple[Optional[DataFrame], int]:
+        """Goサーバーからデータ全体を取得し、保存されている差分をすべて適用する関数
+
+        Returns:
+            Tuple[Optional[DataFrame], int]: データフレームと最後の差分のid
+                （差分が無い場合はNone）
+        """
+
+        response = go_api.get(f"/get_csv/{csv_id}", endpoint="/get_csv")
+        response.raise_for_status()
+        df, _, patches, _ = decode_csv_files(response.json()["file"])
+        if not patches:
+            return None, 0
+
+        patch_id = patches[-1]["patch_id"]
+        with self._condition:
+            # 取得したデータに含まれる差分の予約はこの統合で済む
+            entry = self._pending.get(csv_id)
+            if entry is not None and entry[2] <= patch_id:
+                del self._pending[csv_id]
+        return df, patch_id
+
+
+patch_compactor = PatchCompactor(max_patches=CSV_MAX_PATCHES, delay=CSV_COMPACT_DELAY)
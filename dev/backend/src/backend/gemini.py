@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import google.ai.generativelanguage as glm
+import google.api_core.exceptions
+import google.generativeai as GEMINI
+
+from src.backend.go_api import go_api
+
+# APIキーとクライアントを保持する秒数（環境変数で変更可能）
+GEMINI_CLIENT_TTL = float(os.getenv("GEMINI_CLIENT_TTL", "600"))
+
+# 保持するユーザー数の上限（環境変数で変更可能）
+GEMINI_CLIENT_MAX_ENTRIES = int(os.getenv("GEMINI_CLIENT_MAX_ENTRIES", "256"))
+
+# APIキーが無効な場合に返されるエラー（キャッシュを破棄して次回取得し直す）
+AUTH_ERRORS = (
+    google.api_core.exceptions.InvalidArgument,
+    google.api_core.exceptions.PermissionDenied,
+    google.api_core.exceptions.Unauthenticated,
+)
+
+
+class GeminiClientRegistry:
+    """user_idごとにGeminiのAPIキーとクライアントをTTL付きで保持するレジストリ
+
+    GEMINI.configureはプロセス全体の設定を書き換えるため、スレッドで同時に処理すると
+    別のユーザーのAPIキーで生成されることがある。ユーザーごとにAPIキーを設定した
+    クライアントを作成してモデルに渡し、グローバルな設定は使わない。
+    """
+
+    def __init__(self, ttl: float, max_entries: int) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # user_id -> {"expires_at", "api_key", "client", "models"}
+        self._entries: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        # 同じユーザーのAPIキーを同時に取得しないためのロック
+        self._user_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_model(self, user_id: str, model_name: str) -> GEMINI.GenerativeModel:
+        """ユーザーのAPIキーを設定したモデルを取得する関数
+
+        Args:
+            user_id (str): user_id
+            model_name (str): モデル名（gemini-pro, gemini-1.5-flashなど）
+
+        Returns:
+            GEMINI.GenerativeModel: ユーザーのクライアントを使うモデル
+
+        Raises:
+            requests.exceptions.RequestException: APIキーを取得できなかった場合
+        """
+
+        entry = self._get_entry(user_id)
+        with self._lock:
+            model = entry["models"].get(model_name)
+            if model is None:
+                model = GEMINI.GenerativeModel(model_name)
+                # グローバルな設定ではなくユーザーのクライアントを使う
+                model._client = entry["client"]
+                entry["models"][model_name] = model
+            return model
+
+    def invalidate(self, user_id: str) -> None:
+        """ユーザーのAPIキーとクライアントを破棄する関数
+
+        Args:
+            user_id (str): user_id
+        """
+
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def invalidate_on_error(self, user_id: str, error: Exception) -> None:
+        """APIキーが無効なことによるエラーの場合にキャッシュを破棄する関数
+
+        Args:
+            user_id (str): user_id
+            error (Exception): 生成時に発生したエラー
+        """
+
+        if isinstance(error, AUTH_ERRORS):
+            self.invalidate(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """キャッシュの統計情報を取得する関数
+
+        Returns:
+            Dict[str, Any]: ヒット数、ミス数、ヒット率、期限切れ数などの統計情報
+        """
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+            }
+
+    def _get_entry(self, user_id: str) -> Dict[str, Any]:
+        """ユーザーのエントリを取得し、無い場合や期限切れの場合は作成する関数"""
+
+        entry = self._lookup(user_id, count=True)
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            user_lock = self._user_locks.setdefault(user_id, threading.Lock())
+
+        with user_lock:
+            # 待っている間に別のスレッドが作成した場合はそれを使う
+            entry = self._lookup(user_id, count=False)
+            if entry is not None:
+                return entry
+
+            api_key = self._fetch_api_key(user_id)
+            entry = {
+                "expires_at": time.monotonic() + self.ttl,
+                "api_key": api_key,
+                "client": glm.GenerativeServiceClient(
+                    client_options={"api_key": api_key}
+                ),
+                "models": {},
+            }
+            with self._lock:
+                self._entries[user_id] = entry
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    evicted_user_id, _ = self._entries.popitem(last=False)
+                    self._user_locks.pop(evicted_user_id, None)
+                    self.evictions += 1
+            return entry
+
+    def _lookup(self, user_id: str, count: bool) -> Optional[Dict[str, Any]]:
+        """有効期限内のエントリを探す関数"""
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry["expires_at"] <= time.monotonic():
+                del self._entries[user_id]
+                self.expirations += 1
+                entry = None
+            if count:
+                if entry is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+            return entry
+
+    @staticmethod
+    def _fetch_api_key(user_id: str) -> Optional[str]:
+        """GoサーバーからユーザーのAPIキーを取得する関数"""
+
+        # APIキーの取得は読み取りのみなので再試行してよい
+        response = go_api.post(
+            "/users/get/api", json={"user_id": user_id}, idempotent=True
+        )
+        response.raise_for_status()
+        api_key = response.json().get("GeminiApiKey")
+        # 未登録の場合はGEMINI.configureと同じく環境変数のキーを使う
+        return api_key or os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+
+
+gemini_clients = GeminiClientRegistry(
+    ttl=GEMINI_CLIENT_TTL, max_entries=GEMINI_CLIENT_MAX_ENTRIES
+)
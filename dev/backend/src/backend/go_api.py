@@ -0,0 +1,189 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+# 環境変数を読み込む
+load_dotenv()
+
+GO_API_URL = os.getenv("DB_API_URL")
+
+# 接続を確立するまでのタイムアウト秒数（環境変数で変更可能）
+GO_API_CONNECT_TIMEOUT = float(os.getenv("GO_API_CONNECT_TIMEOUT", "3.05"))
+
+# レスポンスを待つタイムアウト秒数（環境変数で変更可能）
+GO_API_READ_TIMEOUT = float(os.getenv("GO_API_READ_TIMEOUT", "30"))
+
+# 冪等なリクエストを再試行する最大回数（環境変数で変更可能）
+GO_API_MAX_RETRIES = int(os.getenv("GO_API_MAX_RETRIES", "2"))
+
+# 再試行までの待ち時間の基準秒数（0.2, 0.4, 0.8...と倍にしていく）
+GO_API_BACKOFF = float(os.getenv("GO_API_BACKOFF", "0.2"))
+
+# 保持しておく接続数の上限（Flaskのスレッド数に合わせる、環境変数で変更可能）
+GO_API_POOL_SIZE = int(os.getenv("GO_API_POOL_SIZE", "16"))
+
+# 再試行するステータスコード（Goサーバーやプロキシの一時的なエラー）
+RETRY_STATUS_CODES = {502, 503, 504}
+
+# エンドポイントごとに保持するレイテンシのサンプル数
+LATENCY_SAMPLES = 1000
+
+# 大学で行うときはここを有効に
+PROXIES = {"http": None, "https": None}
+
+
+class GoApiClient:
+    """GoのデータベースAPIを呼び出すクライアント
+
+    1つのSessionを共有して接続を使い回し（keep-alive）、すべての呼び出しにタイムアウトを設定する。
+    冪等なリクエストは接続エラー・タイムアウト・一時的なエラーの場合に間隔を空けて再試行する。
+    エンドポイントごとに呼び出し回数やレイテンシを記録する。
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str],
+        connect_timeout: float,
+        read_timeout: float,
+        max_retries: int,
+        backoff: float,
+        pool_size: int,
+    ) -> None:
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # エンドポイント -> 統計情報
+        self._metrics: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        endpoint: Optional[str] = None,
+        idempotent: Optional[bool] = None,
+        **kwargs: Any,
+    ) -> requests.Response:
+        """GoのAPIを呼び出す関数
+
+        Args:
+            method (str): HTTPメソッド
+            path (str): パス（/get_csv/<csv_id>など）
+            endpoint (Optional[str]): 統計情報をまとめる名前（省略時はpath）
+            idempotent (Optional[bool]): 再試行してよいかどうか（省略時はGETのみ再試行する）
+            **kwargs (Any): requestsに渡す引数（json, files, dataなど）
+
+        Returns:
+            requests.Response: レスポンス
+
+        Raises:
+            requests.exceptions.RequestException: 再試行しても接続できなかった場合など
+        """
+
+        if idempotent is None:
+            idempotent = method.upper() == "GET"
+        retries = self.max_retries if idempotent else 0
+        kwargs.setdefault("timeout", self.timeout)
+        kwargs.setdefault("proxies", PROXIES)
+
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(
+                    method, f"{self.base_url}{path}", **kwargs
+                )
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= retries:
+                    self._record(endpoint or path, start, attempt, response.status_code)
+                    return response
+                response.close()  # 接続をプールに戻してから再試行
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ):
+                if attempt >= retries:
+                    self._record(endpoint or path, start, attempt, None)
+                    raise
+
+            time.sleep(self.backoff * (2**attempt))
+            attempt += 1
+
+    def get(self, path: str, **kwargs: Any) -> requests.Response:
+        """GETでGoのAPIを呼び出す関数（引数はrequestと同じ）"""
+
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs: Any) -> requests.Response:
+        """POSTでGoのAPIを呼び出す関数（引数はrequestと同じ）"""
+
+        return self.request("POST", path, **kwargs)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """エンドポイントごとの統計情報を取得する関数
+
+        Returns:
+            Dict[str, Dict[str, Any]]: 呼び出し回数、エラー数、再試行回数、レイテンシ（ミリ秒）
+        """
+
+        with self._lock:
+            stats = {}
+            for endpoint, metrics in self._metrics.items():
+                latencies = sorted(metrics["latencies"])
+                stats[endpoint] = {
+                    "calls": metrics["calls"],
+                    "errors": metrics["errors"],
+                    "retries": metrics["retries"],
+                    "avg_ms": round(metrics["total_ms"] / metrics["calls"], 2),
+                    "p50_ms": round(latencies[len(latencies) // 2], 2),
+                    "p95_ms": round(latencies[int(len(latencies) * 0.95)], 2),
+                    "max_ms": round(metrics["max_ms"], 2),
+                }
+            return stats
+
+    def _record(
+        self, endpoint: str, start: float, retries: int, status_code: Optional[int]
+    ) -> None:
+        """呼び出し結果を統計情報に記録する関数"""
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            metrics = self._metrics.setdefault(
+                endpoint,
+                {
+                    "calls": 0,
+                    "errors": 0,
+                    "retries": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "latencies": deque(maxlen=LATENCY_SAMPLES),
+                },
+            )
+            latencies: Deque[float] = metrics["latencies"]
+            metrics["calls"] += 1
+            metrics["retries"] += retries
+            if status_code is None or status_code >= 500:
+                metrics["errors"] += 1
+            metrics["total_ms"] += elapsed_ms
+            metrics["max_ms"] = max(metrics["max_ms"], elapsed_ms)
+            latencies.append(elapsed_ms)
+
+
+go_api = GoApiClient(
+    base_url=GO_API_URL,
+    connect_timeout=GO_API_CONNECT_TIMEOUT,
+    read_timeout=GO_API_READ_TIMEOUT,
+    max_retries=GO_API_MAX_RETRIES,
+    backoff=GO_API_BACKOFF,
+    pool_size=GO_API_POOL_SIZE,
+)
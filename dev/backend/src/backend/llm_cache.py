@@ -0,0 +1,227 @@
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from typing import Any, Dict, List, Optional, Tuple
+
+# 応答を再利用する秒数（0の場合はキャッシュしない、環境変数で変更可能）
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+
+# メモリ上に保持する応答の上限（環境変数で変更可能）
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+
+# 応答を保存するSQLiteファイル（空の場合はメモリ上のみ、環境変数で変更可能）
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./cache/llm_responses.sqlite3")
+
+# この回数保存するごとに期限切れの応答をファイルから削除する
+PURGE_INTERVAL = 100
+
+
+def make_key(
+    model_name: str, contents: Any, generation_config: Optional[Dict[str, Any]] = None
+) -> str:
+    """モデル名・プロンプト・画像・生成設定からキャッシュのキーを作成する関数
+
+    画像はBase64文字列で渡された場合も復号したバイト列で計算するため、
+    グラフのパラメータから描画した画像と同じ画像であれば同じキーになる。
+
+    Args:
+        model_name (str): モデル名
+        contents (Any): generate_contentに渡す内容（文字列もしくはリスト）
+        generation_config (Optional[Dict[str, Any]]): 生成設定
+
+    Returns:
+        str: キャッシュのキー（SHA-256）
+    """
+
+    digest = hashlib.sha256()
+    header = {"model": model_name, "generation_config": generation_config or {}}
+    digest.update(json.dumps(header, sort_keys=True).encode("utf-8"))
+
+    parts = contents if isinstance(contents, list) else [contents]
+    for part in parts:
+        if isinstance(part, dict) and "data" in part:
+            data = part["data"]
+            if isinstance(data, str):
+                data = base64.b64decode(data)
+            digest.update(f"\0image:{part.get('mime_type', '')}:".encode("utf-8"))
+            digest.update(hashlib.sha256(data).digest())
+        else:
+            digest.update(b"\0text:")
+            digest.update(str(part).encode("utf-8"))
+
+    return digest.hexdigest()
+
+
+class LLMResponseCache:
+    """LLMの応答をキーごとにTTL付きで保持するキャッシュ
+
+    メモリ上のLRUとSQLiteファイルの2段構成で、ファイルはプロセスの再起動後や
+    複数のワーカープロセスの間でも共有される。
+    """
+
+    def __init__(self, ttl: float, max_entries: int, path: Optional[str]) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path or None
+        # キー -> (保存した時刻, 応答)
+        self._memory: OrderedDict[str, Tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._initialized = False
+        self._puts = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """キャッシュから応答を取得する関数
+
+        Args:
+            key (str): make_keyで作成したキー
+
+        Returns:
+            Optional[str]: 応答（無い場合や期限切れの場合はNone）
+        """
+
+        if self.ttl <= 0:
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] + self.ttl > now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._memory.pop(key, None)
+
+        row = self._read(key, now - self.ttl)
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._put_memory(key, row)
+        return row[1]
+
+    def put(self, key: str, model_name: str, text: str) -> None:
+        """応答をキャッシュに保存する関数（空の応答は保存しない）
+
+        Args:
+            key (str): make_keyで作成したキー
+            model_name (str): モデル名
+            text (str): 応答
+        """
+
+        if self.ttl <= 0 or not text:
+            return
+
+        created_at = time.time()
+        with self._lock:
+            self._put_memory(key, (created_at, text))
+            self._puts += 1
+            purge = self._puts % PURGE_INTERVAL == 0
+
+        self._write(key, model_name, text, created_at, purge)
+
+    def stats(self) -> Dict[str, Any]:
+        """キャッシュの統計情報を取得する関数
+
+        Returns:
+            Dict[str, Any]: ヒット数、ファイルからのヒット数、ミス数、ヒット率など
+        """
+
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            hits = self.hits + self.disk_hits
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "path": self.path,
+            }
+
+    def _put_memory(self, key: str, entry: Tuple[float, str]) -> None:
+        """メモリに応答を保存する関数（ロック取得済みで呼ぶ）"""
+
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """SQLiteファイルに接続する関数（初回はテーブルを作成する）"""
+
+        if self.path is None:
+            return None
+
+        if not self._initialized:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(self.path, timeout=5)
+        if not self._initialized:
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, model TEXT NOT NULL, "
+                    "response TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+            self._initialized = True
+        return conn
+
+    def _read(self, key: str, min_created_at: float) -> Optional[Tuple[float, str]]:
+        """SQLiteファイルから有効期限内の応答を読み込む関数"""
+
+        try:
+            conn = self._connect()
+            if conn is None:
+                return None
+            with closing(conn):
+                rows: List[Tuple[float, str]] = conn.execute(
+                    "SELECT created_at, response FROM responses "
+                    "WHERE key = ? AND created_at > ?",
+                    (key, min_created_at),
+                ).fetchall()
+        except (OSError, sqlite3.Error) as e:
+            print("LLM cache read error:", str(e))
+            return None
+        return rows[0] if rows else None
+
+    def _write(
+        self, key: str, model_name: str, text: str, created_at: float, purge: bool
+    ) -> None:
+        """SQLiteファイルに応答を保存する関数"""
+
+        try:
+            conn = self._connect()
+            if conn is None:
+                return
+            with closing(conn), conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                    (key, model_name, text, created_at),
+                )
+                if purge:
+                    conn.execute(
+                        "DELETE FROM responses WHERE created_at <= ?",
+                        (created_at - self.ttl,),
+                    )
+        except (OSError, sqlite3.Error) as e:
+            print("LLM cache write error:", str(e))
+
+
+llm_cache = LLMResponseCache(
+    ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES, path=LLM_CACHE_PATH
+)
@@ -0,0 +1,197 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from column_types import infer_column_types
+from data_utils import get_data_info, get_miss_columns
+from pandas import DataFrame
+
+from src.backend.storage import get_dtypes
+
+# プロファイルの形式のバージョン（形式を変更した場合は上げる）
+PROFILE_FORMAT_VERSION = 1
+
+# 質的変数ごとに保存するユニークな値の上限（環境変数で変更可能）
+PROFILE_MAX_DISTINCT = int(os.getenv("PROFILE_MAX_DISTINCT", "1000"))
+
+# メモリ上に保持するプロファイルの上限（環境変数で変更可能）
+PROFILE_CACHE_MAX_ENTRIES = int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "128"))
+
+
+def build_profile(df: DataFrame) -> Dict[str, Any]:
+    """データフレームからカラムのプロファイルを作成する関数
+
+    メタデータを返すapi（get_quantitative, get_qualitative, get_miss_columns,
+    get_data_info など）はこのプロファイルだけで応答できる
+
+    Args:
+        df (DataFrame): 型適応済みのデータフレーム
+
+    Returns:
+        Dict[str, Any]: カラムの型・欠損値・ユニークな値・統計量をまとめた辞書
+    """
+
+    column_types = infer_column_types(df)
+    qualitative_variables = column_types["qualitative"]
+
+    # 質的変数のユニークな値（上限を超えた場合は打ち切る）
+    qualitative_values = {}
+    for col in qualitative_variables:
+        values = df[col].dropna().unique()
+        qualitative_values[col] = {
+            "values": values[:PROFILE_MAX_DISTINCT].tolist(),
+            "truncated": len(values) > PROFILE_MAX_DISTINCT,
+        }
+
+    return {
+        "format_version": PROFILE_FORMAT_VERSION,
+        "data_rows": len(df),
+        "data_columns": len(df.columns),
+        "dtypes": get_dtypes(df),
+        "null_counts": {col: int(count) for col, count in df.isnull().sum().items()},
+        "quantitative_variables": column_types["quantitative"],
+        "qualitative_variables": qualitative_variables,
+        "qualitative_values": qualitative_values,
+        "miss_columns": get_miss_columns(df=df),
+        "data_info": get_data_info(df=df),
+    }
+
+
+def merge_profile(
+    profile: Dict[str, Any], df: DataFrame, columns: List[str]
+) -> Dict[str, Any]:
+    """一部のカラムのみを変更・追加した場合にプロファイルを更新する関数
+
+    dfにあるカラムのみ作成し直し、それ以外のカラムは元のプロファイルの値を使う
+
+    Args:
+        profile (Dict[str, Any]): 変更前のデータ全体のプロファイル
+        df (DataFrame): 変更・追加したカラムのみのデータフレーム
+        columns (List[str]): 変更後のデータ全体のカラム名（並び順もこれに合わせる）
+
+    Returns:
+        Dict[str, Any]: 変更後のデータ全体のプロファイル
+    """
+
+    partial = build_profile(df)
+    changed = set(df.columns)
+    order = {col: i for i, col in enumerate(columns)}
+
+    def merge_names(old: List[str], new: List[str]) -> List[str]:
+        names = [col for col in old if col not in changed] + new
+        return sorted(names, key=order.__getitem__)
+
+    def merge_dict(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+        merged = {col: value for col, value in old.items() if col not in changed}
+        merged.update(new)
+        return {col: merged[col] for col in columns if col in merged}
+
+    def merge_info(old: List[Dict[str, Any]], new: List[Dict[str, Any]]) -> List:
+        infos = [info for info in old if info["column_name"] not in changed] + new
+        return sorted(infos, key=lambda info: order[info["column_name"]])
+
+    return {
+        "format_version": PROFILE_FORMAT_VERSION,
+        "data_rows": len(df),
+        "data_columns": len(columns),
+        "dtypes": merge_dict(profile["dtypes"], partial["dtypes"]),
+        "null_counts": merge_dict(profile["null_counts"], partial["null_counts"]),
+        "quantitative_variables": merge_names(
+            profile["quantitative_variables"], partial["quantitative_variables"]
+        ),
+        "qualitative_variables": merge_names(
+            profile["qualitative_variables"], partial["qualitative_variables"]
+        ),
+        "qualitative_values": merge_dict(
+            profile["qualitative_values"], partial["qualitative_values"]
+        ),
+        "miss_columns": {
+            key: merge_names(profile["miss_columns"][key], names)
+            for key, names in partial["miss_columns"].items()
+        },
+        "data_info": {
+            key: merge_info(profile["data_info"][key], infos)
+            for key, infos in partial["data_info"].items()
+        },
+    }
+
+
+def encode_profile(profile: Dict[str, Any]) -> Tuple[str, bytes, str]:
+    """プロファイルを保存用のバイト列に変換する関数
+
+    Args:
+        profile (Dict[str, Any]): プロファイル
+
+    Returns:
+        Tuple[str, bytes, str]: ファイル名、バイト列、MIMEタイプ
+    """
+
+    content = json.dumps(profile, ensure_ascii=False, default=str).encode("utf-8")
+    return ("profile.json", content, "application/json")
+
+
+def decode_profile(content: bytes) -> Optional[Dict[str, Any]]:
+    """保存されているバイト列をプロファイルに変換する関数
+
+    Args:
+        content (bytes): データベースに保存されているプロファイル
+
+    Returns:
+        Optional[Dict[str, Any]]: プロファイル（形式が古い場合はNone）
+    """
+
+    profile = json.loads(content.decode("utf-8"))
+    if profile.get("format_version") != PROFILE_FORMAT_VERSION:
+        return None
+    return profile
+
+
+class ProfileStore:
+    """プロファイルをcsv_idとデータのバージョンをキーに保持するLRUキャッシュ
+
+    バージョンはdataframe_cacheと共通で、データが更新されると古いプロファイルは参照されない
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        # csv_id -> (version, プロファイル)
+        self._entries: OrderedDict[str, Tuple[int, Dict[str, Any]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, csv_id: str, version: int) -> Optional[Dict[str, Any]]:
+        """プロファイルを取得する関数
+
+        Args:
+            csv_id (str): csvの固有id
+            version (int): データのバージョン
+
+        Returns:
+            Optional[Dict[str, Any]]: プロファイル（無い場合やバージョンが古い場合はNone）
+        """
+
+        with self._lock:
+            entry = self._entries.get(csv_id)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(csv_id)
+            return entry[1]
+
+    def put(self, csv_id: str, version: int, profile: Dict[str, Any]) -> None:
+        """プロファイルを保存する関数
+
+        Args:
+            csv_id (str): csvの固有id
+            version (int): データのバージョン
+            profile (Dict[str, Any]): プロファイル
+        """
+
+        with self._lock:
+            self._entries[csv_id] = (version, profile)
+            self._entries.move_to_end(csv_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+profile_store = ProfileStore(max_entries=PROFILE_CACHE_MAX_ENTRIES)
@@ -0,0 +1,265 @@
+import io
+import json
+import os
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+from pandas import DataFrame
+
+from src.backend.uploads import stream_size
+
+try:
+    import pyarrow  # noqa: F401
+
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+# Parquetファイルの先頭に付くマジックナンバー
+PARQUET_MAGIC = b"PAR1"
+
+# データの保存形式（"parquet" or "csv"）
+STORAGE_FORMAT = os.getenv(
+    "CSV_STORAGE_FORMAT", "parquet" if PARQUET_AVAILABLE else "csv"
+)
+
+
+def use_parquet() -> bool:
+    """Parquet形式で保存するかどうかを判定する関数
+
+    Returns:
+        bool: Parquet形式で保存する場合はTrue
+    """
+
+    return STORAGE_FORMAT == "parquet" and PARQUET_AVAILABLE
+
+
+def is_parquet(content: bytes) -> bool:
+    """保存されているデータがParquet形式かどうかを判定する関数
+
+    Args:
+        content (bytes): データベースに保存されているデータ
+
+    Returns:
+        bool: Parquet形式の場合はTrue
+    """
+
+    return content[:4] == PARQUET_MAGIC
+
+
+def get_dtypes(df: DataFrame) -> Dict[str, str]:
+    """データフレームの各カラムの型情報を取得する関数
+
+    Args:
+        df (DataFrame): データフレーム
+
+    Returns:
+        Dict[str, str]: カラム名と型名の辞書
+    """
+
+    return {col: str(dtype) for col, dtype in df.dtypes.items()}
+
+
+def encode_dataframe(df: DataFrame) -> Tuple[str, BinaryIO, str]:
+    """データフレームを保存用のバイト列に変換する関数
+
+    Parquet形式ではスキーマがファイルに埋め込まれるため、型情報がそのまま復元される。
+    CSV形式も文字列を経由せずにバイト列として書き込み、どちらもコピーせずに
+    送信できるようBytesIOのまま返す。
+
+    Args:
+        df (DataFrame): データフレーム
+
+    Returns:
+        Tuple[str, BinaryIO, str]: ファイル名、バイト列（BytesIO）、MIMEタイプ
+    """
+
+    buf = io.BytesIO()
+    if use_parquet():
+        df.to_parquet(buf, engine="pyarrow", compression="zstd", index=False)
+        buf.seek(0)
+        return ("data.parquet", buf, "application/vnd.apache.parquet")
+
+    df.to_csv(buf, index=False, encoding="utf-8")
+    buf.seek(0)
+    return ("data.csv", buf, "text/csv")
+
+
+def encode_dtypes(dtypes: Dict[str, str]) -> Tuple[str, bytes, str]:
+    """各カラムの型情報を保存用のバイト列に変換する関数
+
+    Args:
+        dtypes (Dict[str, str]): 各カラムの型情報（get_dtypesの結果）
+
+    Returns:
+        Tuple[str, bytes, str]: ファイル名、バイト列、MIMEタイプ
+    """
+
+    return ("data.json", json.dumps(dtypes).encode("utf-8"), "application/json")
+
+
+def encode_columns(df: DataFrame, columns: List[str]) -> Tuple[str, BinaryIO, str]:
+    """変更したカラムのみを更新差分としてParquet形式のバイト列に変換する関数
+
+    Args:
+        df (DataFrame): データフレーム
+        columns (List[str]): 変更・追加したカラム名（複数のカラムを1つの差分にまとめる）
+
+    Returns:
+        Tuple[str, BinaryIO, str]: ファイル名、バイト列（BytesIO）、MIMEタイプ
+    """
+
+    buf = io.BytesIO()
+    df[columns].to_parquet(buf, engine="pyarrow", compression="zstd", index=False)
+    buf.seek(0)
+    return ("patch.parquet", buf, "application/vnd.apache.parquet")
+
+
+def make_files(
+    df: DataFrame,
+    profile_file: Optional[Tuple[str, bytes, str]] = None,
+    csv_file: Optional[Tuple[str, Union[bytes, BinaryIO], str]] = None,
+) -> Dict[str, Tuple[str, Union[bytes, BinaryIO], str]]:
+    """Goサーバーへ送信するファイルを作成する関数
+
+    Args:
+        df (DataFrame): データフレーム
+        profile_file (Optional[Tuple[str, bytes, str]]): データと一緒に保存するプロファイル
+        csv_file (Optional[Tuple[str, Union[bytes, BinaryIO], str]]): 保存形式に変換済みの
+            データ（アップロードされたCSVなど、省略時はdfから作成する）
+
+    Returns:
+        Dict[str, Tuple[str, Union[bytes, BinaryIO], str]]: requestsのfilesに渡す辞書
+    """
+
+    files = {
+        "csv_file": csv_file or encode_dataframe(df),
+        "json_file": encode_dtypes(get_dtypes(df)),
+    }
+
+    if profile_file is not None:
+        files["profile_file"] = profile_file
+
+    return files
+
+
+def make_payload(
+    df: DataFrame,
+    profile_file: Optional[Tuple[str, bytes, str]] = None,
+    csv_file: Optional[Tuple[str, Union[bytes, BinaryIO], str]] = None,
+    data_size: Optional[int] = None,
+) -> Tuple[Dict[str, Tuple[str, Union[bytes, BinaryIO], str]], Dict[str, int]]:
+    """Goサーバーへ送信するファイルとデータの情報を作成する関数
+
+    保存形式への変換は1回だけ行い、データの大きさは変換結果から求める
+    （アップロードとアップデートで共通）
+
+    Args:
+        df (DataFrame): データフレーム
+        profile_file (Optional[Tuple[str, bytes, str]]): データと一緒に保存するプロファイル
+        csv_file (Optional[Tuple[str, Union[bytes, BinaryIO], str]]): 保存形式に変換済みの
+            データ（省略時はdfから作成する）
+        data_size (Optional[int]): データのバイト数（省略時は送信するデータの大きさ）
+
+    Returns:
+        Tuple[Dict[str, Tuple[str, Union[bytes, BinaryIO], str]], Dict[str, int]]:
+            requestsのfilesに渡す辞書と、data_size, data_columns, data_rowsの辞書
+    """
+
+    files = make_files(df, profile_file=profile_file, csv_file=csv_file)
+
+    if data_size is None:
+        content = files["csv_file"][1]
+        data_size = len(content) if isinstance(content, bytes) else stream_size(content)
+
+    data_info = {
+        "data_size": data_size,
+        "data_columns": len(df.columns),
+        "data_rows": len(df),
+    }
+
+    return files, data_info
+
+
+def decode_dataframe(content: bytes, columns: Optional[List[str]] = None) -> DataFrame:
+    """保存されているバイト列をデータフレームに変換する関数
+
+    Parquet形式の場合は型情報込みで復元し、CSV形式の場合は文字列として読み込む
+    （CSV形式の場合は呼び出し側でset_dtypesを適用する必要がある）。
+    columnsを指定した場合は、そのカラムのみを読み込む（Parquet形式では
+    他のカラムは展開されず、CSV形式では解析されない）。
+
+    Args:
+        content (bytes): データベースに保存されているデータ
+        columns (Optional[List[str]]): 読み込むカラム名（Noneの場合はすべて）
+
+    Returns:
+        DataFrame: データフレーム
+    """
+
+    if is_parquet(content):
+        return pd.read_parquet(io.BytesIO(content), engine="pyarrow", columns=columns)
+
+    if columns is not None and not columns:
+        # カラムを読み込まない場合も行数は必要なので、先頭のカラムで行数を求める
+        df = pd.read_csv(io.StringIO(content.decode("utf-8")), usecols=[0])
+        return df.iloc[:, :0]
+
+    return pd.read_csv(io.StringIO(content.decode("utf-8")), usecols=columns)
+
+
+def patch_columns(content: bytes) -> List[str]:
+    """更新差分に含まれるカラム名を取得する関数
+
+    1つの差分に複数のカラムが含まれる場合があるため、差分に記録されたカラム名ではなく
+    Parquetのスキーマ（ファイル末尾のフッターのみを読み込む）から求める。
+
+    Args:
+        content (bytes): Parquet形式の更新差分
+
+    Returns:
+        List[str]: カラム名
+    """
+
+    import pyarrow.parquet as pq
+
+    return pq.read_schema(io.BytesIO(content)).names
+
+
+def apply_patches(
+    df: DataFrame, patches: List[bytes], columns: Optional[List[str]] = None
+) -> DataFrame:
+    """列ごとの更新差分を保存された順にデータフレームへ適用する関数
+
+    既存のカラムは同じ位置で置き換え、新しいカラムは末尾に追加する
+    （ルートでdf[column]に代入した場合と同じ並びになる）。
+    columnsを指定した場合は、差分のうちそのカラムのみを読み込んで適用する。
+
+    Args:
+        df (DataFrame): 元のデータフレーム
+        patches (List[bytes]): Parquet形式の更新差分
+        columns (Optional[List[str]]): 適用するカラム名（Noneの場合はすべて）
+
+    Returns:
+        DataFrame: 差分を適用したデータフレーム
+
+    Raises:
+        ValueError: 差分の行数が元のデータと異なる場合
+    """
+
+    for content in patches:
+        names = None
+        if columns is not None:
+            names = [col for col in patch_columns(content) if col in columns]
+            if not names:
+                continue
+        patch = pd.read_parquet(io.BytesIO(content), engine="pyarrow", columns=names)
+        if len(patch) != len(df):
+            raise ValueError(
+                f"patch has {len(patch)} rows but the data has {len(df)} rows"
+            )
+        for column in patch.columns:
+            # 行の並びは同じなので、インデックスを揃えずに値のみを代入する
+            df[column] = patch[column].values
+
+    return df
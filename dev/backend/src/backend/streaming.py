@@ -0,0 +1,82 @@
+import json
+from typing import Any, Callable, Dict, Iterable, Iterator
+
+from flask import request, stream_with_context
+from flask.wrappers import Response
+
+
+def wants_stream(data: Dict[str, Any]) -> bool:
+    """ストリーミングで返すかどうかを判定する関数
+
+    リクエストのstreamがtrueの場合か、Acceptでtext/event-streamが優先された場合に
+    ストリーミングで返す。それ以外は従来どおりJSONで返す。
+
+    Args:
+        data (Dict[str, Any]): リクエストのJSON
+
+    Returns:
+        bool: ストリーミングで返す場合はTrue
+    """
+
+    if data.get("stream"):
+        return True
+    best = request.accept_mimetypes.best_match(
+        ["application/json", "text/event-stream"], default="application/json"
+    )
+    return best == "text/event-stream"
+
+
+def format_event(event: str, data: Dict[str, Any]) -> str:
+    """Server-Sent Eventsの1イベントを作成する関数
+
+    Args:
+        event (str): イベント名（chunk, done, error）
+        data (Dict[str, Any]): 送るデータ
+
+    Returns:
+        str: SSE形式の文字列
+    """
+
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def stream_text(
+    chunks: Iterable[Any], key: str, on_complete: Callable[[str], None]
+) -> Response:
+    """モデルの応答をServer-Sent Eventsで逐次返す関数
+
+    チャンクが届くたびにchunkイベント（{"text": 差分}）を送り、生成が終わったら
+    on_completeに全文を渡してからdoneイベント（{key: 全文}）を送る。
+    途中で失敗した場合はerrorイベントを送り、on_completeは呼ばない。
+
+    Args:
+        chunks (Iterable[Any]): textを持つチャンク（generate_content(stream=True)）もしくは
+            文字列を返すイテラブル
+        key (str): doneイベントで全文を入れるキー（非ストリーミング時のJSONと同じ）
+        on_complete (Callable[[str], None]): 全文を受け取って保存する関数
+
+    Returns:
+        Response: text/event-streamのレスポンス
+    """
+
+    def generate() -> Iterator[str]:
+        parts = []
+        try:
+            for chunk in chunks:
+                text = chunk if isinstance(chunk, str) else chunk.text
+                if not text:
+                    continue
+                parts.append(text)
+                yield format_event("chunk", {"text": text})
+
+            full_text = "".join(parts)
+            on_complete(full_text)
+            yield format_event("done", {key: full_text})
+        except Exception as e:
+            yield format_event("error", {"error": f"エラーが発生しました: {str(e)}"})
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    # nginxなどのプロキシでバッファリングさせない
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
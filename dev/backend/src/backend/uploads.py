@@ -0,0 +1,127 @@
+import io
+import os
+import uuid
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+import pandas as pd
+from pandas import DataFrame
+
+# Goサーバーへ送信する際に一度に読み込むバイト数（環境変数で変更可能）
+UPLOAD_BLOCK_SIZE = int(os.getenv("UPLOAD_BLOCK_SIZE", str(1024 * 1024)))
+
+# 欠損値として扱う文字列（pandasの既定の欠損値に加える）
+NA_VALUES = ["null", ""]
+
+FileContent = Union[bytes, BinaryIO]
+
+
+def stream_size(stream: BinaryIO) -> int:
+    """ストリームのバイト数を取得する関数（読み込み位置は先頭に戻す）
+
+    Args:
+        stream (BinaryIO): アップロードされたファイルのストリーム
+
+    Returns:
+        int: バイト数
+    """
+
+    stream.seek(0, io.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return size
+
+
+def read_csv_stream(stream: BinaryIO) -> DataFrame:
+    """アップロードされたCSVをストリームから直接読み込む関数
+
+    ファイル全体を文字列に変換せず、pandasがバイト列を少しずつ読み込みながら
+    UTF-8として解析する。読み込み後は位置を先頭に戻す。
+
+    Args:
+        stream (BinaryIO): アップロードされたファイルのストリーム
+
+    Returns:
+        DataFrame: データフレーム
+
+    Raises:
+        UnicodeDecodeError: UTF-8でない場合
+        pd.errors.ParserError: CSVとして解析できない場合
+        pd.errors.EmptyDataError: 空のファイルの場合
+    """
+
+    stream.seek(0)
+    try:
+        return pd.read_csv(
+            stream,
+            encoding="utf-8",
+            na_values=NA_VALUES,  # ここでnullや空文字をNaNとして認識
+            keep_default_na=True,  # デフォルトのNaN認識を保持
+        )
+    finally:
+        stream.seek(0)
+
+
+class MultipartStream:
+    """multipart/form-dataのリクエストボディを少しずつ作成するイテラブル
+
+    requestsのfilesはファイルの内容をすべてメモリに読み込んでからボディを作成するため、
+    一時ファイルなどのストリームはブロックごとに読みながら送信する。
+    長さを事前に計算してContent-Lengthを設定するため、chunked転送にはならない。
+    """
+
+    def __init__(
+        self,
+        fields: Dict[str, Any],
+        files: Dict[str, Tuple[str, FileContent, str]],
+    ) -> None:
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self._parts: List[FileContent] = []
+
+        for name, value in fields.items():
+            self._parts.append(
+                self._part_header(name) + str(value).encode("utf-8") + b"\r\n"
+            )
+        for name, (filename, content, mime_type) in files.items():
+            self._parts.append(self._part_header(name, filename, mime_type))
+            self._parts.append(content)
+            self._parts.append(b"\r\n")
+        self._parts.append(f"--{self.boundary}--\r\n".encode("utf-8"))
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """リクエストに設定するヘッダー"""
+
+        return {"Content-Type": self.content_type}
+
+    def __len__(self) -> int:
+        return sum(
+            len(part) if isinstance(part, bytes) else stream_size(part)
+            for part in self._parts
+        )
+
+    def __iter__(self) -> Iterator[bytes]:
+        for part in self._parts:
+            if isinstance(part, bytes):
+                yield part
+                continue
+            # ストリームは先頭からブロックごとに送る
+            part.seek(0)
+            while True:
+                block = part.read(UPLOAD_BLOCK_SIZE)
+                if not block:
+                    break
+                yield block
+
+    def _part_header(
+        self, name: str, filename: Optional[str] = None, mime_type: Optional[str] = None
+    ) -> bytes:
+        """各パートのヘッダーを作成する関数"""
+
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        header = f"--{self.boundary}\r\nContent-Disposition: {disposition}\r\n"
+        if mime_type is not None:
+            header += f"Content-Type: {mime_type}\r\n"
+        return (header + "\r\n").encode("utf-8")
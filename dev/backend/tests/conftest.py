@@ -0,0 +1,196 @@
+import base64
+import threading
+import time
+from typing import Any, Dict, Iterator, List
+
+import pytest
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+from src.backend.go_api import go_api
+
+
+class GoStandIn:
+    """テスト用にGoのデータベースAPIの代わりをするサーバー
+
+    データ・差分・チャットをメモリに保存する。failで指定したステータスコードを
+    指定した回数だけ返し、slowで指定したパスは指定した秒数だけ待ってから応答する。
+    callsに呼び出されたパスを記録する。
+    """
+
+    def __init__(self) -> None:
+        self.csvs: Dict[str, Dict[str, Any]] = {}
+        self.patches: Dict[str, List[Dict[str, Any]]] = {}
+        self.chats: List[Dict[str, Any]] = []
+        self.calls: List[str] = []
+        self.failures: Dict[str, List[int]] = {}
+        self.delays: Dict[str, float] = {}
+        self.lock = threading.Lock()
+        self.next_patch_id = 0
+        self.app = self._make_app()
+
+    def fail(self, path: str, *status_codes: int) -> None:
+        """pathへの次の呼び出しから順にstatus_codesを返すようにする"""
+
+        with self.lock:
+            self.failures.setdefault(path, []).extend(status_codes)
+
+    def slow(self, path: str, seconds: float) -> None:
+        """pathへの呼び出しにseconds秒かかるようにする"""
+
+        with self.lock:
+            self.delays[path] = seconds
+
+    def _failure(self, path: str):
+        with self.lock:
+            self.calls.append(path)
+            codes = self.failures.get(path)
+            failure = codes.pop(0) if codes else None
+            delay = self.delays.get(path, 0.0)
+        time.sleep(delay)
+        if failure is not None:
+            return jsonify({"error": "injected failure"}), failure
+        return None
+
+    def _make_app(self) -> Flask:
+        app = Flask("go-stand-in")
+
+        @app.route("/get_csv/<csv_id>")
+        def get_csv(csv_id: str):
+            failure = self._failure("/get_csv")
+            if failure:
+                return failure
+            stored = self.csvs.get(csv_id)
+            if stored is None:
+                return jsonify({"error": "CSV file not found"}), 404
+            files = {
+                key: base64.b64encode(value).decode()
+                for key, value in stored.items()
+                if isinstance(value, bytes)
+            }
+            files["patches"] = [
+                dict(patch, patch_file=base64.b64encode(patch["patch_file"]).decode())
+                for patch in self.patches.get(csv_id, [])
+            ]
+            return jsonify({"file": files})
+
+        @app.route("/get_profile/<csv_id>")
+        def get_profile(csv_id: str):
+            failure = self._failure("/get_profile")
+            if failure:
+                return failure
+            stored = self.csvs.get(csv_id)
+            if stored is None or not stored.get("profile_file"):
+                return jsonify({"error": "Profile not found"}), 404
+            profile = base64.b64encode(stored["profile_file"]).decode()
+            return jsonify({"profile_file": profile})
+
+        @app.route("/upload_csv", methods=["POST"])
+        @app.route("/csvs/update", methods=["POST"])
+        def upload_csv():
+            failure = self._failure(request.path)
+            if failure:
+                return failure
+            csv_id = request.form["csv_id"]
+            applied = request.form.get("applied_patch_id")
+            with self.lock:
+                patches = self.patches.get(csv_id, [])
+                if applied is not None:
+                    if not any(p["patch_id"] == int(applied) for p in patches):
+                        return jsonify({"error": "stale"}), 409
+                    patches = [p for p in patches if p["patch_id"] > int(applied)]
+                else:
+                    patches = []
+                self.patches[csv_id] = patches
+                self.csvs[csv_id] = {
+                    key: file.read() for key, file in request.files.items()
+                }
+            return jsonify({"StatusMessage": "Success", "file_name": "data.csv"})
+
+        @app.route("/csvs/update/column", methods=["POST"])
+        def update_column():
+            failure = self._failure("/csvs/update/column")
+            if failure:
+                return failure
+            csv_id = request.form["csv_id"]
+            with self.lock:
+                if csv_id not in self.csvs:
+                    return jsonify({"error": "CSV file not found"}), 400
+                self.next_patch_id += 1
+                self.csvs[csv_id]["json_file"] = request.files["json_file"].read()
+                self.csvs[csv_id]["profile_file"] = request.files["profile_file"].read()
+                self.patches.setdefault(csv_id, []).append(
+                    {
+                        "patch_id": self.next_patch_id,
+                        "csv_id": csv_id,
+                        "column_name": request.form["column_name"],
+                        "patch_file": request.files["patch_file"].read(),
+                    }
+                )
+                count = len(self.patches[csv_id])
+            return jsonify(
+                {
+                    "StatusMessage": "Success",
+                    "file_name": "data.csv",
+                    "patch_id": self.next_patch_id,
+                    "patch_count": count,
+                }
+            )
+
+        @app.route("/csvs/update/profile", methods=["POST"])
+        def update_profile():
+            failure = self._failure("/csvs/update/profile")
+            if failure:
+                return failure
+            csv_id = request.form["csv_id"]
+            with self.lock:
+                self.csvs[csv_id]["profile_file"] = request.files["profile_file"].read()
+            return jsonify({"StatusMessage": "Success"})
+
+        @app.route("/chats/save/chats", methods=["POST"])
+        def save_chats():
+            failure = self._failure("/chats/save/chats")
+            if failure:
+                return failure
+            with self.lock:
+                self.chats.extend(request.get_json()["chats"])
+            return jsonify({"StatusMessage": "Success"})
+
+        @app.route("/users/get/api", methods=["POST"])
+        def get_api():
+            failure = self._failure("/users/get/api")
+            if failure:
+                return failure
+            user_id = request.get_json()["user_id"]
+            return jsonify({"GeminiApiKey": f"key-{user_id}"})
+
+        return app
+
+
+@pytest.fixture
+def go_server(monkeypatch) -> Iterator[GoStandIn]:
+    """Goサーバーの代わりを起動し、go_apiの接続先をそのサーバーにする"""
+
+    stand_in = GoStandIn()
+    server = make_server("127.0.0.1", 0, stand_in.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(go_api, "base_url", f"http://127.0.0.1:{server.port}")
+    monkeypatch.setattr(go_api, "backoff", 0.0)
+    yield stand_in
+    server.shutdown()
+    thread.join()
+
+
+@pytest.fixture
+def client(go_server, monkeypatch, tmp_path):
+    """Goサーバーの代わりにつながるFlaskのテストクライアント
+
+    アップロード時に作成されるディレクトリがリポジトリに残らないよう、一時ディレクトリで実行する
+    """
+
+    from app import app
+
+    monkeypatch.chdir(tmp_path)
+
+    return app.test_client()
@@ -0,0 +1,48 @@
+import time
+import uuid
+
+import pandas as pd
+
+from src.backend.cache import DataFrameCache, dataframe_cache
+from src.backend.csvs import get_csv
+from tests.test_download import upload
+
+
+def test_version_expires_after_ttl():
+    """ttl秒が経つとバージョンが進み、古いバージョンのエントリは参照されない"""
+
+    cache = DataFrameCache(max_entries=4, max_bytes=1024 * 1024, ttl=0.05)
+    df = pd.DataFrame({"x": [1, 2]})
+    cache.put("csv", cache.get_version("csv"), df, {"x": "int64"})
+    assert cache.get("csv") is not None
+
+    time.sleep(0.1)
+
+    assert cache.get("csv") is None
+    assert cache.get_version("csv") == 1
+    stats = cache.stats()
+    assert stats["expirations"] == 1
+    assert stats["entries"] == 0
+
+
+def test_update_from_another_instance_is_read_after_ttl(client, go_server, monkeypatch):
+    """他のインスタンスがGoサーバーのデータを更新しても、ttl秒後には読み直す"""
+
+    monkeypatch.setattr(dataframe_cache, "ttl", 0.2)
+    csv_id = uuid.uuid4().hex
+    upload(client, csv_id, "x\n1\n2\n")
+
+    with client.application.app_context():
+        df, _ = get_csv(csv_id=csv_id)
+        assert df["x"].tolist() == [1, 2]
+
+        # 他のインスタンスでの更新（このプロセスのinvalidateは呼ばれない）
+        other_id = uuid.uuid4().hex
+        upload(client, other_id, "x\n3\n4\n")
+        go_server.csvs[csv_id] = go_server.csvs[other_id]
+        df, _ = get_csv(csv_id=csv_id)
+        assert df["x"].tolist() == [1, 2]
+
+        time.sleep(0.25)
+        df, _ = get_csv(csv_id=csv_id)
+        assert df["x"].tolist() == [3, 4]
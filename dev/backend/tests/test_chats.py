@@ -0,0 +1,158 @@
+import os
+import subprocess
+import sys
+import textwrap
+import time
+from pathlib import Path
+
+from src.backend.chats import ChatWriter
+from src.backend.go_api import go_api
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def make_writer(**kwargs) -> ChatWriter:
+    options = {
+        "max_size": 100,
+        "batch_size": 10,
+        "flush_interval": 0.01,
+        "max_attempts": 3,
+        "retry_backoff": 0.0,
+    }
+    options.update(kwargs)
+    return ChatWriter(**options)
+
+
+def saved_messages(go_server, room_id: str):
+    return [chat["message"] for chat in go_server.chats if chat["room_id"] == room_id]
+
+
+def test_chats_are_saved_in_order(go_server):
+    """複数のバッチに分かれても、積んだ順に保存される"""
+
+    writer = make_writer(batch_size=7)
+    for i in range(50):
+        writer.enqueue("room", i % 2 == 0, f"message{i}", i)
+
+    assert writer.flush(10)
+
+    assert saved_messages(go_server, "room") == [f"message{i}" for i in range(50)]
+    assert [chat["post_id"] for chat in go_server.chats] == list(range(50))
+    stats = writer.stats()
+    assert stats["saved"] == 50
+    assert stats["batches"] == len(go_server.calls) >= 50 // 7
+    assert stats["queued"] == 0
+
+
+def test_failed_batch_is_retried_before_later_chats(go_server):
+    """一時的なエラーの場合は同じchat_idで再送し、後続のchatより先に保存される"""
+
+    go_server.fail("/chats/save/chats", 500, 500)
+    writer = make_writer(batch_size=5)
+    for i in range(20):
+        writer.enqueue("room", True, f"message{i}", i)
+
+    assert writer.flush(10)
+
+    assert saved_messages(go_server, "room") == [f"message{i}" for i in range(20)]
+    assert len({chat["chat_id"] for chat in go_server.chats}) == 20
+    stats = writer.stats()
+    assert stats["retries"] == 2
+    assert stats["dropped"] == 0
+    assert stats["saved"] == 20
+
+
+def test_batch_is_dropped_after_max_attempts(go_server):
+    """再試行しても保存できないバッチは破棄して数え、後続のchatの保存は続ける"""
+
+    writer = make_writer(max_attempts=3)
+    go_server.fail("/chats/save/chats", 500, 500, 500)
+    writer.enqueue("lost", True, "lost", 0)
+    assert writer.flush(10)
+
+    writer.enqueue("room", True, "saved", 1)
+    assert writer.flush(10)
+
+    assert saved_messages(go_server, "lost") == []
+    assert saved_messages(go_server, "room") == ["saved"]
+    stats = writer.stats()
+    assert stats["dropped"] == 1
+    assert stats["retries"] == 2
+    assert stats["saved"] == 1
+
+
+def test_client_error_is_not_retried(go_server):
+    """リクエストが不正な場合（4xx）は再試行せずに破棄する"""
+
+    writer = make_writer()
+    go_server.fail("/chats/save/chats", 400)
+    writer.enqueue("room", True, "invalid", 0)
+
+    assert writer.flush(10)
+
+    assert go_server.calls == ["/chats/save/chats"]
+    assert writer.stats()["retries"] == 0
+    assert writer.stats()["dropped"] == 1
+
+
+def test_full_queue_drops_chat_without_blocking(go_server):
+    """キューが一杯の場合はGoサーバーの応答を待たずに戻り、破棄したchatを数える"""
+
+    go_server.slow("/chats/save/chats", 0.5)
+    writer = make_writer(max_size=2, batch_size=1, flush_interval=0.0)
+    writer.enqueue("room", True, "message0", 0)
+    # 1件目がバックグラウンドで保存中になり、後続の2件でキューが一杯になる
+    while writer.stats()["queued"]:
+        time.sleep(0.001)
+
+    started = time.perf_counter()
+    for i in range(1, 6):
+        writer.enqueue("room", True, f"message{i}", i)
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.25
+    assert writer.flush(10)
+    assert saved_messages(go_server, "room") == ["message0", "message1", "message2"]
+    stats = writer.stats()
+    assert stats["dropped"] == 3
+    assert stats["saved"] == 3
+
+
+def test_flush_times_out_while_go_api_is_slow(go_server):
+    go_server.slow("/chats/save/chats", 0.5)
+    writer = make_writer()
+    writer.enqueue("room", True, "slow", 0)
+
+    assert not writer.flush(0.05)
+    assert writer.flush(10)
+    assert saved_messages(go_server, "room") == ["slow"]
+
+
+def test_pending_chats_are_flushed_at_exit(go_server):
+    """プロセスの終了時に、保存待ちのchatを書き込んでから終了する"""
+
+    go_server.slow("/chats/save/chats", 0.2)
+    script = textwrap.dedent(
+        """
+        from src.backend.chats import chat_writer
+
+        for i in range(30):
+            chat_writer.enqueue("exit", i % 2 == 0, f"message{i}", i)
+        """
+    )
+    env = dict(
+        os.environ,
+        DB_API_URL=go_api.base_url,
+        CHAT_BATCH_SIZE="10",
+        PYTHONPATH=str(BACKEND_DIR),
+    )
+
+    subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=BACKEND_DIR,
+        env=env,
+        check=True,
+        timeout=60,
+    )
+
+    assert saved_messages(go_server, "exit") == [f"message{i}" for i in range(30)]
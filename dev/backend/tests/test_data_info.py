@@ -0,0 +1,124 @@
+import json
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_utils import convert_to_serializable, entropy, format_value, get_data_info
+
+
+def reference_data_info(df: pd.DataFrame):
+    """カラムごとにpandasの集計を呼び出していた以前のget_data_info（NaNはNoneにする）"""
+
+    def value(x):
+        x = format_value(convert_to_serializable(x))
+        return None if isinstance(x, float) and not math.isfinite(x) else x
+
+    qualitative, quantitative = [], []
+    for col in df.columns:
+        s = df[col]
+        common = {
+            "データ型": str(s.dtype),
+            "ユニークな値の数": convert_to_serializable(s.nunique()),
+            "欠損値の数": convert_to_serializable(s.isnull().sum()),
+            "欠損値の割合": value(s.isnull().sum() / len(df)),
+        }
+        if s.dtype in ("int64", "float64"):
+            data = {
+                "平均値": value(s.mean()),
+                "中央値": value(s.median()),
+                "標準偏差": value(s.std()),
+                "最小値": value(s.min()),
+                "最大値": value(s.max()),
+                "第1四分位数": value(s.quantile(0.25)),
+                "第3四分位数": value(s.quantile(0.75)),
+                "歪度": value(s.skew()),
+                "尖度": value(s.kurtosis()),
+                "変動係数": value(s.std() / s.mean() if s.mean() != 0 else np.nan),
+            }
+            quantitative.append({"column_name": col, "common": common, "data": data})
+        else:
+            counts = s.value_counts()
+            data = {
+                "最頻値": convert_to_serializable(
+                    s.mode().iloc[0] if not s.mode().empty else np.nan
+                ),
+                "最頻値の出現回数": convert_to_serializable(
+                    counts.iloc[0] if not counts.empty else np.nan
+                ),
+                "最頻値の割合": value(
+                    counts.iloc[0] / len(df) if not counts.empty else np.nan
+                ),
+                "カテゴリ数": convert_to_serializable(s.nunique()),
+                "エントロピー": value(entropy(s)),
+            }
+            qualitative.append({"column_name": col, "common": common, "data": data})
+    return {"qualitative": qualitative, "quantitative": quantitative}
+
+
+@pytest.fixture
+def mixed():
+    rng = np.random.default_rng(0)
+    n = 500
+    df = pd.DataFrame(
+        {
+            "int": rng.integers(-50, 50, n),
+            "small_int": rng.integers(0, 3, n),
+            "float": rng.normal(size=n),
+            "float_nan": np.where(rng.random(n) < 0.2, np.nan, rng.normal(size=n)),
+            "constant": np.full(n, 2.5),
+            "text": rng.choice(["a", "b", "c"], n),
+            "text_nan": np.where(rng.random(n) < 0.3, None, rng.choice(["x", "y"], n)),
+        }
+    )
+    return df
+
+
+@pytest.mark.filterwarnings("error::RuntimeWarning")
+def test_matches_per_column_statistics(mixed):
+    actual = get_data_info(mixed)
+    expected = reference_data_info(mixed)
+
+    assert [c["column_name"] for c in actual["quantitative"]] == [
+        c["column_name"] for c in expected["quantitative"]
+    ]
+    for a, e in zip(
+        actual["quantitative"] + actual["qualitative"],
+        expected["quantitative"] + expected["qualitative"],
+    ):
+        assert a["common"] == e["common"]
+        assert list(a["data"]) == list(e["data"])
+        for key in e["data"]:
+            assert a["data"][key] == pytest.approx(e["data"][key], abs=1e-3), (
+                a["column_name"],
+                key,
+            )
+
+
+@pytest.mark.parametrize("n_rows", [0, 1, 2, 3])
+@pytest.mark.filterwarnings("error::RuntimeWarning")
+def test_small_data_is_valid_json(mixed, n_rows):
+    """行が少ない・無いデータでも例外にならず、NaNを含まないJSONを返す"""
+
+    info = get_data_info(mixed.iloc[:n_rows])
+
+    json.dumps(info, allow_nan=False)
+    if n_rows == 0:
+        for column in info["quantitative"]:
+            assert column["common"]["欠損値の割合"] is None
+            assert column["data"]["平均値"] is None
+
+
+@pytest.mark.filterwarnings("error::RuntimeWarning")
+def test_all_missing_column_returns_none():
+    df = pd.DataFrame(
+        {"empty": [np.nan] * 4, "nullable": pd.array([None] * 4, "Int64")}
+    )
+
+    info = get_data_info(df)
+
+    json.dumps(info, allow_nan=False)
+    for column in info["quantitative"]:
+        assert set(column["data"].values()) == {None}
+        assert column["common"]["欠損値の割合"] == 1.0
@@ -0,0 +1,94 @@
+import io
+import json
+import uuid
+
+import pandas as pd
+import pytest
+
+from src.backend.cache import dataframe_cache
+from src.backend.csvs import get_csv, patch_compactor
+from src.backend.storage import use_parquet
+
+CSV = "id,score,label\n1,0.5,a\n2,,b\n3,1.5,\n"
+
+
+def upload(client, csv_id: str, body: str = CSV) -> None:
+    data = {
+        "file": (io.BytesIO(body.encode()), "data.csv"),
+        "jsonData": json.dumps({"user_id": "user", "csv_id": csv_id}),
+    }
+    response = client.post("/upload", data=data)
+    assert response.status_code == 200, response.data
+
+
+def test_download_returns_csv(client, go_server):
+    csv_id = uuid.uuid4().hex
+    upload(client, csv_id)
+    if use_parquet():
+        assert go_server.csvs[csv_id]["csv_file"][:4] == b"PAR1"
+
+    response = client.get(f"/download_csv/{csv_id}")
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+    assert f'filename="{csv_id}.csv"' in response.headers["Content-Disposition"]
+    downloaded = pd.read_csv(io.BytesIO(response.data))
+    pd.testing.assert_frame_equal(downloaded, pd.read_csv(io.StringIO(CSV)))
+
+
+def test_download_unknown_csv_returns_error(client):
+    response = client.get(f"/download_csv/{uuid.uuid4().hex}")
+
+    assert response.status_code == 404
+    assert response.is_json
+
+
+def add_patch(client, go_server, csv_id: str) -> None:
+    """平均値補完で1カラムのみを更新し、統合前の差分を残す"""
+
+    response = client.post(
+        "/complement/numeric",
+        json={
+            "csv_id": csv_id,
+            "column_name": "score",
+            "complementary_methods": "平均値補完",
+        },
+    )
+    assert response.status_code == 200, response.data
+    assert go_server.patches[csv_id]
+
+
+@pytest.mark.skipif(not use_parquet(), reason="差分はParquet形式の場合のみ保存される")
+def test_download_applies_pending_patches(client, go_server):
+    """統合前の差分があってもダウンロードでき、差分を適用した内容になる"""
+
+    csv_id = uuid.uuid4().hex
+    upload(client, csv_id)
+    add_patch(client, go_server, csv_id)
+    dataframe_cache.invalidate(csv_id)
+
+    response = client.get(f"/download_csv/{csv_id}")
+
+    assert response.status_code == 200
+    downloaded = pd.read_csv(io.BytesIO(response.data))
+    assert downloaded["score"].tolist() == [0.5, 1.0, 1.5]
+
+
+@pytest.mark.skipif(not use_parquet(), reason="差分はParquet形式の場合のみ保存される")
+def test_projected_load_schedules_compaction(client, go_server):
+    """再起動などで統合の予約が失われても、一部のカラムの取得で統合が予約される"""
+
+    csv_id = uuid.uuid4().hex
+    upload(client, csv_id)
+    add_patch(client, go_server, csv_id)
+    patch_compactor.discard(csv_id)
+    dataframe_cache.invalidate(csv_id)
+
+    with client.application.app_context():
+        df, _ = get_csv(csv_id=csv_id, columns=["label"])
+
+    assert list(df.columns) == ["label"]
+    assert patch_compactor.flush(timeout=30)
+    assert go_server.patches[csv_id] == []
+    stored = pd.read_parquet(io.BytesIO(go_server.csvs[csv_id]["csv_file"]))
+    assert stored["score"].tolist() == [0.5, 1.0, 1.5]
@@ -0,0 +1,280 @@
+import random
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pytest
+from pandas import DataFrame, Series
+
+from data_utils import make_feature_value
+
+# 以前の実装（1行ずつ文字列の式を作成してevalする）を比較の基準にする
+
+
+# 以前の実装で0除算の行をNoneにしてフラグを立てた場合の返り値
+DIVIDE_BY_ZERO = object()
+
+
+def calculate_quantitative(formula_list: List, row: Series) -> Any:
+    """以前のcalculate_quantitative（0除算のフラグはグローバル変数の代わりに返り値で伝える）"""
+
+    befor_item = ""
+    converted_expression = ""
+    for item in formula_list:
+        if item in ["+", "-", "*", "/", "%", "(", ")"]:
+            converted_expression += item
+        elif item in row:
+            if befor_item == "/" and row[item] == 0:
+                return DIVIDE_BY_ZERO
+            converted_expression += str(row[item])
+        else:
+            if befor_item == "/" and item == 0:
+                return DIVIDE_BY_ZERO
+            converted_expression += str(item)
+        befor_item = item
+
+    return eval(converted_expression)
+
+
+def calculate_qualitative(formula_list: List, row: Series) -> str:
+    """以前のcalculate_qualitative"""
+
+    converted_expression = ""
+    for i, item in enumerate(formula_list):
+        if item in ["==", "!=", "<", ">", "<=", ">="]:
+            left = formula_list[i - 1]
+            right = formula_list[i + 1]
+            if left not in row:
+                raise ValueError(f"'{left}' is not a valid column name in the data.")
+            left_value = row[left]
+            if isinstance(left_value, (int, float)) and not isinstance(
+                right, (int, float)
+            ):
+                raise TypeError(f"Expected numeric value for '{left}'")
+            if isinstance(left_value, str) and not isinstance(right, str):
+                raise TypeError(f"Expected string value for '{left}'")
+
+        if item in ["==", "!=", "<", ">", "<=", ">=", "and", "or", "(", ")"]:
+            converted_expression += f" {item} "
+        elif item in row:
+            converted_expression += (
+                f"'{row[item]}'" if isinstance(row[item], str) else str(row[item])
+            )
+        else:
+            converted_expression += f"'{item}'" if isinstance(item, str) else str(item)
+
+    result = eval(converted_expression)
+    return "True" if result else "False"
+
+
+def reference_feature_value(
+    data: Dict[str, Any], df: DataFrame
+) -> Tuple[List[Any], bool]:
+    """以前のmake_feature_value（行ごとの値のリストと0除算があったかどうか）"""
+
+    calculate = (
+        calculate_quantitative
+        if data["feature_type"] == "quantitative"
+        else calculate_qualitative
+    )
+    values = [calculate(data["formula"], row) for _, row in df.iterrows()]
+    divide_by_zero = any(value is DIVIDE_BY_ZERO for value in values)
+    return [None if value is DIVIDE_BY_ZERO else value for value in values], (
+        divide_by_zero
+    )
+
+
+def evaluate(formula: List, df: DataFrame, feature_type: str = "quantitative"):
+    data = {"formula": formula, "new_column_name": "new", "feature_type": feature_type}
+    result, divide_by_zero = make_feature_value(data, df.copy())
+    return result["new"], divide_by_zero
+
+
+def assert_matches_reference(formula: List, df: DataFrame, feature_type: str):
+    data = {"formula": formula, "new_column_name": "new", "feature_type": feature_type}
+    expected, expected_flag = reference_feature_value(data, df)
+    actual, actual_flag = evaluate(formula, df, feature_type)
+
+    assert actual_flag == expected_flag, formula
+    if feature_type == "quantitative":
+        # 0除算の行は以前はNone、現在はNaN
+        expected_values = np.array(
+            [np.nan if value is None else value for value in expected], dtype=float
+        )
+        np.testing.assert_allclose(
+            actual.to_numpy(dtype=float), expected_values, rtol=1e-12, err_msg=formula
+        )
+    else:
+        assert actual.tolist() == expected, formula
+
+
+@pytest.fixture
+def df() -> DataFrame:
+    return DataFrame(
+        {
+            "i1": [-5, -2, 0, 3, 7],
+            "i2": [2, 0, 3, 1, 4],
+            "f1": [1.5, -0.25, 2.0, 0.0, -3.75],
+            "s1": ["a", "b", "cd", "a", "e"],
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "formula",
+    [
+        ["i1", "+", "f1", "*", 2],
+        ["(", "i1", "+", "f1", ")", "*", 2],
+        ["i1", "-", "f1", "-", "i2"],
+        ["i1", "/", 2, "*", "f1"],
+        [2, "*", "(", "i1", "-", "(", "f1", "+", 1, ")", ")"],
+        ["i1", "*", "i2", "+", "f1", "/", 4],
+    ],
+)
+def test_operator_precedence(df, formula):
+    assert_matches_reference(formula, df, "quantitative")
+
+
+@pytest.mark.parametrize(
+    "formula",
+    [
+        ["i1", "%", 3],
+        ["f1", "%", 2],
+        ["i1", "%", -4],
+        [10, "%", "i2", "+", 1],
+    ],
+)
+def test_modulo_follows_python_semantics(df, formula):
+    """負の数の剰余はPythonと同じく除数の符号になる"""
+
+    if 0 in df["i2"].tolist() and "i2" in formula:
+        df = df[df["i2"] != 0]
+    assert_matches_reference(formula, df, "quantitative")
+
+
+@pytest.mark.parametrize(
+    "formula",
+    [
+        ["-", "i1"],
+        ["-", "f1", "*", 2],
+        ["i2", "*", "-", "i1"],
+        ["-", "(", "i1", "+", "f1", ")"],
+        ["f1", "-", "-", "i1"],
+    ],
+)
+def test_unary_minus(df, formula):
+    assert_matches_reference(formula, df, "quantitative")
+
+
+@pytest.mark.parametrize(
+    "formula",
+    [
+        ["i1", "/", "i2"],
+        ["f1", "/", 0],
+        ["i1", "+", "f1", "/", "f1"],
+        ["(", "i1", "+", 1, ")", "/", "i2", "*", 2],
+    ],
+)
+def test_zero_division_matches_reference(df, formula):
+    """分母のカラムや定数が0の行はNaN（以前はNone）になり、フラグが立つ"""
+
+    assert_matches_reference(formula, df, "quantitative")
+
+
+def test_zero_division_cases_the_reference_raised_on(df):
+    """以前は例外になった0除算（式の分母、%の0）もNaNとフラグで返す"""
+
+    result, divide_by_zero = evaluate(["i1", "/", "(", "i2", "-", "i2", ")"], df)
+    assert divide_by_zero
+    assert result.isna().all()
+
+    result, divide_by_zero = evaluate(["i1", "%", "i2"], df)
+    assert divide_by_zero
+    assert result.isna().tolist() == (df["i2"] == 0).tolist()
+
+
+def test_nan_inputs_propagate(df):
+    """欠損値のある行は結果も欠損値になり、他の行は以前と同じ値になる"""
+
+    df["f1"] = [1.5, np.nan, 2.0, np.nan, -3.75]
+    formula = ["i1", "*", "f1", "+", "i2"]
+
+    result, divide_by_zero = evaluate(formula, df)
+
+    assert not divide_by_zero
+    assert result.isna().tolist() == df["f1"].isna().tolist()
+    complete = df.dropna()
+    assert_matches_reference(formula, complete, "quantitative")
+    np.testing.assert_allclose(
+        result[complete.index].to_numpy(dtype=float),
+        evaluate(formula, complete)[0].to_numpy(dtype=float),
+    )
+
+
+@pytest.mark.parametrize(
+    "formula",
+    [
+        ["i1", ">", 0],
+        ["f1", "<=", 0.0],
+        ["s1", "==", "a"],
+        ["s1", "!=", "cd"],
+        ["i1", ">=", 0, "and", "s1", "==", "a"],
+        ["(", "i1", "<", 0, "or", "f1", ">", 1, ")", "and", "i2", "!=", 0],
+    ],
+)
+def test_qualitative_matches_reference(df, formula):
+    assert_matches_reference(formula, df, "qualitative")
+
+
+def test_quoted_string_values(df):
+    """引用符を含む値も比較できる（以前はevalの構文エラーになった）"""
+
+    df["s1"] = ["a", "b", "c'd", "a", 'e"f']
+
+    result, _ = evaluate(
+        ["s1", "==", "c'd", "or", "s1", "==", 'e"f'], df, "qualitative"
+    )
+
+    assert result.tolist() == ["False", "False", "True", "False", "True"]
+
+
+def random_expression(rng: random.Random, depth: int, columns: List[str]) -> List:
+    if depth == 0 or rng.random() < 0.3:
+        if rng.random() < 0.7:
+            return [rng.choice(columns)]
+        return [rng.choice([0, 1, 2, 3.5, -1, 7])]
+    left = random_expression(rng, depth - 1, columns)
+    right = random_expression(rng, depth - 1, columns)
+    expression = left + [rng.choice(["+", "-", "*", "/", "%"])] + right
+    return ["("] + expression + [")"] if rng.random() < 0.4 else expression
+
+
+def test_random_formulas_match_reference():
+    """ランダムな計算式で、以前の実装が例外にならない場合は同じ結果になる"""
+
+    rng = random.Random(0)
+    compared = 0
+    for _ in range(300):
+        values = np.random.default_rng(rng.randint(0, 10**6))
+        n_rows = rng.randint(1, 30)
+        frame = DataFrame(
+            {
+                "i1": values.integers(-5, 6, n_rows),
+                "i2": values.integers(0, 4, n_rows),
+                "f1": np.round(values.normal(size=n_rows), 3),
+                "f2": values.uniform(-2, 2, n_rows),
+            }
+        )
+        formula = random_expression(rng, 3, list(frame.columns))
+        data = {
+            "formula": formula,
+            "new_column_name": "new",
+            "feature_type": "quantitative",
+        }
+        try:
+            reference_feature_value(data, frame)
+        except (ZeroDivisionError, SyntaxError):
+            continue
+        assert_matches_reference(formula, frame, "quantitative")
+        compared += 1
+
+    assert compared > 150
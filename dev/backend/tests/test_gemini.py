@@ -0,0 +1,136 @@
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import google.ai.generativelanguage as glm
+import google.api_core.exceptions
+import pytest
+from google.generativeai import protos
+
+from src.backend.chats import chat_writer
+from src.backend.gemini import GeminiClientRegistry
+
+
+def answer_with_api_key(self, request, **kwargs):
+    """Geminiの代わりに、クライアントに設定されたAPIキーを回答として返す"""
+
+    # 別のスレッドの処理と重なるように少し待つ
+    time.sleep(random.uniform(0, 0.005))
+    api_key = self._transport._credentials.token
+    return protos.GenerateContentResponse(
+        candidates=[
+            {
+                "content": {"parts": [{"text": api_key}], "role": "model"},
+                "finish_reason": 1,
+            }
+        ]
+    )
+
+
+@pytest.fixture(autouse=True)
+def gemini_stand_in(monkeypatch):
+    monkeypatch.setattr(
+        glm.GenerativeServiceClient, "generate_content", answer_with_api_key
+    )
+
+
+@pytest.fixture
+def registry() -> GeminiClientRegistry:
+    return GeminiClientRegistry(ttl=600, max_entries=256)
+
+
+def test_concurrent_requests_use_each_users_key(go_server, registry):
+    """複数のユーザーが同時に生成しても、それぞれ自分のAPIキーのクライアントで生成される"""
+
+    users = [f"user{i}" for i in range(8)]
+
+    def generate(i: int):
+        user_id = users[i % len(users)]
+        model = registry.get_model(user_id=user_id, model_name="gemini-pro")
+        return user_id, model.generate_content("hi").text
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(generate, range(400)))
+
+    assert all(text == f"key-{user_id}" for user_id, text in results)
+    # APIキーの取得はユーザーごとに1回だけ
+    assert go_server.calls.count("/users/get/api") == len(users)
+    stats = registry.stats()
+    assert stats["misses"] + stats["hits"] == 400
+    assert stats["entries"] == len(users)
+
+
+def test_chat_route_replies_with_each_users_key(go_server, client):
+    """/api/chatを同時に呼び出しても、別のユーザーのAPIキーで生成されない"""
+
+    users = [f"user-{uuid.uuid4()}" for _ in range(6)]
+
+    def chat(i: int):
+        user_id = users[i % len(users)]
+        response = client.post(
+            "/api/chat",
+            json={
+                "user_id": user_id,
+                "message": f"message{i}",
+                "user_message": f"message{i}",
+                "room_id": "room",
+                "post_id": i * 2,
+                "refresh": True,
+            },
+        )
+        assert response.status_code == 200
+        return user_id, response.get_json()["reply"]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(chat, range(60)))
+
+    assert all(reply == f"key-{user_id}" for user_id, reply in results)
+    # 履歴の保存はバックグラウンドで行われるため、Goサーバーの代わりを止める前に待つ
+    assert chat_writer.flush(10)
+    assert len(go_server.chats) == 120
+
+
+def test_expired_entry_fetches_key_again(go_server):
+    registry = GeminiClientRegistry(ttl=0.05, max_entries=256)
+
+    registry.get_model(user_id="user", model_name="gemini-pro")
+    registry.get_model(user_id="user", model_name="gemini-pro")
+    time.sleep(0.1)
+    model = registry.get_model(user_id="user", model_name="gemini-pro")
+
+    assert go_server.calls.count("/users/get/api") == 2
+    assert model.generate_content("hi").text == "key-user"
+    assert registry.stats()["expirations"] == 1
+
+
+def test_auth_error_invalidates_only_that_user(go_server, registry):
+    registry.get_model(user_id="user1", model_name="gemini-pro")
+    registry.get_model(user_id="user2", model_name="gemini-pro")
+
+    registry.invalidate_on_error(
+        "user1", google.api_core.exceptions.InvalidArgument("API key not valid")
+    )
+    registry.invalidate_on_error("user2", ValueError("not an auth error"))
+
+    assert registry.stats()["entries"] == 1
+    registry.get_model(user_id="user1", model_name="gemini-pro")
+    registry.get_model(user_id="user2", model_name="gemini-pro")
+    assert go_server.calls.count("/users/get/api") == 3
+
+
+@pytest.mark.parametrize(
+    "body, content_type",
+    [
+        ("not json", "text/plain"),
+        ("{", "application/json"),
+        ("null", "application/json"),
+    ],
+)
+def test_image_route_returns_error_for_invalid_body(client, body, content_type):
+    """リクエストがJSONとして読めない場合も、例外にならずにエラーを返す"""
+
+    response = client.post("/gemini/image", data=body, content_type=content_type)
+
+    assert response.status_code == 500
+    assert "error" in response.get_json()
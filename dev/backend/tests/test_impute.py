@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_utils import fill_hot_deck, fill_mode
+
+
+@pytest.mark.parametrize("fill", [fill_hot_deck, fill_mode])
+@pytest.mark.parametrize("dtype", [object, "string", "category"])
+def test_fill_preserves_dtype(fill, dtype):
+    """補完後もカラムの型（string型やcategory型）が変わらない"""
+
+    series = pd.Series(["a", None, "b", "a", None], name="label", dtype=dtype)
+
+    filled = fill(series)
+
+    assert filled.dtype == series.dtype
+    assert filled.name == "label"
+    assert not filled.isna().any()
+    assert set(filled) <= {"a", "b"}
+
+
+def test_hot_deck_uses_only_observed_values():
+    series = pd.Series(["x", None, None, "y"], index=[10, 11, 12, 13], dtype="string")
+
+    filled = fill_hot_deck(series, rng=np.random.default_rng(0))
+
+    assert filled.index.tolist() == [10, 11, 12, 13]
+    assert filled[[10, 13]].tolist() == ["x", "y"]
+    assert set(filled[[11, 12]]) <= {"x", "y"}
@@ -0,0 +1,78 @@
+import base64
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from src.backend.csvs import decode_csv_files
+from src.backend.storage import encode_columns, get_dtypes, patch_columns
+
+
+def to_parquet(df: pd.DataFrame) -> bytes:
+    buf = io.BytesIO()
+    df.to_parquet(buf, engine="pyarrow", index=False)
+    return buf.getvalue()
+
+
+def make_files(base: pd.DataFrame, patched: pd.DataFrame, columns, label):
+    """/get_csvのfileと同じ形式のデータを作成する"""
+
+    patch = encode_columns(patched, columns)[1].getvalue()
+    return {
+        "csv_file": base64.b64encode(to_parquet(base)).decode(),
+        "json_file": base64.b64encode(
+            json.dumps(get_dtypes(patched)).encode()
+        ).decode(),
+        "patches": [
+            {
+                "patch_id": 1,
+                "column_name": label,
+                "patch_file": base64.b64encode(patch).decode(),
+            }
+        ],
+    }
+
+
+@pytest.fixture
+def frames():
+    base = pd.DataFrame(
+        {"a": [1.0, np.nan, 3.0], "b": ["x", None, "y"], "c": [1, 2, 3]}
+    )
+    patched = base.copy()
+    patched["a"] = [1.0, 2.0, 3.0]
+    patched["b"] = ["x", "x", "y"]
+    return base, patched
+
+
+def test_patch_columns_reads_schema(frames):
+    _, patched = frames
+    patch = encode_columns(patched, ["a", "b"])[1].getvalue()
+    assert patch_columns(patch) == ["a", "b"]
+
+
+@pytest.mark.parametrize("label", ["a,b", "a,..."])
+@pytest.mark.parametrize("columns", [["a"], ["b", "c"], ["c", "a"], None])
+def test_projected_load_applies_multi_column_patch(frames, label, columns):
+    """複数カラムの差分は、記録されたカラム名に関係なく一部のカラムの取得にも適用される"""
+
+    base, patched = frames
+    files = make_files(base, patched, ["a", "b"], label)
+
+    df = decode_csv_files(files, columns=columns)[0]
+
+    expected = patched if columns is None else patched[columns]
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_projected_load_skips_unrelated_patch(frames):
+    base, patched = frames
+    files = make_files(base, patched, ["a", "b"], "a,b")
+
+    df = decode_csv_files(files, columns=["c"])[0]
+
+    assert list(df.columns) == ["c"]
+    pd.testing.assert_series_equal(df["c"], base["c"])
@@ -0,0 +1,17 @@
+import pandas as pd
+
+from src.backend.profile import build_profile
+
+
+def test_miss_columns_with_any_column_name(capsys):
+    """カラム名や行ラベルに関係なく、欠損値のあるカラムを調べる（出力もしない）"""
+
+    df = pd.DataFrame({"JobRole": ["a", None], "x": [1.0, None], "y": [1, 2]})
+
+    profile = build_profile(df)
+
+    assert profile["miss_columns"] == {
+        "quantitative_miss_list": ["x"],
+        "qualitative_miss_list": ["JobRole"],
+    }
+    assert capsys.readouterr().out == ""
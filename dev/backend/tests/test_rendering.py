@@ -0,0 +1,140 @@
+import gc
+import logging
+import os
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import pytest
+from matplotlib.figure import Figure
+
+from data_plt import plot_box, plot_hist, plot_scatter
+from data_utils import make_pie, plot_feature_importance
+
+# グラフの種類ごとに描画する回数（長時間の確認はCHART_SOAK_ITERATIONS=10000などで実行する）
+ITERATIONS = int(os.getenv("CHART_SOAK_ITERATIONS", "30"))
+
+# 描画を繰り返す後半に増えてもよいPythonのメモリ（バイト）
+MAX_GROWTH = 512 * 1024
+
+
+@pytest.fixture(autouse=True)
+def quiet_font_warnings(caplog):
+    """フォントが無い環境の警告を記録しない（記録したログがメモリの増加に含まれるため）"""
+
+    caplog.set_level(logging.ERROR, logger="matplotlib.font_manager")
+
+
+@pytest.fixture(scope="module")
+def df() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        {
+            "x": rng.normal(size=200),
+            "y": rng.normal(size=200),
+            "t": rng.choice(["a", "b", "c"], 200),
+        }
+    )
+
+
+@pytest.fixture(scope="module")
+def feature_importance() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "feature": [f"feature{i}" for i in range(10)],
+            "importance": np.linspace(0.2, 0.01, 10),
+        }
+    )
+
+
+def make_renderers(
+    df: pd.DataFrame, feature_importance: pd.DataFrame
+) -> Dict[str, Callable[[], bytes]]:
+    """グラフの種類ごとに、1枚描画して画像データを返す関数"""
+
+    return {
+        "scatter": lambda: plot_scatter(
+            {"variable1": "x", "variable2": "y", "target": "None", "fit_reg": 0}, df
+        )[0],
+        "scatter_target_fit": lambda: plot_scatter(
+            {
+                "variable1": "x",
+                "variable2": "y",
+                "target": "t",
+                "fit_reg": 1,
+                "order": 1,
+            },
+            df,
+        )[0],
+        "hist": lambda: plot_hist({"variable": "x", "target": "None"}, df)[0],
+        "hist_target": lambda: plot_hist({"variable": "x", "target": "t"}, df)[0],
+        "box": lambda: plot_box({"variable1": "t", "variable2": "y"}, df.copy())[0],
+        "pie": lambda: make_pie({"column_name": "t"}, df)[0],
+        "feature_importance": lambda: plot_feature_importance(
+            feature_importance
+        ).encode(),
+    }
+
+
+def live_figures() -> List[Figure]:
+    gc.collect()
+    return [obj for obj in gc.get_objects() if isinstance(obj, Figure)]
+
+
+@pytest.mark.parametrize(
+    "chart",
+    [
+        "scatter",
+        "scatter_target_fit",
+        "hist",
+        "hist_target",
+        "box",
+        "pie",
+        "feature_importance",
+    ],
+)
+def test_repeated_rendering_releases_figures(df, feature_importance, chart):
+    """繰り返し描画してもpyplotに図が残らず、メモリが増え続けない"""
+
+    render = make_renderers(df, feature_importance)[chart]
+    # フォントや色のキャッシュなど、初回の描画で確保されるメモリは除く
+    for _ in range(3):
+        render()
+    figures = len(live_figures())
+
+    tracemalloc.start()
+    try:
+        # 文字の大きさなどのキャッシュが埋まるまでの増加は除き、後半の増加を比べる
+        usage = []
+        for _ in range(2):
+            for _ in range(ITERATIONS // 2):
+                assert render()
+                assert plt.get_fignums() == []
+            gc.collect()
+            usage.append(tracemalloc.get_traced_memory()[0])
+        growth = usage[1] - usage[0]
+    finally:
+        tracemalloc.stop()
+
+    assert len(live_figures()) <= figures
+    assert growth < MAX_GROWTH, f"{chart}: {growth} bytes"
+
+
+def test_concurrent_rendering(df, feature_importance):
+    """複数のスレッドから同時に描画しても、それぞれ1枚で描画した画像と同じになる"""
+
+    renderers = make_renderers(df, feature_importance)
+    # 回帰直線の信頼区間はブートストラップで計算され、描画ごとに変わるため比べない
+    del renderers["scatter_target_fit"]
+    expected = {name: render() for name, render in renderers.items()}
+    names = list(renderers) * 4
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        images = list(executor.map(lambda name: renderers[name](), names))
+
+    assert plt.get_fignums() == []
+    for name, image in zip(names, images):
+        assert image == expected[name], name
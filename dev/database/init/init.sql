@@ -27,6 +27,7 @@ CREATE TABLE csvs (
     csv_id VARCHAR(255) PRIMARY KEY,
     csv_file BYTEA NOT NULL,
     json_file BYTEA NOT NULL,
+    profile_file BYTEA,
     user_id VARCHAR(255) NOT NULL,
     file_name VARCHAR(255) NOT NULL,
     data_size INT NOT NULL,
@@ -38,6 +39,18 @@ CREATE TABLE csvs (
     FOREIGN KEY (user_id) REFERENCES users(user_id)
 );
 
+-- csv_patchesテーブルの作成（列ごとの更新差分）
+CREATE TABLE csv_patches (
+    patch_id SERIAL PRIMARY KEY,
+    csv_id VARCHAR(255) NOT NULL,
+    column_name VARCHAR(255) NOT NULL,
+    patch_file BYTEA NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (csv_id) REFERENCES csvs(csv_id)
+);
+
+CREATE INDEX csv_patches_csv_id_idx ON csv_patches (csv_id, patch_id);
+
 -- roomsテーブルの作成
 CREATE TABLE rooms (
     room_id VARCHAR(255) PRIMARY KEY,
@@ -0,0 +1,2 @@
+-- 既存のcsvsテーブルにプロファイルのカラムを追加
+ALTER TABLE csvs ADD COLUMN IF NOT EXISTS profile_file BYTEA;
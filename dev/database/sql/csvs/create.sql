@@ -2,6 +2,7 @@ CREATE TABLE csvs (
     csv_id VARCHAR(255) PRIMARY KEY,
     csv_file BYTEA NOT NULL,
     json_file BYTEA NOT NULL,
+    profile_file BYTEA,
     user_id VARCHAR(255) NOT NULL,
     file_name VARCHAR(255) NOT NULL,
     data_size INT NOT NULL,
@@ -0,0 +1,11 @@
+-- 既存のデータベースに列ごとの更新差分のテーブルを追加
+CREATE TABLE IF NOT EXISTS csv_patches (
+    patch_id SERIAL PRIMARY KEY,
+    csv_id VARCHAR(255) NOT NULL,
+    column_name VARCHAR(255) NOT NULL,
+    patch_file BYTEA NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (csv_id) REFERENCES csvs(csv_id)
+);
+
+CREATE INDEX IF NOT EXISTS csv_patches_csv_id_idx ON csv_patches (csv_id, patch_id);
@@ -16,6 +16,10 @@ import { showErrorAlert, showSuccessAlert, showConfirmationAlert } from '../../u
 import { BACKEND_URL } from '../../urlConfig';
 import useAuth from '../../hooks/useAuth';
 
+// ジョブの状態を確認する間隔（ミリ秒）と、分析の終了を待つ最大回数（約3分）
+const POLL_INTERVAL_MS = 1000;
+const MAX_POLL_ATTEMPTS = 180;
+
 const ColumnDetail: React.FC = () => {
 	const { csvId } = useAuth();
 	const { columnName, type } = useParams<Record<string, string | undefined>>();
@@ -26,10 +30,21 @@ const ColumnDetail: React.FC = () => {
 	useEffect(() => {
 		const fetchImage = async () => {
 			try {
-				const response = await axios.post(`${BACKEND_URL}/feature_analysis`, {
+				// 分析はバックグラウンドで行われるため、終わるまで1秒ごとにジョブの状態を確認する
+				let response = await axios.post(`${BACKEND_URL}/feature_analysis`, {
 					csv_id: csvId,
 					column_name: columnName,
 				});
+				let attempts = 0;
+				while (response.data.status !== 'done') {
+					// 最大回数を超えても終わらない場合は取得に失敗したものとして扱う
+					if (attempts >= MAX_POLL_ATTEMPTS) {
+						throw new Error('特徴量分析がタイムアウトしました');
+					}
+					attempts++;
+					await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+					response = await axios.get(`${BACKEND_URL}/feature_analysis/${response.data.job_id}`);
+				}
 				setImage(response.data.image_data);
 				setLoading(false);
 				console.log(response.data.image_data);
@@ -1,6 +1,6 @@
 import { useState } from "react";
 import axios from "axios";
-import { DATABASE_URL } from "../urlConfig"
+import { BACKEND_URL, DATABASE_URL } from "../urlConfig"
 import { saveAs } from "file-saver";
 
 // 型定義
@@ -60,11 +60,13 @@ export const fetchDeletedCsvFiles = async (
 };
 
 // CSVファイルをダウンロードするAPI
+// （データベースにはParquet形式や列ごとの差分で保存されている場合があるため、
+// 差分を適用してCSV形式に変換するバックエンドから取得する）
 export const downloadCsvFile = async (
   csvId: string, fileName: string
 ): Promise<string> => {
   try {
-    const response = await axios.get<Blob>(`${DATABASE_URL}download_csv/${csvId}`, {
+    const response = await axios.get<Blob>(`${BACKEND_URL}/download_csv/${csvId}`, {
       responseType: "blob",
     });
 
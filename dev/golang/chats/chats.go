@@ -5,6 +5,7 @@ import (
 
 	"github.com/gin-gonic/gin"
 	"gorm.io/gorm"
+	"gorm.io/gorm/clause"
 )
 
 type Rooms struct {
@@ -30,6 +31,10 @@ type RoomId struct {
 	RoomID string `json:"room_id"`
 }
 
+type ChatBatch struct {
+	Chats []Chats `json:"chats" binding:"required"`
+}
+
 // roomテーブルにroom_idを保存する関数
 func SaveRoomId(c *gin.Context, db *gorm.DB) {
 	var room Rooms
@@ -94,6 +99,47 @@ func SaveChat(c *gin.Context, db *gorm.DB) {
 	})
 }
 
+// chatをまとめて保存する関数
+func SaveChatBatch(c *gin.Context, db *gorm.DB) {
+	var batch ChatBatch
+
+	// データ受け取り
+	err := c.ShouldBindJSON(&batch)
+	if err != nil {
+		// エラーハンドリング
+		c.JSON(http.StatusBadRequest, gin.H{
+			"StatusMessage": "Failed",
+			"message":       "JSON形式ではありません",
+			"error":         err.Error(),
+		})
+		return
+	}
+
+	if len(batch.Chats) == 0 {
+		c.JSON(http.StatusOK, gin.H{
+			"StatusMessage": "Success",
+			"saved":         0,
+		})
+		return
+	}
+
+	// 1回のINSERTで保存する（再送された場合に備え、保存済みのchat_idは無視する）
+	result := db.Clauses(clause.OnConflict{DoNothing: true}).Create(&batch.Chats)
+	if result.Error != nil {
+		c.JSON(http.StatusInternalServerError, gin.H{
+			"StatusMessage": "Failed",
+			"message":       "データベースに保存されませんでした",
+			"error":         result.Error.Error(),
+		})
+		return
+	}
+
+	c.JSON(http.StatusOK, gin.H{
+		"StatusMessage": "Success",
+		"saved":         result.RowsAffected,
+	})
+}
+
 // chatを取得する関数
 func GetChats(c *gin.Context, db *gorm.DB) {
 	var room Rooms
@@ -1,6 +1,8 @@
 package csvs
 
 import (
+	"bytes"
+	"errors"
 	"fmt"
 	"io"
 	"net/http"
@@ -16,6 +18,7 @@ type Csv struct {
 	CsvID            string    `json:"csv_id" gorm:"primaryKey;column:csv_id"`
 	CsvFile          []byte    `json:"csv_file" gorm:"not null;column:csv_file"`
 	JsonFile         []byte    `json:"json_file" gorm:"not null;column:json_file"`
+	ProfileFile      []byte    `json:"profile_file" gorm:"column:profile_file"`
 	UserID           string    `json:"user_id" gorm:"not null;column:user_id"`
 	FileName         string    `json:"file_name" gorm:"not null;column:file_name"`
 	DataSize         int       `json:"data_size" gorm:"not null;column:data_size"`
@@ -26,6 +29,18 @@ type Csv struct {
 	IsDelete         bool      `json:"is_delete" gorm:"column:is_delete;default:false"`
 }
 
+// 列ごとの更新差分 モデルの定義（取得時に元のデータへ順に適用する）
+type CsvPatch struct {
+	PatchID    uint      `json:"patch_id" gorm:"primaryKey;column:patch_id"`
+	CsvID      string    `json:"csv_id" gorm:"not null;column:csv_id"`
+	ColumnName string    `json:"column_name" gorm:"not null;column:column_name"`
+	PatchFile  []byte    `json:"patch_file" gorm:"not null;column:patch_file"`
+	CreatedAt  time.Time `json:"created_at" gorm:"default:CURRENT_TIMESTAMP;column:created_at"`
+}
+
+// 統合しようとした差分が既に統合・破棄されていた場合のエラー
+var errStalePatch = errors.New("patch already compacted")
+
 // front モデルの定義
 type Front struct {
 	CsvID  string `json:"csv_id" gorm:"primaryKey;column:csv_id"`
@@ -52,6 +67,22 @@ func bindFront(c *gin.Context) (*Front, error) {
 	return &front, nil
 }
 
+// 任意で送信されるファイルの内容を読み込む関数（送信されていない場合はnilを返す）
+func readOptionalFile(c *gin.Context, name string) ([]byte, error) {
+	file, err := c.FormFile(name)
+	if err != nil {
+		return nil, nil
+	}
+
+	openedFile, err := file.Open()
+	if err != nil {
+		return nil, err
+	}
+	defer openedFile.Close() // 関数の最後でファイルを閉じる
+
+	return io.ReadAll(openedFile)
+}
+
 // csvファイルを取得する関数
 func GetCsv(c *gin.Context, db *gorm.DB) {
 	// パラメータから csv_id を取得
@@ -72,16 +103,78 @@ func GetCsv(c *gin.Context, db *gorm.DB) {
 		return
 	}
 
+	// 列ごとの更新差分を保存した順に取得
+	var patches []CsvPatch
+	patchResult := db.Where("csv_id = ?", csvID).Order("patch_id").Find(&patches)
+	if patchResult.Error != nil {
+		c.JSON(http.StatusInternalServerError, gin.H{"error": "Failed to fetch CSV patches"})
+		return
+	}
+
 	// レスポンスとして取得したファイルを返す
 	fileData := map[string]interface{}{
 		"csv_file":  csvFile.CsvFile,
 		"json_file": csvFile.JsonFile,
+		"patches":   patches,
 		// 必要に応じて他のメタデータも追加可能
 	}
 
 	c.JSON(http.StatusOK, gin.H{"file": fileData})
 }
 
+// csvファイルのプロファイルを取得する関数
+func GetProfile(c *gin.Context, db *gorm.DB) {
+	// パラメータから csv_id を取得
+	csvID := c.Param("csv_id")
+
+	// データ本体は読み込まず、プロファイルのみを取得
+	var csvFile Csv
+	result := db.Select("csv_id", "profile_file").First(&csvFile, "csv_id = ?", csvID)
+	if result.Error != nil {
+		if result.Error == gorm.ErrRecordNotFound {
+			c.JSON(http.StatusNotFound, gin.H{"error": "CSV file not found"})
+		} else {
+			c.JSON(http.StatusInternalServerError, gin.H{"error": "Failed to fetch profile"})
+		}
+		return
+	}
+
+	// プロファイルが保存されていない場合
+	if len(csvFile.ProfileFile) == 0 {
+		c.JSON(http.StatusNotFound, gin.H{"error": "Profile not found"})
+		return
+	}
+
+	c.JSON(http.StatusOK, gin.H{"profile_file": csvFile.ProfileFile})
+}
+
+// csvファイルのプロファイルのみを更新する関数
+func UpdateProfile(c *gin.Context, db *gorm.DB) {
+	// プロファイルの取得
+	fileProfileContent, err := readOptionalFile(c, "profile_file")
+	if err != nil || len(fileProfileContent) == 0 {
+		c.JSON(http.StatusBadRequest, gin.H{"error": "Profile file required"})
+		return
+	}
+
+	csvId := c.PostForm("csv_id")
+
+	// プロファイルのカラムのみを更新
+	result := db.Model(&Csv{}).Where("csv_id = ?", csvId).Update("profile_file", fileProfileContent)
+	if result.Error != nil {
+		c.JSON(http.StatusBadRequest, gin.H{
+			"StatusMessage": "Failed",
+			"message":       "プロファイルを更新できませんでした",
+			"error":         result.Error.Error(),
+		})
+		return
+	}
+
+	c.JSON(http.StatusOK, gin.H{
+		"StatusMessage": "Success",
+	})
+}
+
 func DownloadCsv(c *gin.Context, db *gorm.DB) {
 	// パラメータから csv_id を取得
 	csvID := c.Param("csv_id")
@@ -98,9 +191,32 @@ func DownloadCsv(c *gin.Context, db *gorm.DB) {
 		return
 	}
 
+	// 統合されていない列の更新差分がある場合は古いデータを返さない
+	var patchCount int64
+	countResult := db.Model(&CsvPatch{}).Where("csv_id = ?", csvID).Count(&patchCount)
+	if countResult.Error != nil {
+		c.JSON(http.StatusInternalServerError, gin.H{"error": "Failed to fetch CSV patches"})
+		return
+	}
+	if patchCount > 0 {
+		c.JSON(http.StatusConflict, gin.H{
+			"error":   "CSV file has pending column updates, please retry shortly",
+			"patches": patchCount,
+		})
+		return
+	}
+
 	// ファイルデータを取得
 	// csvData := []byte(csvFile.CsvFile) // CsvFileは文字列またはバイナリとして保存されていると仮定
 
+	// Parquet形式で保存されている場合はそのまま送信
+	if bytes.HasPrefix(csvFile.CsvFile, []byte("PAR1")) {
+		c.Header("Content-Description", "File Transfer")
+		c.Header("Content-Disposition", fmt.Sprintf("attachment; filename=\"%s.parquet\"", csvFile.FileName))
+		c.Data(http.StatusOK, "application/vnd.apache.parquet", csvFile.CsvFile)
+		return
+	}
+
 	// ヘッダーを設定してCSVを直接送信
 	c.Header("Content-Description", "File Transfer")
 	c.Header("Content-Disposition", fmt.Sprintf("attachment; filename=\"%s.csv\"", csvFile.FileName))
@@ -154,6 +270,13 @@ func UploadCsv(c *gin.Context, db *gorm.DB) {
 		return
 	}
 
+	// プロファイルの内容を読み込む（任意）
+	fileProfileContent, err := readOptionalFile(c, "profile_file")
+	if err != nil {
+		c.JSON(http.StatusInternalServerError, gin.H{"error": "Unable to read profile file"})
+		return
+	}
+
 	// フォームデータの取得
 	userId := c.PostForm("user_id")
 	// userId := "rootId"
@@ -168,6 +291,7 @@ func UploadCsv(c *gin.Context, db *gorm.DB) {
 		CsvID:            csvId,
 		CsvFile:          fileCsvContent,
 		JsonFile:         fileJsonContent,
+		ProfileFile:      fileProfileContent,
 		UserID:           userId,
 		FileName:         fileName,
 		DataSize:         dataSize,
@@ -292,11 +416,20 @@ func UpdateCSV(c *gin.Context, db *gorm.DB) {
 		return
 	}
 
+	// プロファイルの内容を読み込む（任意）
+	fileProfileContent, err := readOptionalFile(c, "profile_file")
+	if err != nil {
+		c.JSON(http.StatusInternalServerError, gin.H{"error": "Unable to read profile file"})
+		return
+	}
+
 	// データの受け取り
 	csvId := c.PostForm("csv_id")
 	dataSize, _ := strconv.Atoi(c.PostForm("data_size"))
 	dataColumns, _ := strconv.Atoi(c.PostForm("data_columns"))
 	dataRows, _ := strconv.Atoi(c.PostForm("data_rows"))
+	// 差分を統合する場合は、統合した最後の差分のid（省略時はすべての差分を破棄する）
+	appliedPatchId := c.PostForm("applied_patch_id")
 
 	// fmt.Printf("%+v\n", backend)
 
@@ -315,18 +448,125 @@ func UpdateCSV(c *gin.Context, db *gorm.DB) {
 	// データの更新
 	dbCsv.CsvFile = fileCsvContent
 	dbCsv.JsonFile = fileJsonContent
+	dbCsv.ProfileFile = fileProfileContent
 	dbCsv.DataSize = dataSize
 	dbCsv.DataColumns = dataColumns
 	dbCsv.DataRows = dataRows
 	dbCsv.LastAccessedDate = time.Now()
 
-	// データの保存
-	updateResult := db.Save(dbCsv)
-	if updateResult.Error != nil {
+	// データの保存と、反映済みの差分の削除を同時に行う
+	updateErr := db.Transaction(func(tx *gorm.DB) error {
+		patches := tx.Where("csv_id = ?", csvId)
+		if appliedPatchId != "" {
+			// 統合する差分が既に無い場合は、より新しいデータで上書きされている
+			var count int64
+			err := tx.Model(&CsvPatch{}).Where("csv_id = ? AND patch_id = ?", csvId, appliedPatchId).Count(&count).Error
+			if err != nil {
+				return err
+			}
+			if count == 0 {
+				return errStalePatch
+			}
+			patches = patches.Where("patch_id <= ?", appliedPatchId)
+		}
+
+		if err := tx.Save(dbCsv).Error; err != nil {
+			return err
+		}
+		return patches.Delete(&CsvPatch{}).Error
+	})
+	if errors.Is(updateErr, errStalePatch) {
+		c.JSON(http.StatusConflict, gin.H{
+			"StatusMessage": "Failed",
+			"message":       "統合する差分は既に反映されています",
+			"error":         updateErr.Error(),
+		})
+		return
+	}
+	if updateErr != nil {
 		c.JSON(http.StatusBadRequest, gin.H{
 			"StatusMessage": "Failed",
 			"message":       "csvファイルを更新できませんでした",
-			"error":         updateResult.Error.Error(),
+			"error":         updateErr.Error(),
+		})
+		return
+	}
+
+	// 更新成功
+	c.JSON(http.StatusOK, gin.H{
+		"StatusMessage": "Success",
+		"file_name":     dbCsv.FileName,
+	})
+}
+
+// csvファイルの一部の列のみを更新する関数
+// 変更された列は差分として保存し、データ本体は書き換えない（取得時に合成する）
+func UpdateColumn(c *gin.Context, db *gorm.DB) {
+	// 差分（変更された列のみのParquetファイル）の取得
+	filePatchContent, err := readOptionalFile(c, "patch_file")
+	if err != nil || len(filePatchContent) == 0 {
+		c.JSON(http.StatusBadRequest, gin.H{"error": "Patch file required"})
+		return
+	}
+
+	// jsonファイルの取得（全体の型情報）
+	fileJsonContent, err := readOptionalFile(c, "json_file")
+	if err != nil || len(fileJsonContent) == 0 {
+		c.JSON(http.StatusBadRequest, gin.H{"error": "JSON file required"})
+		return
+	}
+
+	// プロファイルの内容を読み込む（任意）
+	fileProfileContent, err := readOptionalFile(c, "profile_file")
+	if err != nil {
+		c.JSON(http.StatusInternalServerError, gin.H{"error": "Unable to read profile file"})
+		return
+	}
+
+	// データの受け取り
+	csvId := c.PostForm("csv_id")
+	columnName := c.PostForm("column_name")
+	dataColumns, _ := strconv.Atoi(c.PostForm("data_columns"))
+	dataRows, _ := strconv.Atoi(c.PostForm("data_rows"))
+
+	patch := CsvPatch{
+		CsvID:      csvId,
+		ColumnName: columnName,
+		PatchFile:  filePatchContent,
+		CreatedAt:  time.Now(),
+	}
+	var dbCsv Csv
+	var patchCount int64
+
+	// メタデータの更新と差分の保存を同時に行う（データ本体は読み込まない）
+	updateErr := db.Transaction(func(tx *gorm.DB) error {
+		err := tx.Select("csv_id", "file_name").Where("csv_id = ? AND is_delete = ?", csvId, false).First(&dbCsv).Error
+		if err != nil {
+			return err
+		}
+
+		result := tx.Model(&Csv{}).Where("csv_id = ?", csvId).Updates(map[string]interface{}{
+			"json_file":          fileJsonContent,
+			"profile_file":       fileProfileContent,
+			"data_size":          gorm.Expr("data_size + ?", len(filePatchContent)),
+			"data_columns":       dataColumns,
+			"data_rows":          dataRows,
+			"last_accessed_date": time.Now(),
+		})
+		if result.Error != nil {
+			return result.Error
+		}
+
+		if err := tx.Create(&patch).Error; err != nil {
+			return err
+		}
+		return tx.Model(&CsvPatch{}).Where("csv_id = ?", csvId).Count(&patchCount).Error
+	})
+	if updateErr != nil {
+		c.JSON(http.StatusBadRequest, gin.H{
+			"StatusMessage": "Failed",
+			"message":       "csvファイルを更新できませんでした",
+			"error":         updateErr.Error(),
 		})
 		return
 	}
@@ -335,6 +575,8 @@ func UpdateCSV(c *gin.Context, db *gorm.DB) {
 	c.JSON(http.StatusOK, gin.H{
 		"StatusMessage": "Success",
 		"file_name":     dbCsv.FileName,
+		"patch_id":      patch.PatchID,
+		"patch_count":   patchCount,
 	})
 }
 
@@ -453,6 +695,17 @@ func Delete(c *gin.Context, db *gorm.DB) {
 		return
 	}
 
+	// 列ごとの更新差分を削除
+	patchResult := db.Where("csv_id = ?", front.CsvID).Delete(&CsvPatch{})
+	if patchResult.Error != nil {
+		c.JSON(http.StatusInternalServerError, gin.H{
+			"StatusMessage": "Failed",
+			"message":       "CSVファイルを削除できませんでした",
+			"error":         patchResult.Error.Error(),
+		})
+		return
+	}
+
 	// Chatsテーブルのレコードを全て削除
 	deleteResult := db.Where("csv_id = ?", front.CsvID).Delete(&Csv{})
 	if deleteResult.Error != nil {
@@ -165,6 +165,11 @@ func main() {
 		csvs.GetCsv(c, db)
 	})
 
+	// CSV ファイルのプロファイルを取得するAPI
+	r.GET("/get_profile/:csv_id", func(c *gin.Context) {
+		csvs.GetProfile(c, db)
+	})
+
 	// CSV ファイルをダウンロードするAPI
 	r.GET("/download_csv/:csv_id", func(c *gin.Context) {
 		csvs.DownloadCsv(c, db)
@@ -180,6 +185,16 @@ func main() {
 		csvs.UpdateCSV(c, db)
 	})
 
+	// CSVファイルの一部の列のみを更新するAPI
+	r.POST("/csvs/update/column", func(c *gin.Context) {
+		csvs.UpdateColumn(c, db)
+	})
+
+	// CSVファイルのプロファイルを更新するAPI
+	r.POST("/csvs/update/profile", func(c *gin.Context) {
+		csvs.UpdateProfile(c, db)
+	})
+
 	// CSVファイルを削除するAPI
 	r.POST("/csvs/delete", func(c *gin.Context) {
 		csvs.DeleteCSV(c, db)
@@ -211,6 +226,11 @@ func main() {
 		chats.SaveChat(c, db)
 	})
 
+	// chatをまとめて保存するAPI
+	r.POST("/chats/save/chats", func(c *gin.Context) {
+		chats.SaveChatBatch(c, db)
+	})
+
 	// chatを取得するAPI
 	r.POST("/chats/get/chat", func(c *gin.Context) {
 		chats.GetChats(c, db)